@@ -1,5 +1,6 @@
 # src/__main__.py
 from __future__ import annotations
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -14,6 +15,8 @@ from src.full_pipline_gui import main  # 例：既存のエントリ関数
 from src.common.imports_check import check_all
 
 if __name__ == "__main__":
+    # 点群の並列読み込み（プロセスプール）を exe 化した環境でも動かすため
+    multiprocessing.freeze_support()
     print("src.__main__.pyを実行します")
     check_all()
     main()
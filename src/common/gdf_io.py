@@ -0,0 +1,27 @@
+# src/common/gdf_io.py
+"""
+パス（.shp など）と GeoDataFrame のどちらでも受け取れるようにするための補助関数
+"""
+import os
+
+import geopandas as gpd
+
+
+def read_gdf(src):
+    """
+    src がパスなら読み込み、GeoDataFrame ならそのまま返す
+
+    Args:
+        src: ファイルパス（str / PathLike）または GeoDataFrame
+
+    Returns:
+        geopandas.GeoDataFrame
+    """
+    if isinstance(src, gpd.GeoDataFrame):
+        return src
+    return gpd.read_file(src)
+
+
+def is_path(src):
+    """src がファイルパス（str / PathLike）か"""
+    return isinstance(src, (str, os.PathLike))
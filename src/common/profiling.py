@@ -0,0 +1,293 @@
+# src/common/profiling.py
+"""
+処理の段階（stage）ごとの時間・メモリ・I/O の計測
+
+    with Profiler().activate() as profiler:
+        with stage("elevation") as s:
+            ...
+            s.count(points=n)
+        profiler.write(out_dir)     # run_report.json と trace.json（Chrome のトレース形式）
+
+段階ごとに記録する値:
+    - wall_s: 経過時間、cpu_s: このプロセスの CPU 時間（全スレッド）
+    - child_cpu_s: 終了した子プロセス（qgis_process など）の CPU 時間（POSIX のみ）
+    - peak_rss_mb: 段階中のメモリ使用量（RSS）の最大値。Linux では段階ごとに計測し、
+      それ以外では開始からの最大値（psutil があればそれを使う）
+    - read_bytes / write_bytes: このプロセスがストレージから読み込んだ・書き込んだバイト数
+      （Linux の /proc/self/io の read_bytes / write_bytes、それ以外は psutil がある場合のみ）。
+      パイプや端末への入出力は含まず、ページキャッシュから読んだ分も含まない。
+      書き込みはページキャッシュに載った時点で数える（Windows の psutil はすべての I/O 操作の合計）
+    - counts: 段階で処理した行数・セル数など（s.count(...) で指定）
+
+activate() している間だけ stage() が記録され、していない場合は何もしない。
+そのため各モジュールは引数を増やさずに stage() で囲むだけでよい。
+"""
+import json
+import numbers
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPORT_JSON = "run_report.json"
+TRACE_JSON = "trace.json"
+_MB = 1024 * 1024
+
+_active = None
+
+
+# ── プロセスの計測値 ─────────────────────────────────────────
+def _read_proc(path):
+    try:
+        with open(path, encoding="ascii") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _io_bytes():
+    """(ストレージの読み込みバイト数, 書き込みバイト数)。取れない場合は (None, None)"""
+    text = _read_proc("/proc/self/io")
+    if text:
+        # rchar / wchar はパイプ・端末への read / write も数えるため使わない
+        values = dict(line.split(":", 1) for line in text.splitlines() if ":" in line)
+        return int(values["read_bytes"]), int(values["write_bytes"])
+    if psutil is not None:
+        try:
+            io = psutil.Process().io_counters()
+            return io.read_bytes, io.write_bytes
+        except Exception:
+            pass
+    return None, None
+
+
+def _child_cpu():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class _PeakRss:
+    """メモリ使用量の最大値。Linux では /proc/self/clear_refs で区間ごとに計測する"""
+
+    def __init__(self):
+        self.per_stage = _read_proc("/proc/self/status") is not None and os.access("/proc/self/clear_refs", os.W_OK)
+
+    def read(self):
+        """これまで（per_stage の場合は前回の reset から）の最大値 [バイト]"""
+        if self.per_stage:
+            for line in (_read_proc("/proc/self/status") or "").splitlines():
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+        if psutil is not None:
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", None) or info.rss
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux は KB、macOS はバイト
+            return peak if os.uname().sysname == "Darwin" else peak * 1024
+        return None
+
+    def reset(self):
+        if not self.per_stage:
+            return
+        try:
+            with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+                f.write("5")
+        except OSError:
+            self.per_stage = False
+
+
+# ── 段階 ────────────────────────────────────────────────────
+class Span:
+    """1つの段階の計測結果"""
+
+    def __init__(self, name, parent, counts):
+        self.name = name
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.tid = threading.get_ident()
+        self.counts = dict(counts)
+        self.peak = None
+        self.error = None
+
+    def count(self, **counts):
+        """処理した行数・セル数などを記録する（同じ名前は上書き）"""
+        for key, value in counts.items():
+            self.counts[key] = int(value) if isinstance(value, numbers.Integral) else value
+
+    def _update_peak(self, value):
+        if value is not None:
+            self.peak = value if self.peak is None else max(self.peak, value)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "depth": self.depth,
+            "start_s": round(self.start, 6),
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "child_cpu_s": None if self.child_cpu is None else round(self.child_cpu, 6),
+            "peak_rss_mb": None if self.peak is None else round(self.peak / _MB, 1),
+            "read_bytes": self.read_bytes,
+            "write_bytes": self.write_bytes,
+            "counts": self.counts,
+            "error": self.error,
+        }
+
+
+class _NullSpan:
+    """計測していないときの stage() の値"""
+
+    def count(self, **counts):
+        pass
+
+
+class Profiler:
+    """段階ごとの計測結果を集め、JSON のレポートと Chrome のトレースとして書き出す"""
+
+    def __init__(self):
+        self.spans = []
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._t0 = time.perf_counter()
+        self._local = threading.local()
+        self._open = []
+        self._lock = threading.Lock()
+        self._peak = _PeakRss()
+
+    def __repr__(self):
+        return f"Profiler(spans={len(self.spans)})"
+
+    @contextmanager
+    def activate(self):
+        """この間の stage() をこの Profiler に記録する"""
+        global _active
+        previous, _active = _active, self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _fold_peak(self):
+        """現在の最大値を開いている段階すべてに反映する"""
+        value = self._peak.read()
+        for span in self._open:
+            span._update_peak(value)
+
+    @contextmanager
+    def stage(self, name, **counts):
+        stack = self._stack()
+        span = Span(name, stack[-1] if stack else None, counts)
+        with self._lock:
+            # 区間の最大値を取り直す前に、外側の段階へこれまでの最大値を反映する
+            self._fold_peak()
+            self._peak.reset()
+            self._open.append(span)
+        stack.append(span)
+        read0, write0 = _io_bytes()
+        child0 = _child_cpu()
+        cpu0 = time.process_time()
+        span.start = time.perf_counter() - self._t0
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.wall = time.perf_counter() - self._t0 - span.start
+            span.cpu = time.process_time() - cpu0
+            child1 = _child_cpu()
+            span.child_cpu = None if child0 is None else child1 - child0
+            read1, write1 = _io_bytes()
+            span.read_bytes = None if read0 is None else read1 - read0
+            span.write_bytes = None if write0 is None else write1 - write0
+            stack.pop()
+            with self._lock:
+                self._fold_peak()
+                self._open.remove(span)
+                self.spans.append(span)
+
+    # ── 出力 ────────────────────────────────────────────────
+    def report(self):
+        """計測結果（開始順）の辞書"""
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "started": self.started,
+            "wall_s": round(time.perf_counter() - self._t0, 6),
+            "peak_rss_scope": "stage" if self._peak.per_stage else "process",
+            "stages": [s.to_dict() for s in spans],
+        }
+
+    def trace(self):
+        """Chrome のトレース形式（chrome://tracing / Perfetto で開ける）"""
+        pid = os.getpid()
+        events = []
+        for s in sorted(self.spans, key=lambda s: s.start):
+            args = {k: v for k, v in s.to_dict().items() if k not in ("name", "parent", "depth", "start_s", "wall_s")}
+            events.append({
+                "name": s.name, "cat": "stage", "ph": "X", "pid": pid, "tid": s.tid,
+                "ts": round(s.start * 1e6, 3), "dur": round(s.wall * 1e6, 3), "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, out_dir):
+        """
+        out_dir に run_report.json と trace.json を書き出す
+
+        Returns:
+            tuple: (レポートのパス, トレースのパス)
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        report_path = os.path.join(str(out_dir), REPORT_JSON)
+        trace_path = os.path.join(str(out_dir), TRACE_JSON)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f, ensure_ascii=False)
+        return report_path, trace_path
+
+    def summary(self, max_depth=1):
+        """段階ごとの時間の一覧（GUI・ログ表示用の文字列）"""
+        lines = []
+        for s in sorted(self.spans, key=lambda s: s.start):
+            if s.depth > max_depth:
+                continue
+            peak = "" if s.peak is None else f"  {s.peak / _MB:,.0f} MB"
+            counts = "  " + ", ".join(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}" for k, v in s.counts.items()) \
+                if s.counts else ""
+            lines.append(f"{'  ' * s.depth}{s.name}: {s.wall:.2f} s (CPU {s.cpu:.2f} s){peak}{counts}")
+        return "\n".join(lines)
+
+
+def stage(name, **counts):
+    """
+    activate() 中の Profiler に段階を記録するコンテキストマネージャ（計測していなければ何もしない）
+
+    with stage("write_shp", rows=len(gdf)) as s:
+        ...
+    """
+    if _active is None:
+        return _null_stage()
+    return _active.stage(name, **counts)
+
+
+@contextmanager
+def _null_stage():
+    yield _NullSpan()
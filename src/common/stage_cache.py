@@ -0,0 +1,468 @@
+# src/common/stage_cache.py
+"""
+パイプラインの段階（stage）ごとの結果を保存・再利用するキャッシュ
+
+各段階のキーは「入力ファイルの内容のハッシュ・パラメータ・上流の段階のキー」から作る。
+同じキーの結果があれば段階を実行せずに読み込むため、下流のパラメータ（MINSLOPE など）だけを
+変えた再実行では、変わった段階より下流だけが実行される。
+
+    - 結果がメモリ上のオブジェクトの段階（標準メッシュ抽出・メッシュ生成・標高付与）は、
+      配列の辞書（標高付与）は arrays.npz、GeoDataFrame（標準メッシュ抽出）は列とジオメトリの座標を
+      配列にした frame.npz / frame.json、それ以外（GridMesh など）は pickle で保存する
+    - 結果がファイルの段階（ASC・窪地処理・流向・ラスタ変換）は出力ファイルを
+      付随ファイル（.prj / .sgrd など）ごと複製して保存し、読み込み時に出力先へ複製し直す
+    - 入力ファイルのハッシュは (パス, サイズ, 更新時刻) ごとにマニフェストへ記録し、変わらなければ再計算しない
+    - 結果はキーごとに別のディレクトリに保存するため、パラメータを戻した場合も再利用できる
+    - 結果を保存するたびに、最後に使ってから max_age_days 日を過ぎたエントリと、合計が max_bytes を
+      超えた分の最後に使った日時の古いエントリを削除する（この実行で使ったエントリは残す）。
+      マニフェストに無いエントリ（以前のバージョンのキャッシュなど）も削除する
+
+構成:
+    <root>/manifest.json             段階ごとのエントリ（パラメータ・作成/使用日時・ファイル）と入力のハッシュ
+    <root>/<段階>/<キー>/arrays.npz   配列の辞書の段階
+    <root>/<段階>/<キー>/frame.npz    GeoDataFrame の段階（frame.json に列名・座標系など）
+    <root>/<段階>/<キー>/object.pkl   その他のオブジェクトの段階
+    <root>/<段階>/<キー>/<ファイル>    ファイルの段階
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+# 2: 標高付与の段階の結果を GeoDataFrame から配列に変更
+# 3: オブジェクトの段階を配列（.npz）で保存、エントリの大きさを記録
+CACHE_VERSION = 3
+MANIFEST = "manifest.json"
+ARRAYS_FILE = "arrays.npz"
+FRAME_FILE = "frame.npz"
+FRAME_META = "frame.json"
+OBJECT_FILE = "object.pkl"
+# 既定の上限（StageCache の max_bytes / max_age_days）
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE_DAYS = 30
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+_HASH_BLOCK = 8 * 1024 * 1024
+# シェープファイルは付随ファイルも内容に含める
+_SHP_SIDECARS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+# ラスタの出力と一緒に保存する付随ファイル（.prj と SAGA グリッドのヘッダなど）
+_RASTER_SIDECARS = (".prj", ".sgrd", ".mgrd")
+
+
+def _now():
+    return time.strftime(_TIME_FORMAT)
+
+
+def _age_days(stamp):
+    try:
+        return (time.time() - time.mktime(time.strptime(stamp, _TIME_FORMAT))) / 86400
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def _dir_bytes(path):
+    total = 0
+    for base, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(base, name))
+            except OSError:
+                pass
+    return total
+
+
+def _sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _with_sidecars(path):
+    """出力ファイルと、存在する付随ファイルのパス"""
+    stem = os.path.splitext(path)[0]
+    candidates = [path] + [stem + e for e in _RASTER_SIDECARS] + [path + ".aux.xml"]
+    return [p for p in candidates if os.path.exists(p)]
+
+
+def _expand(path):
+    """ハッシュに含めるファイル（.shp は付随ファイルも）"""
+    base, ext = os.path.splitext(str(path))
+    if ext.lower() == ".shp":
+        return [base + e for e in _SHP_SIDECARS if os.path.exists(base + e)]
+    return [str(path)]
+
+
+# ── オブジェクトの保存形式 ────────────────────────────────
+def _is_array_dict(value):
+    return (isinstance(value, dict) and bool(value)
+            and all(isinstance(k, str) and isinstance(v, np.ndarray) and v.dtype != object
+                    for k, v in value.items()))
+
+
+def _column_array(series):
+    values = series.to_numpy()
+    if values.dtype == object:
+        # 文字列の列は Unicode の配列にする（それ以外の object 列は配列にしない）
+        if not all(isinstance(v, str) for v in values):
+            return None
+        values = values.astype(str)
+    return values
+
+
+def _frame_arrays(value):
+    """
+    GeoDataFrame を (配列の辞書, メタ情報) にする。配列にできない場合は None
+    （既定のインデックス・数値または文字列の列・shapely.to_ragged_array で扱えるジオメトリのみ）
+    """
+    try:
+        import geopandas as gpd
+        import pandas as pd
+        import shapely
+    except ImportError:
+        return None
+    if not isinstance(value, gpd.GeoDataFrame) or not value.index.equals(pd.RangeIndex(len(value))):
+        return None
+    arrays = {}
+    geometry = value.geometry.name
+    for i, col in enumerate(value.columns):
+        if col == geometry:
+            continue
+        values = _column_array(value[col])
+        if values is None:
+            return None
+        arrays[f"column_{i}"] = values
+    try:
+        geom_type, coords, offsets = shapely.to_ragged_array(value.geometry.values)
+    except Exception:
+        return None
+    arrays["coords"] = coords
+    # Polygon と MultiPolygon が混在すると全て Multi* になるため、単一の形状だった行を記録する
+    arrays["single"] = shapely.get_type_id(value.geometry.values) != int(geom_type)
+    for i, off in enumerate(offsets):
+        arrays[f"offsets_{i}"] = off
+    meta = {
+        "columns": [str(c) for c in value.columns],
+        "geometry": str(geometry),
+        "geometry_type": int(geom_type),
+        "n_offsets": len(offsets),
+        "crs": value.crs.to_wkt() if value.crs is not None else None,
+    }
+    return arrays, meta
+
+
+def _frame_from_arrays(arrays, meta):
+    import geopandas as gpd
+    import shapely
+    offsets = tuple(arrays[f"offsets_{i}"] for i in range(meta["n_offsets"]))
+    geoms = shapely.from_ragged_array(shapely.GeometryType(meta["geometry_type"]), arrays["coords"], offsets)
+    single = arrays["single"]
+    if single.any():
+        geoms[single] = shapely.get_geometry(geoms[single], 0)
+    data = {}
+    for i, col in enumerate(meta["columns"]):
+        data[col] = geoms if col == meta["geometry"] else arrays[f"column_{i}"]
+    return gpd.GeoDataFrame(data, geometry=meta["geometry"], crs=meta["crs"])
+
+
+def _dump(value, dir_path):
+    """value を dir_path に保存し、保存したファイル名のリストを返す"""
+    if _is_array_dict(value):
+        np.savez(os.path.join(dir_path, ARRAYS_FILE), **value)
+        return [ARRAYS_FILE]
+    frame = _frame_arrays(value)
+    if frame is not None:
+        arrays, meta = frame
+        np.savez(os.path.join(dir_path, FRAME_FILE), **arrays)
+        with open(os.path.join(dir_path, FRAME_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return [FRAME_FILE, FRAME_META]
+    with open(os.path.join(dir_path, OBJECT_FILE), "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return [OBJECT_FILE]
+
+
+def _load(dir_path, files):
+    if ARRAYS_FILE in files:
+        with np.load(os.path.join(dir_path, ARRAYS_FILE), allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+    if FRAME_FILE in files:
+        with open(os.path.join(dir_path, FRAME_META), encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(os.path.join(dir_path, FRAME_FILE), allow_pickle=False) as data:
+            return _frame_from_arrays({name: data[name] for name in data.files}, meta)
+    with open(os.path.join(dir_path, OBJECT_FILE), "rb") as f:
+        return pickle.load(f)
+
+
+class StageCache:
+    """
+    段階ごとの結果のキャッシュ
+
+    Args:
+        root: キャッシュを保存するディレクトリ（例: <出力フォルダ>/.cache/stages）
+        max_bytes: 保存する結果の合計の上限（バイト）。None の場合は制限しない
+        max_age_days: 最後に使ってからこの日数を過ぎた結果を削除する。None の場合は削除しない
+
+    keys には、この実行で各段階に使ったキーが入る（upstream で段階名を指定するとそのキーを使う）。
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.keys = {}
+        self.hits = []
+        self._manifest = self._read_manifest()
+
+    def __repr__(self):
+        return f"StageCache({self.root!r})"
+
+    # ── マニフェスト ──────────────────────────────────────
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == CACHE_VERSION:
+                return manifest
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARNING] 段階キャッシュのマニフェストを読み込めません: {self.manifest_path} - {e}")
+        return {"version": CACHE_VERSION, "stages": {}, "digests": {}}
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    # ── キー ────────────────────────────────────────────
+    def file_digest(self, path):
+        """ファイル内容の SHA-1（.shp は付随ファイルを含む）。変わっていなければ記録済みの値を使う"""
+        digests = self._manifest["digests"]
+        h = hashlib.sha1()
+        for p in _expand(path):
+            st = os.stat(p)
+            ap = os.path.abspath(p)
+            rec = digests.get(ap)
+            if not rec or rec["size"] != st.st_size or rec["mtime_ns"] != st.st_mtime_ns:
+                rec = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": _sha1_file(p)}
+                digests[ap] = rec
+            h.update(os.path.splitext(p)[1].lower().encode("utf-8"))
+            h.update(rec["sha1"].encode("ascii"))
+        return h.hexdigest()
+
+    def _input_digest(self, value):
+        if value is None:
+            return None
+        if isinstance(value, (str, os.PathLike)):
+            return self.file_digest(value)
+        if isinstance(value, (list, tuple)):
+            return [self._input_digest(v) for v in value]
+        # GeoDataFrame などはそのまま pickle した内容で識別する
+        return hashlib.sha1(pickle.dumps(value)).hexdigest()
+
+    def key(self, stage, params=None, files=(), upstream=()):
+        """
+        段階のキーを作り、keys[stage] に記録して返す
+
+        Args:
+            stage: 段階名
+            params: 結果に影響するパラメータ（JSON にできる値）
+            files: 入力ファイル（パス・パスのリスト、または GeoDataFrame など）
+            upstream: 上流の段階名（この実行で記録したキーを使う）
+        """
+        payload = {
+            "version": CACHE_VERSION,
+            "stage": stage,
+            "params": params or {},
+            "files": [self._input_digest(f) for f in files],
+            "upstream": {name: self.keys[name] for name in upstream},
+        }
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        self.keys[stage] = digest
+        return digest
+
+    # ── エントリ ────────────────────────────────────────
+    def entry_dir(self, stage, key):
+        return os.path.join(self.root, stage, key)
+
+    def _entry(self, stage, key):
+        entry = self._manifest["stages"].get(stage, {}).get(key)
+        if entry is None or not os.path.isdir(self.entry_dir(stage, key)):
+            return None
+        return entry
+
+    def _touch(self, stage, key):
+        self._manifest["stages"][stage][key]["last_used"] = _now()
+        self.hits.append(stage)
+        self._save_manifest()
+
+    def _commit(self, stage, key, tmp_dir, params, files):
+        final = self.entry_dir(stage, key)
+        if os.path.isdir(final):
+            shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp_dir, final)
+        now = _now()
+        self._manifest["stages"].setdefault(stage, {})[key] = {
+            "params": params or {},
+            "files": files,
+            "bytes": _dir_bytes(final),
+            "created": now,
+            "last_used": now,
+        }
+        self.prune(save=False)
+        self._save_manifest()
+
+    # ── 削除 ────────────────────────────────────────────
+    def _remove(self, stage, key):
+        shutil.rmtree(self.entry_dir(stage, key), ignore_errors=True)
+        self._manifest["stages"].get(stage, {}).pop(key, None)
+
+    def prune(self, save=True):
+        """
+        古いエントリ（max_age_days）と上限（max_bytes）を超えた分のエントリを削除する
+
+        Returns:
+            int: 削除したエントリの数
+        """
+        stages = self._manifest["stages"]
+        in_use = {(stage, key) for stage, key in self.keys.items()}
+        removed = 0
+
+        # マニフェストに無いエントリ（以前のバージョン・書き込み途中で止まった実行）
+        if os.path.isdir(self.root):
+            for stage in os.listdir(self.root):
+                stage_dir = os.path.join(self.root, stage)
+                if not os.path.isdir(stage_dir):
+                    continue
+                for key in os.listdir(stage_dir):
+                    if not key.startswith(".") and key not in stages.get(stage, {}):
+                        shutil.rmtree(os.path.join(stage_dir, key), ignore_errors=True)
+                        removed += 1
+
+        entries = sorted(
+            ((entry.get("last_used", ""), stage, key) for stage, by_key in stages.items() for key, entry in by_key.items()),
+        )
+        if self.max_age_days is not None:
+            for last_used, stage, key in list(entries):
+                if (stage, key) not in in_use and _age_days(last_used) > self.max_age_days:
+                    self._remove(stage, key)
+                    entries.remove((last_used, stage, key))
+                    removed += 1
+        if self.max_bytes is not None:
+            total = sum(stages[stage][key].get("bytes", 0) for _, stage, key in entries)
+            for last_used, stage, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if (stage, key) in in_use:
+                    continue
+                total -= stages[stage][key].get("bytes", 0)
+                self._remove(stage, key)
+                removed += 1
+
+        # 存在しなくなった入力ファイルのハッシュの記録
+        digests = self._manifest["digests"]
+        for path in [p for p in digests if not os.path.exists(p)]:
+            del digests[path]
+        if removed:
+            print(f"[INFO] 段階キャッシュの古いエントリを削除しました: {removed}")
+        if save:
+            self._save_manifest()
+        return removed
+
+    def _tmp_dir(self, stage):
+        tmp = os.path.join(self.root, stage, f".{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp)
+        return tmp
+
+    def run(self, stage, compute, params=None, files=(), upstream=()):
+        """
+        結果がオブジェクトの段階を実行する（キャッシュがあれば読み込む）
+
+        Args:
+            compute: 引数なしで結果を返す関数
+        """
+        key = self.key(stage, params, files, upstream)
+        entry = self._entry(stage, key)
+        if entry is not None:
+            try:
+                value = _load(self.entry_dir(stage, key), entry["files"])
+                print(f"[INFO] 段階キャッシュを使用します: {stage} ({key[:12]})")
+                self._touch(stage, key)
+                return value
+            except Exception as e:
+                print(f"[WARNING] 段階キャッシュを読み込めません: {stage} ({key[:12]}) - {e}")
+
+        value = compute()
+        tmp = self._tmp_dir(stage)
+        try:
+            self._commit(stage, key, tmp, params, _dump(value, tmp))
+        except Exception as e:
+            print(f"[WARNING] 段階キャッシュを書き込めません: {stage} - {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+        return value
+
+    def run_files(self, stage, compute, out_dir, names, params=None, files=(), upstream=()):
+        """
+        結果がファイルの段階を実行する（キャッシュがあれば out_dir へ複製する）
+
+        Args:
+            compute: 引数なしで out_dir に names のファイルを書き出す関数
+            out_dir: 出力先のディレクトリ
+            names: 出力ファイル名。付随ファイル（.prj / .sgrd など）も一緒に扱う
+
+        Returns:
+            list[str]: out_dir 内の出力ファイルのパス（names の順）
+        """
+        key = self.key(stage, params, files, upstream)
+        outputs = [os.path.join(str(out_dir), n) for n in names]
+        entry = self._entry(stage, key)
+        if entry is not None:
+            os.makedirs(str(out_dir), exist_ok=True)
+            src_dir = self.entry_dir(stage, key)
+            for name in entry["files"]:
+                shutil.copy2(os.path.join(src_dir, name), os.path.join(str(out_dir), name))
+            print(f"[INFO] 段階キャッシュを使用します: {stage} ({key[:12]})")
+            self._touch(stage, key)
+            return outputs
+
+        compute()
+        tmp = self._tmp_dir(stage)
+        try:
+            stored = []
+            for out in outputs:
+                for p in _with_sidecars(out):
+                    shutil.copy2(p, os.path.join(tmp, os.path.basename(p)))
+                    stored.append(os.path.basename(p))
+            self._commit(stage, key, tmp, params, stored)
+        except Exception as e:
+            print(f"[WARNING] 段階キャッシュを書き込めません: {stage} - {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+        return outputs
+
+
+def run_stage(cache, stage, compute, **kwargs):
+    """cache が None なら compute() をそのまま実行し、あれば cache.run に渡す"""
+    if cache is None:
+        return compute()
+    return cache.run(stage, compute, **kwargs)
+
+
+def run_file_stage(cache, stage, compute, out_dir, names, **kwargs):
+    """cache が None なら compute() をそのまま実行し、あれば cache.run_files に渡す"""
+    if cache is None:
+        compute()
+        return [os.path.join(str(out_dir), n) for n in names]
+    return cache.run_files(stage, compute, out_dir, names, **kwargs)
@@ -15,6 +15,8 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 
 from src.make_shp.zcol_list import get_zcol_list
+from src.make_shp.add_elevation import DEFAULT_CHUNKSIZE, DEFAULT_WORKERS
+from src.make_shp.cell_stats import STAT_NAMES
 from src.common.help_txt_read import load_help_text
 from src.run_full_pipeline import run_full_pipeline
 
@@ -178,6 +180,23 @@ class FullPipelineApp(ttk.Frame):
         self.threshold_var = tk.IntVar(value=5)
         ttk.Entry(form, textvariable=self.threshold_var, width=20).grid(row=9, column=1, sticky="w", **paddings)
 
+        # 標高の統計量（最小・最大・標準偏差）の ASC を追加で出力
+        # 中央値などのパーセンタイルはセルごとにすべての点の標高を保持し、点の数に比例したメモリを使うため、
+        # GUI では求めない（CLI の --percentiles で指定する）
+        self.elev_stats_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(form, text="標高の統計量 (最小・最大・標準偏差) も出力 ※中央値は点の数に比例したメモリを使うため CLI の --percentiles で指定",
+                        variable=self.elev_stats_var).grid(row=11, column=1, sticky="w", **paddings)
+
+        # 段階キャッシュ（MINSLOPE / THRESHOLD だけを変えた再実行で上流の段階を再利用する）
+        self.stage_cache_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(form, text="途中結果をキャッシュして再実行を速くする (<出力先>/.cache にディスクを使用)",
+                        variable=self.stage_cache_var).grid(row=12, column=1, sticky="w", **paddings)
+
+        # 段階ごとの計測
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(form, text="段階ごとの処理時間を計測 (<出力先>/profile にレポートを保存)",
+                        variable=self.profile_var).grid(row=13, column=1, sticky="w", **paddings)
+
         # 出力フォルダ
         ttk.Label(form, text="出力フォルダ", width=lbl_w, anchor="e").grid(row=10, column=0, **paddings)
         default_output = str(OUTPUT_DIR)
@@ -187,11 +206,11 @@ class FullPipelineApp(ttk.Frame):
 
         # ステータスバー
         self.status_var = tk.StringVar()
-        ttk.Label(form, textvariable=self.status_var).grid(row=11, column=1, **paddings2)
+        ttk.Label(form, textvariable=self.status_var).grid(row=14, column=1, **paddings2)
 
         # 実行ボタン（参照できるようにインスタンス化しておく） <-- 変更点: self.run_button を保持
         self.run_button = ttk.Button(form, text="実行", command=self._run, style="Accent.TButton")
-        self.run_button.grid(row=11, column=2, **paddings2)
+        self.run_button.grid(row=14, column=2, **paddings2)
 
     def _browse_domain(self) -> None:
         """計算領域ファイルを選択"""
@@ -306,6 +325,15 @@ class FullPipelineApp(ttk.Frame):
                 output_dir=self.outdir_var.get(),
                 zcol=selected_zcol,
                 nodata=nodata,
+                chunksize=DEFAULT_CHUNKSIZE,
+                workers=DEFAULT_WORKERS,
+                stats=STAT_NAMES if self.elev_stats_var.get() else None,
+                # 同じ点群での再実行を速くするため、解析結果を出力フォルダ内にキャッシュする
+                point_cache_dir=str(Path(self.outdir_var.get()) / ".cache" / "points"),
+                # MINSLOPE / THRESHOLD だけを変えた再実行では、上流の段階の結果を再利用する
+                stage_cache=self.stage_cache_var.get(),
+                # どの段階に時間がかかったかを完了時に表示する（<出力先>/profile にレポートも保存）
+                profile=self.profile_var.get(),
                 min_slope=min_slope,
                 threshold=threshold,
                 qgis_version=qgis_version,
@@ -334,7 +362,11 @@ class FullPipelineApp(ttk.Frame):
 
             # 表示
             if success:
-                self.queue.put(("info", "処理が完了しました。"))
+                msg = "処理が完了しました。"
+                profile = result.get("profile") if isinstance(result, dict) else None
+                if profile:
+                    msg += f"\n\n【段階ごとの時間】\n{profile['summary']}\n\n計測レポート: {profile['report']}"
+                self.queue.put(("info", msg))
             else:
                 self.queue.put(("error", error_msg or "処理に失敗しました。"))
             # ------------------------------
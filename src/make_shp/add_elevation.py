@@ -3,23 +3,69 @@
 """
 流域メッシュに平均標高を算出して付与し、
 計算領域メッシュへ転記 (流域外は NoData)
+
+generate_mesh の GridMesh に対しては mesh_elevation でセル番号の直接計算により集計し、
+結果はセルの通しID順の配列で返す（ポリゴンは作らない）。
+シェープファイルのメッシュに対しては add_elevation_to_mesh で GeoDataFrame に付与する。
 """
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
+from pyproj import CRS
+
+from src.common.gdf_io import is_path
+from src.common.profiling import stage
+from src.make_shp.cell_stats import CellAccumulator, STAT_NAMES
+from src.make_shp.csv_schema import CsvSchema, sniff_csv
+from src.make_shp.point_cache import PointCache
+from src.make_shp.regular_grid import CELL_ID_COLUMN, GridMesh
 
 DEFAULT_NODATA = -9999
+# 逐次読み込み時の既定の行数（GUI から使用）
+DEFAULT_CHUNKSIZE = 1_000_000
+# 点群ファイルを並列に読み込む既定のプロセス数（GUI から使用）
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 4)
+
+
+def stat_column(name):
+    """統計量の列名（例: 'min' -> 'elev_min', 'p50' -> 'elev_p50'）。シェープの列名は10文字まで"""
+    return f"elev_{name}"[:10]
+
+
+def stat_columns(names):
+    """
+    統計量の名前 → 列名 の辞書（stat_column）
+
+    10文字に切り詰めて同じ列名になる統計量（例: p12.5 と p12.55）があれば ValueError を投げる
+    （一方の ASC が他方の列から書き出されるのを防ぐ）。
+    """
+    columns = {}
+    for name in names:
+        col = stat_column(name)
+        other = next((n for n, c in columns.items() if c == col), None)
+        if other is not None:
+            raise ValueError(f"統計量 {other} と {name} の列名が同じ '{col}' になります"
+                             f"（シェープの列名は10文字まで）。パーセンタイルの指定を変えてください")
+        columns[name] = col
+    return columns
+
+def _sample_frame(df):
+    """CsvSchema が渡された場合はそのサンプルの DataFrame を返す"""
+    return df.sample if isinstance(df, CsvSchema) else df
+
 
 def get_xy_columns(df):
     """
-    DataFrame df から X 列と Y 列を検出して返す。
+    DataFrame df（または sniff_csv の CsvSchema）から X 列と Y 列を検出して返す。
     - X 候補: 'x', 'lon', 'longitude'
     - Y 候補: 'y', 'lat', 'latitude'
     見つからなければ ValueError を投げる。
     """
-    cols = df.columns.tolist()
+    cols = _sample_frame(df).columns.tolist()
     # 小文字マッピング
     lower_map = {c.lower(): c for c in cols}
 
@@ -44,9 +90,11 @@ def get_xy_columns(df):
 
 def get_z_candidates(df, x_col, y_col):
     """
-    DataFrame df の中から、X 列と Y 列を除いた残りの列名リストを返す。
+    DataFrame df（または sniff_csv の CsvSchema）の中から、X 列と Y 列を除いた残りの列名リストを返す。
     数値型の列を優先し、なければそれ以外の列も候補に含める。
+    CsvSchema の場合、数値型かどうかはサンプル行から判定する。
     """
+    df = _sample_frame(df)
     # まず数値型の列を取得し、X,Y を除外
     num_cols = [
         c for c in df.select_dtypes(include='number').columns
@@ -61,144 +109,412 @@ def get_z_candidates(df, x_col, y_col):
 
 
 
-def load_points(paths, target_crs, zcol_arg=None):
+def _resolve_z_column(path, z_cands, zcol_arg=None):
+    """標高値列を決定する。指定が無ければ候補が1つの場合のみ自動選択"""
+    if zcol_arg:
+        if zcol_arg in z_cands:
+            return zcol_arg
+        raise ValueError(
+            f"ファイル '{path}' に指定された標高値列 '{zcol_arg}' が見つかりません。\n"
+            f"利用可能な列: {z_cands}"
+        )
+    if len(z_cands) == 1:
+        return z_cands[0]
+    raise ValueError(
+        f"ファイル '{path}' で標高値列を特定できません。複数の候補があります。\n"
+        f"候補: {z_cands}\n"
+        "標高値列を明示的に指定するには --zcol オプションを使用してください。"
+    )
+
+
+def _parse_point_chunks(path, target_crs, zcol_arg=None, chunksize=None):
     """
-    複数の点群ファイル (CSV または SHP) を読み込み、
-    target_crs に変換して結合した GeoDataFrame を返します。
-    
+    単一の点群ファイルを解析し、(x, y, z, 列名) をチャンクごとに返すジェネレータ。
+    CSV は chunksize 行ずつ読み込む（None の場合はファイル全体を1チャンクとする）。
+    SHP は全体を読み込み target_crs に変換して1チャンクとして返す。
+    """
+    if path.lower().endswith(".shp"):
+        gdf = gpd.read_file(path).to_crs(target_crs)
+        if 'elevation' not in gdf.columns:
+            raise ValueError(f"SHPファイル '{path}' に 'elevation' 列が存在しません")
+        yield (gdf.geometry.x.to_numpy(dtype=np.float64),
+               gdf.geometry.y.to_numpy(dtype=np.float64),
+               gdf['elevation'].to_numpy(dtype=np.float64),
+               None)
+        return
+
+    # 列の判定はヘッダと先頭行のサンプルで行い、必要な3列だけを読み込む
+    schema = sniff_csv(path)
+    x_col, y_col = get_xy_columns(schema)
+    z_col = _resolve_z_column(path, get_z_candidates(schema, x_col, y_col), zcol_arg)
+    cols = [x_col, y_col, z_col]
+    read_kw = dict(usecols=cols, encoding=schema.encoding)
+    reader = pd.read_csv(path, chunksize=chunksize, **read_kw) if chunksize else [pd.read_csv(path, **read_kw)]
+    for df in reader:
+        yield tuple(df[c].to_numpy(dtype=np.float64) for c in cols) + (cols,)
+
+
+def iter_point_chunks(path, target_crs, zcol_arg=None, chunksize=None, cache=None):
+    """
+    単一の点群ファイルを読み込み、(x, y, z) の配列をチャンクごとに返すジェネレータ。
+    CSV は chunksize 行ずつ読み込む（None の場合はファイル全体を1チャンクとする）。
+    SHP は全体を読み込み target_crs に変換して1チャンクとして返す。
+
+    cache (PointCache) を指定すると、同じファイル・座標系・標高値列の解析結果を再利用する。
+    キャッシュが無い場合は解析しながら書き込む。
+    """
+    if cache is None:
+        for x, y, z, _ in _parse_point_chunks(path, target_crs, zcol_arg, chunksize):
+            yield x, y, z
+        return
+
+    cached = cache.load(path, target_crs, zcol_arg)
+    if cached is not None:
+        print(f"[INFO] 点群キャッシュを使用します: {path}")
+        x, y, z = cached
+        step = chunksize or max(len(x), 1)
+        for start in range(0, len(x), step):
+            yield x[start:start + step], y[start:start + step], z[start:start + step]
+        return
+
+    writer = cache.writer(path, target_crs, zcol_arg)
+    columns = None
+    try:
+        for x, y, z, columns in _parse_point_chunks(path, target_crs, zcol_arg, chunksize):
+            writer.append(x, y, z)
+            yield x, y, z
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit(columns)
+
+
+class PolygonAssigner:
+    """
+    点を含むセル（ポリゴン）の位置を返す（gpd.sjoin(predicate="within") と同じ判定）。
+    (x, y) を受け取り (点の位置, セルの位置) の組を返す。
+    並列読み込みのワーカーへ渡せるよう、空間インデックスは呼び出し時に作成する。
+    """
+
+    def __init__(self, cells):
+        self.geoms = np.asarray(cells.geometry.values)
+        self._tree = None
+
+    def __getstate__(self):
+        return {"geoms": self.geoms, "_tree": None}
+
+    def __call__(self, x, y):
+        if self._tree is None:
+            self._tree = shapely.STRtree(self.geoms)
+        return self._tree.query(shapely.points(x, y), predicate="within")
+
+
+class GridAssigner:
+    """
+    等間隔グリッド用の割り当て。
+    点のセルを floor((x-minx)/dx) で直接求め、cell_ids[k] のセルを位置 k に対応付ける。
+    (x, y) を受け取り (点の位置, セルの位置) の組を返す。
+    """
+
+    def __init__(self, grid, cell_ids):
+        self.grid = grid
+        self.lut = np.full(grid.size, -1, dtype=np.int64)
+        self.lut[cell_ids] = np.arange(len(cell_ids), dtype=np.int64)
+
+    def __call__(self, x, y):
+        cid = self.grid.locate(x, y)
+        pos = np.where(cid >= 0, self.lut[cid], -1)
+        pt_idx = np.flatnonzero(pos >= 0)
+        return pt_idx, pos[pt_idx]
+
+
+class MeshAssigner:
+    """
+    GridMesh の流域セル用の割り当て（ポリゴンを使わない）。
+    グリッドごとに点のセルを floor((x-minx)/dx) で直接求め、流域セルの位置に対応付ける。
+    グリッドが重なる場合、重なった部分の点はそれぞれのグリッドのセルに数える。
+    (x, y) を受け取り (点の位置, セルの位置) の組を返す。
+    """
+
+    def __init__(self, mesh):
+        self.grids = mesh.grids
+        self.offsets = mesh.offsets
+        self.lut = np.full(mesh.n_cells, -1, dtype=np.int64)
+        self.lut[mesh.basin_ids] = np.arange(len(mesh.basin_ids), dtype=np.int64)
+
+    def __call__(self, x, y):
+        pt_parts, pos_parts = [], []
+        for grid, offset in zip(self.grids, self.offsets):
+            cid = grid.locate(x, y)
+            pos = np.where(cid >= 0, self.lut[cid + offset], -1)
+            pt_idx = np.flatnonzero(pos >= 0)
+            pt_parts.append(pt_idx)
+            pos_parts.append(pos[pt_idx])
+        if len(pt_parts) == 1:
+            return pt_parts[0], pos_parts[0]
+        return np.concatenate(pt_parts), np.concatenate(pos_parts)
+
+
+def _regular_grid_for(mesh, domain, basin):
+    """
+    generate_mesh が作成した単一の等間隔グリッドであれば (grid, 流域セルのグリッド内ID) を返す。
+    該当しない（グリッド定義が無い・複数グリッド・CRS 不一致など）場合は None。
+
+    Args:
+        mesh: GridMesh、または計算領域メッシュのパス（隣のグリッド定義を読む）
+    """
+    if is_path(mesh):
+        mesh = GridMesh.read_sidecar(mesh)
+    if mesh is None or not mesh.is_single_grid or len(domain) != mesh.n_cells:
+        return None
+    if mesh.crs is None or basin.crs is None or CRS.from_user_input(mesh.crs) != basin.crs:
+        return None
+
+    grid = mesh.grid
+    if CELL_ID_COLUMN in basin.columns:
+        # 単一グリッドでは通しIDがそのままグリッド内のIDになる
+        cell_ids = basin[CELL_ID_COLUMN].to_numpy(dtype=np.int64)
+    else:
+        # cell_id 列の無い旧形式: 流域メッシュの各セルがグリッドのどのセルかを中心点から求める
+        centroids = basin.geometry.centroid
+        cell_ids = grid.locate(centroids.x.to_numpy(), centroids.y.to_numpy())
+    if (cell_ids < 0).any() or (cell_ids >= grid.size).any() or len(np.unique(cell_ids)) != len(cell_ids):
+        return None
+    return grid, cell_ids
+
+
+def _has_cell_ids(domain, basin):
+    """両方のメッシュに一意な cell_id 列があるか"""
+    return all(
+        CELL_ID_COLUMN in gdf.columns and gdf[CELL_ID_COLUMN].is_unique
+        for gdf in (domain, basin)
+    )
+
+
+def transfer_to_domain(domain, basin, columns, nodata):
+    """
+    流域メッシュの値を cell_id の照合で計算領域メッシュへ転記する（流域外は nodata、pnt_count は 0）
+
+    Args:
+        domain, basin: cell_id 列を持つ計算領域メッシュ・流域メッシュ
+        columns: 転記する列名のリスト
+
+    Returns:
+        geopandas.GeoDataFrame: 列を追加した計算領域メッシュ
+    """
+    domain = domain.copy()
+    pos = pd.Index(basin[CELL_ID_COLUMN]).get_indexer(domain[CELL_ID_COLUMN])
+    inside = pos >= 0
+    for col in columns:
+        src = basin[col].to_numpy()
+        fill = 0 if col == "pnt_count" else nodata
+        values = np.full(len(domain), fill, dtype=src.dtype)
+        values[inside] = src[pos[inside]]
+        domain[col] = values
+    return domain
+
+
+def _aggregate_file(path, target_crs, assign, n_cells, zcol_arg=None, chunksize=None, cache=None,
+                    stats=(), percentiles=()):
+    """
+    単一ファイルをチャンク単位で読み込み、セルごとに集計する（並列読み込みのワーカーからも呼ばれる）
+
+    Returns:
+        tuple: (CellAccumulator, 点数, 範囲 [minx, miny, maxx, maxy])
+    """
+    acc = CellAccumulator(n_cells, stats, percentiles)
+    n_points = 0
+    bounds = [np.inf, np.inf, -np.inf, -np.inf]
+    for x, y, z in iter_point_chunks(path, target_crs, zcol_arg, chunksize, cache):
+        if x.size == 0:
+            continue
+        pt_idx, cell_idx = assign(x, y)
+        acc.add(cell_idx, z[pt_idx])
+        n_points += x.size
+        bounds = [min(bounds[0], x.min()), min(bounds[1], y.min()),
+                  max(bounds[2], x.max()), max(bounds[3], y.max())]
+    return acc, n_points, bounds
+
+
+def aggregate_points(paths, target_crs, assign, n_cells, zcol_arg=None, chunksize=None, workers=1,
+                     cache=None, stats=(), percentiles=()):
+    """
+    点群ファイルをチャンク単位で読み込み、セルごとの点数・標高合計（と指定された統計量）に畳み込む
+
     Args:
         paths: ファイルパス（文字列または文字列のリスト）
         target_crs: 変換先の座標参照系
+        assign: (x, y) から (点の位置, セルの位置) を返す関数（並列時は pickle 可能であること）
+        n_cells: セル数
         zcol_arg: 標高値列の名前（オプション）
-        
-    Returns:
-        geopandas.GeoDataFrame: 結合された点群データ
-        
-    Raises:
-        ValueError: ファイルの読み込みや列の検証に失敗した場合
-    """
-    def _load_one(path):
-        """単一の点群ファイルを読み込むヘルパー関数"""
-        # 1) SHPファイルの場合
-        if path.lower().endswith(".shp"):
-            gdf = gpd.read_file(path).to_crs(target_crs)
-            # SHPファイルの場合はelevation列の存在を確認
-            if 'elevation' not in gdf.columns:
-                raise ValueError(f"SHPファイル '{path}' に 'elevation' 列が存在しません")
-            return gdf
-
-        # 2) CSVファイルの場合
-        df = pd.read_csv(path)
-        x_col, y_col = get_xy_columns(df)
-        z_cands = get_z_candidates(df, x_col, y_col)
-
-        # 3) Z列の決定
-        if zcol_arg:
-            if zcol_arg in z_cands:
-                z_col = zcol_arg
-            else:
-                raise ValueError(
-                    f"ファイル '{path}' に指定された標高値列 '{zcol_arg}' が見つかりません。\n"
-                    f"利用可能な列: {z_cands}"
-                )
-        else:
-            if len(z_cands) == 1:
-                z_col = z_cands[0]
-            else:
-                raise ValueError(
-                    f"ファイル '{path}' で標高値列を特定できません。複数の候補があります。\n"
-                    f"候補: {z_cands}\n"
-                    "標高値列を明示的に指定するには --zcol オプションを使用してください。"
-                )
-
-        # 4) GeoDataFrame 作成
-        geom = [Point(xy) for xy in zip(df[x_col], df[y_col])]
-        gdf = gpd.GeoDataFrame(
-            df[[z_col]].rename(columns={z_col: "elevation"}),
-            geometry=geom,
-            crs=target_crs
-        )
-        return gdf
+        chunksize: CSV を読み込む行数（None の場合はファイル単位）
+        workers: 並列に読み込むプロセス数。2以上かつ複数ファイルの場合にプロセスプールを使う
+        cache: 点群キャッシュ (PointCache)。None の場合は毎回解析する
+        stats: 平均以外に求める統計量（"min", "max", "std"）
+        percentiles: 求めるパーセンタイル（例: (50,) で中央値）
 
-    # パスをリストに統一
+    Returns:
+        CellAccumulator: セルごとの集計結果
+    """
     paths = [paths] if isinstance(paths, str) else paths
-    
     if not paths:
         raise ValueError("処理するファイルが指定されていません")
-    
-    # すべてのファイルを読み込み
-    gdfs = []
-    for path in paths:
-        try:
-            gdf = _load_one(path)
-            gdfs.append(gdf)
-        except Exception as e:
-            raise ValueError(f"ファイル '{path}' の処理中にエラーが発生しました: {str(e)}")
-    
-    # すべてのファイルを結合
-    if gdfs:
-        combined = pd.concat(gdfs, ignore_index=True)
-        return gpd.GeoDataFrame(combined, crs=target_crs)
-    
-    raise ValueError("有効なデータが読み込めませんでした")
 
-def main(domain_shp, basin_shp, points_path, out_dir, zcol=None, nodata=None):
+    workers = max(1, min(int(workers or 1), len(paths)))
+    results = [None] * len(paths)
+    if workers == 1:
+        for i, path in enumerate(paths):
+            try:
+                results[i] = _aggregate_file(path, target_crs, assign, n_cells, zcol_arg, chunksize, cache,
+                                             stats, percentiles)
+            except Exception as e:
+                raise ValueError(f"ファイル '{path}' の処理中にエラーが発生しました: {str(e)}")
+    else:
+        print(f"[INFO] {len(paths)} ファイルを {workers} プロセスで並列に読み込みます")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_aggregate_file, path, target_crs, assign, n_cells, zcol_arg, chunksize, cache,
+                                stats, percentiles): i
+                for i, path in enumerate(paths)
+            }
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        raise ValueError(f"ファイル '{paths[i]}' の処理中にエラーが発生しました: {str(e)}")
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+    # 完了順に依らず、ファイルの指定順に結合する（結果を決定的にするため）
+    acc = CellAccumulator(n_cells, stats, percentiles)
+    n_points = 0
+    bounds = [np.inf, np.inf, -np.inf, -np.inf]
+    for part, n, b in results:
+        acc.merge(part)
+        n_points += n
+        bounds = [min(bounds[0], b[0]), min(bounds[1], b[1]), max(bounds[2], b[2]), max(bounds[3], b[3])]
+
+    if n_points == 0:
+        raise ValueError("有効なデータが読み込めませんでした")
+    print(f"点群データの点数: {n_points}")
+    print(f"点群データの範囲: {bounds}")
+    return acc
+
+def mesh_elevation(mesh, points_path, zcol=None, nodata=None, chunksize=None, workers=1,
+                   cache_dir=None, stats=None, percentiles=None):
+    """
+    GridMesh の流域セルごとに平均標高・点数（と統計量）を集計する（ポリゴン・ファイル入出力なし）
+
+    Args:
+        mesh: generate_mesh の GridMesh（点群は mesh.crs に変換して集計する）
+        その他の引数は main と同じ
+
+    Returns:
+        dict: 列名（elevation / pnt_count / 統計量の列）→ 計算領域メッシュの全セル（通しID順）の配列。
+            流域外のセルは nodata（pnt_count は 0）。流域メッシュの値は [mesh.basin_ids] で取り出す
+    """
+    if nodata is None:
+        nodata = DEFAULT_NODATA
+    n_basin = len(mesh.basin_ids)
+    print(f"[INFO] メッシュ {mesh} のセル番号の直接計算で集計します")
+    cache = PointCache(cache_dir) if cache_dir else None
+    with stage("aggregate_points", cells=n_basin) as s:
+        acc = aggregate_points(points_path, mesh.crs, MeshAssigner(mesh), n_basin, zcol, chunksize, workers, cache,
+                               stats=stats or (), percentiles=percentiles or ())
+        s.count(points_in_cells=int(acc.count.sum()))
+
+    basin_values = {"elevation": acc.mean(nodata), "pnt_count": acc.count}
+    statistics = acc.statistics(nodata)
+    columns = stat_columns(statistics)
+    for name, values in statistics.items():
+        basin_values[columns[name]] = values
+
+    # 流域セルの値を計算領域メッシュの全セルへ（流域外は nodata / 0）
+    values = {}
+    for col, src in basin_values.items():
+        out = np.full(mesh.n_cells, 0 if col == "pnt_count" else nodata, dtype=src.dtype)
+        out[mesh.basin_ids] = src
+        values[col] = out
+
+    counted = basin_values["pnt_count"] > 0
+    print(f"\n点群を含む流域セル: {int(counted.sum())} / {n_basin}")
+    if counted.any():
+        elev = basin_values["elevation"][counted]
+        print(f"流域メッシュの平均標高: 最小 {elev.min():.3f}, 最大 {elev.max():.3f}, 平均 {elev.mean():.3f}")
+    return values
+
+
+def add_elevation_to_mesh(domain, basin, points_path, zcol=None, nodata=None, chunksize=None, workers=1,
+                          cache_dir=None, stats=None, percentiles=None, mesh=None):
+    """
+    流域メッシュに平均標高・点数を付与し、計算領域メッシュへ転記する（ファイル入出力なし）
+
+    Args:
+        domain, basin: 計算領域メッシュ・流域メッシュの GeoDataFrame
+        mesh: generate_mesh の GridMesh（または計算領域メッシュのパス）。
+            単一の等間隔グリッドであればセル番号の直接計算で集計する
+        その他の引数は main と同じ
+
+    Returns:
+        tuple: (流域メッシュ, 計算領域メッシュ) の GeoDataFrame
+    """
     # Nodata値が指定されていない場合はデフォルト値を使用
     if nodata is None:
         nodata = DEFAULT_NODATA
-    # 1. ベースとなるポリゴンデータの読み込み
-    basin = gpd.read_file(basin_shp)
+    # 1. 流域メッシュをベースとし、計算領域メッシュの座標系を合わせる
+    basin = basin.copy()
     print(f"ベースのCRS: {basin.crs}")
-    
-    # 2. ドメインデータの読み込みと座標系の統一
-    domain = gpd.read_file(domain_shp).to_crs(basin.crs)
-    
-    # 3. 点群データの読み込みと座標系の設定
-    points = load_points(points_path, basin.crs, zcol)
-    
-    # 4. 座標系が正しく設定されているか確認
-    print(f"点群データのCRS: {points.crs}")
-    print(f"点群データの範囲: {points.total_bounds}")
+    domain = domain.to_crs(basin.crs)
+
+    # 2. 点群データを読み込みながら流域メッシュのセルごとに集計
     print(f"流域ポリゴンの範囲: {basin.total_bounds}")
+    regular = _regular_grid_for(mesh, domain, basin)
+    if regular is not None:
+        # 等間隔グリッド: セル番号を直接計算して集計（空間結合なし）
+        print("[INFO] 等間隔グリッドのためセル番号の直接計算で集計します")
+        assign = GridAssigner(*regular)
+    else:
+        print("[INFO] 不規則なメッシュのため空間結合で集計します")
+        assign = PolygonAssigner(basin)
+    cache = PointCache(cache_dir) if cache_dir else None
+    with stage("aggregate_points", cells=len(basin)) as s:
+        acc = aggregate_points(points_path, basin.crs, assign, len(basin), zcol, chunksize, workers, cache,
+                               stats=stats or (), percentiles=percentiles or ())
+        s.count(points_in_cells=int(acc.count.sum()))
 
-    # 空間結合 + 平均標高算出
-    joined = gpd.sjoin(points, basin, predicate="within", how="left")
-    
-    # デバッグ用に結合結果を表示
-    print("結合結果の先頭5行:")
-    print(joined.head())
-    
-    # グループ化する前に、結合に使用するインデックスを確認
-    print("\nbasinのインデックス:", basin.index.tolist()[:10])
-    print("joinedのindex_rightのユニーク値:", joined["index_right"].unique()[:10])
-    
-    # 平均標高と点数を計算
-    grouped = joined.groupby("index_right")
-    mean_elev = grouped["elevation"].mean()
-    point_count = grouped.size()
-    point_count.name = "pnt_count"
+    # basinに標高と点数を追加
+    basin["elevation"] = acc.mean(nodata)
+    basin["pnt_count"] = acc.count
+    statistics = acc.statistics(nodata)
+    columns = stat_columns(statistics)
+    for name, values in statistics.items():
+        basin[columns[name]] = values
+    stat_cols = list(columns.values())
     print("\n平均標高の計算結果:")
-    print(mean_elev.head())
+    print(basin.loc[basin["pnt_count"] > 0, "elevation"].head())
     print("\n点群数の計算結果:")
-    print(point_count.head())
-
-    # basinに標高と点数を追加
-    basin["elevation"] = basin.index.map(mean_elev).fillna(nodata)
-    basin["pnt_count"] = basin.index.map(point_count).fillna(0).astype(int)
+    print(basin.loc[basin["pnt_count"] > 0, "pnt_count"].head())
     
-    # 空間結合でdomainとbasinをマッチング
-    domain = gpd.sjoin(domain, basin[["elevation", "pnt_count", "geometry"]], how="left", predicate="within")
-    # 流域外は nodata / 0 に置き換え
-    domain['elevation'] = domain['elevation'].fillna(nodata)
-    domain['pnt_count'] = domain['pnt_count'].fillna(0).astype(int)
+    if _has_cell_ids(domain, basin):
+        # generate_mesh のメッシュ: 同じセルは同じ cell_id を持つので配列の照合で転記
+        with stage("transfer_to_domain", rows=len(domain)):
+            domain = transfer_to_domain(domain, basin, ["elevation", "pnt_count", *stat_cols], nodata)
+    else:
+        # 空間結合でdomainとbasinをマッチング
+        with stage("sjoin", rows=len(domain)):
+            domain = gpd.sjoin(domain, basin[["elevation", "pnt_count", *stat_cols, "geometry"]], how="left", predicate="within")
+        # 流域外は nodata / 0 に置き換え
+        for col in ["elevation", *stat_cols]:
+            domain[col] = domain[col].fillna(nodata)
+        domain['pnt_count'] = domain['pnt_count'].fillna(0).astype(int)
     
     # 不要な列（index_right, geometry_right など）を削除
     domain = domain.drop(columns=['index_right', 'geometry_right', 'feature_id'], errors='ignore')
     basin = basin.drop(columns=['index_right', 'geometry_right', 'feature_id'], errors='ignore')
 
-    # 出力フォルダを作成
-    os.makedirs(out_dir, exist_ok=True)
-
     # デバッグ用に標高の統計情報を表示
     print("\n最終的な標高の統計:")
     print("流域メッシュの標高統計:")
@@ -209,12 +525,44 @@ def main(domain_shp, basin_shp, points_path, out_dir, zcol=None, nodata=None):
     print(domain["elevation"].describe())
     print("\n計算領域メッシュの点群数統計:")
     print(domain["pnt_count"].describe())
-    
+    return basin, domain
+
+
+def main(domain_shp, basin_shp, points_path, out_dir, zcol=None, nodata=None, chunksize=None, workers=1,
+         cache_dir=None, stats=None, percentiles=None):
+    """
+    流域メッシュに平均標高・点数を付与し、計算領域メッシュへ転記する
+
+    Args:
+        chunksize: 指定すると点群CSVをこの行数ずつ読み込み、逐次集計する
+            （メモリ使用量が点数ではなくセル数で決まる）
+        workers: 複数の点群ファイルを並列に読み込むプロセス数
+        cache_dir: 点群キャッシュの保存先。指定すると解析済みの点群を再利用する
+        stats: 平均以外に求める統計量（"min", "max", "std"）。elev_min などの列として追加する
+        percentiles: 求めるパーセンタイル（例: (50,) で elev_p50 列を追加）
+    """
+    with stage("read_shp") as s:
+        domain_gdf, basin_gdf = gpd.read_file(domain_shp), gpd.read_file(basin_shp)
+        s.count(rows=len(domain_gdf) + len(basin_gdf))
+    basin, domain = add_elevation_to_mesh(
+        domain_gdf, basin_gdf, points_path, zcol, nodata,
+        chunksize=chunksize, workers=workers, cache_dir=cache_dir,
+        stats=stats, percentiles=percentiles, mesh=domain_shp,
+    )
+
+    # 出力フォルダを作成
+    os.makedirs(out_dir, exist_ok=True)
+
     # 拡張子以外の部分を取得
     basin_filename = os.path.splitext(os.path.basename(basin_shp))[0]
     domain_filename = os.path.splitext(os.path.basename(domain_shp))[0]
-    basin_file=basin.to_file(f"{out_dir}/{basin_filename}_elev.shp")
-    domain_file=domain.to_file(f"{out_dir}/{domain_filename}_elev.shp")
+    with stage("write_shp", rows=len(basin) + len(domain)):
+        basin_file=basin.to_file(f"{out_dir}/{basin_filename}_elev.shp")
+        domain_file=domain.to_file(f"{out_dir}/{domain_filename}_elev.shp")
+    # グリッド定義を引き継ぐ（ASC 変換でラスタ化を省略できるように）
+    mesh = GridMesh.read_sidecar(domain_shp)
+    if mesh is not None:
+        mesh.write_sidecar(f"{out_dir}/{domain_filename}_elev.shp")
     return basin_file, domain_file
     
 
@@ -225,7 +573,14 @@ if __name__ == "__main__":
     ap.add_argument("--points",      required=True, nargs='+', help="点群 CSV (.csv)。複数ファイル指定可")
     ap.add_argument("--zcol",        default=None, help="Z 列名")
     ap.add_argument("--outdir",      default="./outputs", help="出力フォルダ")
+    ap.add_argument("--chunksize",   type=int, default=None, help="点群CSVを逐次読み込む行数 (省略時はファイル全体を一度に読み込む)")
+    ap.add_argument("--workers",     type=int, default=1, help="点群ファイルを並列に読み込むプロセス数 (デフォルト: 1)")
+    ap.add_argument("--point-cache", default=None, help="点群キャッシュの保存先フォルダ (省略時はキャッシュしない)")
+    ap.add_argument("--stats",       nargs="*", choices=STAT_NAMES, default=None, help="平均以外に求める統計量")
+    ap.add_argument("--percentiles", nargs="*", type=float, default=None, help="求めるパーセンタイル (例: 50 で中央値)")
     args = ap.parse_args()
-    main(args.basin_mesh, args.domain_mesh, args.points, args.outdir, args.zcol)
+    main(args.domain_mesh, args.basin_mesh, args.points, args.outdir, args.zcol,
+         chunksize=args.chunksize, workers=args.workers, cache_dir=args.point_cache,
+         stats=args.stats, percentiles=args.percentiles)
     
 # python src/make_shp/add_elevation.py --basin_mesh output4\basin_mesh.shp --domain_mesh output4\domain_mesh.shp --points input\SHP→ASC変換作業_サンプルデータ\標高点群.csv --outdir ./output3
@@ -0,0 +1,186 @@
+# cell_stats.py
+"""
+セルごとの標高集計を逐次的に行うための集計器
+
+点群をチャンク単位で読み込みながら、各チャンクを「セル位置ごとの合計・点数」に
+畳み込んでいく。メモリ使用量は点数ではなくセル数に比例する。
+
+平均以外の統計量も同じ読み込みの中で求められる:
+    min / max  セルごとの最小・最大
+    std        標準偏差（母標準偏差）。チャンクごとの偏差平方和を Chan らの式で結合する
+    パーセンタイル  有効な標高値をすべて保持し、最後にセル・値の順で並べ替えて求める（厳密値）
+"""
+import numpy as np
+
+# 平均以外に指定できる統計量
+STAT_NAMES = ("min", "max", "std")
+
+
+def percentile_name(q):
+    """パーセンタイルの結果名（例: 50 -> 'p50', 2.5 -> 'p2_5'）"""
+    return "p" + f"{q:g}".replace(".", "_")
+
+
+class CellAccumulator:
+    """
+    セルごとの点数・標高合計を保持する集計器
+
+    - count: セル内の点数（標高が欠損の点も含む。従来の pnt_count と同じ）
+    - valid: 標高が有効な点の数
+    - total: 有効な標高の合計
+    - vmin / vmax / m2: stats に "min" / "max" / "std" を指定した場合のみ保持
+      （m2 は平均からの偏差平方和）
+    percentiles を指定した場合は有効な (セル位置, 標高) をすべて保持する
+    （メモリ使用量が点数に比例する）。
+    """
+
+    def __init__(self, n_cells, stats=(), percentiles=()):
+        self.n_cells = int(n_cells)
+        self.stats = tuple(stats or ())
+        unknown = [s for s in self.stats if s not in STAT_NAMES]
+        if unknown:
+            raise ValueError(f"未対応の統計量です: {unknown}（指定可能: {', '.join(STAT_NAMES)}）")
+        self.percentiles = tuple(float(q) for q in (percentiles or ()))
+        if any(not 0 <= q <= 100 for q in self.percentiles):
+            raise ValueError(f"パーセンタイルは 0 ～ 100 で指定してください: {self.percentiles}")
+
+        self.count = np.zeros(self.n_cells, dtype=np.int64)
+        self.valid = np.zeros(self.n_cells, dtype=np.int64)
+        self.total = np.zeros(self.n_cells, dtype=np.float64)
+        self.vmin = np.full(self.n_cells, np.inf) if "min" in self.stats else None
+        self.vmax = np.full(self.n_cells, -np.inf) if "max" in self.stats else None
+        self.m2 = np.zeros(self.n_cells, dtype=np.float64) if "std" in self.stats else None
+        self._cells = []
+        self._values = []
+
+    def add(self, cells, values):
+        """
+        セル位置と標高の組を集計に加える
+
+        Args:
+            cells: 各点のセル位置 (0 ～ n_cells-1)。負の値はセル外として無視する
+            values: 各点の標高
+        """
+        cells = np.asarray(cells, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        inside = cells >= 0
+        if not inside.all():
+            cells, values = cells[inside], values[inside]
+        if cells.size == 0:
+            return
+
+        self.count += np.bincount(cells, minlength=self.n_cells)
+        ok = ~np.isnan(values)
+        if not ok.all():
+            cells, values = cells[ok], values[ok]
+        if cells.size == 0:
+            return
+
+        n = np.bincount(cells, minlength=self.n_cells)
+        total = np.bincount(cells, weights=values, minlength=self.n_cells)
+        if self.m2 is not None:
+            # チャンク内の偏差平方和を求めてから、これまでの集計と結合する
+            chunk_mean = np.divide(total, n, out=np.zeros(self.n_cells), where=n > 0)
+            dev = values - chunk_mean[cells]
+            m2 = np.bincount(cells, weights=dev * dev, minlength=self.n_cells)
+            self._merge_m2(n, total, m2)
+        self.valid += n
+        self.total += total
+        if self.vmin is not None:
+            np.minimum.at(self.vmin, cells, values)
+        if self.vmax is not None:
+            np.maximum.at(self.vmax, cells, values)
+        if self.percentiles:
+            self._cells.append(cells.copy())
+            self._values.append(values.copy())
+
+    def _merge_m2(self, n_b, total_b, m2_b):
+        """偏差平方和の結合（valid / total を更新する前に呼ぶ）"""
+        n_a = self.valid
+        n = n_a + n_b
+        both = (n_a > 0) & (n_b > 0)
+        delta = np.zeros(self.n_cells)
+        delta[both] = total_b[both] / n_b[both] - self.total[both] / n_a[both]
+        corr = np.zeros(self.n_cells)
+        corr[both] = delta[both] ** 2 * n_a[both] * n_b[both] / n[both]
+        self.m2 += m2_b + corr
+
+    def merge(self, other):
+        """別の集計器（同じセル数・同じ統計量）の結果を加える"""
+        if other.n_cells != self.n_cells:
+            raise ValueError(f"セル数が一致しません: {self.n_cells} != {other.n_cells}")
+        if other.stats != self.stats or other.percentiles != self.percentiles:
+            raise ValueError("集計する統計量が一致しません")
+        self.count += other.count
+        if self.m2 is not None:
+            self._merge_m2(other.valid, other.total, other.m2)
+        self.valid += other.valid
+        self.total += other.total
+        if self.vmin is not None:
+            np.minimum(self.vmin, other.vmin, out=self.vmin)
+        if self.vmax is not None:
+            np.maximum(self.vmax, other.vmax, out=self.vmax)
+        self._cells.extend(other._cells)
+        self._values.extend(other._values)
+        return self
+
+    def mean(self, nodata):
+        """セルごとの平均標高。有効な点が無いセルは nodata"""
+        out = np.full(self.n_cells, float(nodata), dtype=np.float64)
+        has = self.valid > 0
+        out[has] = self.total[has] / self.valid[has]
+        return out
+
+    def _fill(self, values, nodata):
+        out = np.full(self.n_cells, float(nodata), dtype=np.float64)
+        has = self.valid > 0
+        out[has] = values[has]
+        return out
+
+    def percentile_values(self, nodata):
+        """
+        セルごとのパーセンタイル（numpy.percentile の linear と同じ補間）
+
+        Returns:
+            dict: {percentile_name(q): ndarray}
+        """
+        if not self.percentiles:
+            return {}
+        cells = np.concatenate(self._cells) if self._cells else np.empty(0, dtype=np.int64)
+        values = np.concatenate(self._values) if self._values else np.empty(0)
+        # セル → 値 の順に並べ替え、各セルの区間から順位で取り出す
+        order = np.lexsort((values, cells))
+        values = values[order]
+        n = self.valid
+        start = np.concatenate([[0], np.cumsum(n)[:-1]])
+        has = n > 0
+
+        results = {}
+        for q in self.percentiles:
+            out = np.full(self.n_cells, float(nodata), dtype=np.float64)
+            pos = (n[has] - 1) * (q / 100.0)
+            lo = np.floor(pos).astype(np.int64)
+            hi = np.minimum(lo + 1, n[has] - 1)
+            v_lo = values[start[has] + lo]
+            v_hi = values[start[has] + hi]
+            out[has] = v_lo + (v_hi - v_lo) * (pos - lo)
+            results[percentile_name(q)] = out
+        return results
+
+    def statistics(self, nodata):
+        """
+        指定された統計量をまとめて返す。有効な点が無いセルは nodata
+
+        Returns:
+            dict: {"min" / "max" / "std" / "p50" など: ndarray}
+        """
+        results = {}
+        if self.vmin is not None:
+            results["min"] = self._fill(self.vmin, nodata)
+        if self.vmax is not None:
+            results["max"] = self._fill(self.vmax, nodata)
+        if self.m2 is not None:
+            var = np.divide(self.m2, self.valid, out=np.zeros(self.n_cells), where=self.valid > 0)
+            results["std"] = self._fill(np.sqrt(np.maximum(var, 0.0)), nodata)
+        results.update(self.percentile_values(nodata))
+        return results
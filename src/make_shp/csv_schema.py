@@ -0,0 +1,92 @@
+# csv_schema.py
+"""
+点群CSVの列構成を、ファイル全体を読まずに推定するモジュール
+
+先頭の一定バイト数だけを読み込んで文字コードを判定し、
+ヘッダと先頭の行（サンプル）から列名と数値列を求める。
+結果はファイル（パス・サイズ・更新時刻）ごとにキャッシュする。
+"""
+import functools
+import io
+import os
+
+import pandas as pd
+
+# サンプルとして読み込む行数・バイト数の上限
+SAMPLE_ROWS = 1000
+SAMPLE_BYTES = 1024 * 1024
+
+# 試行する文字コード（utf-8-sig は BOM 無しの UTF-8 も読める。cp932 は Shift-JIS 納品向け）
+ENCODINGS = ("utf-8-sig", "cp932")
+
+
+class CsvSchema:
+    """
+    CSV の列構成
+
+    - encoding: 判定した文字コード（pd.read_csv の encoding に渡せる）
+    - columns: 列名のリスト
+    - sample: 先頭の行を読み込んだ DataFrame（列の型推定に使う。変更しないこと）
+    """
+
+    __slots__ = ("path", "encoding", "columns", "sample")
+
+    def __init__(self, path, encoding, sample):
+        self.path = path
+        self.encoding = encoding
+        self.sample = sample
+        self.columns = sample.columns.tolist()
+
+    def __repr__(self):
+        return f"CsvSchema({self.path!r}, encoding={self.encoding!r}, columns={self.columns})"
+
+    @property
+    def numeric_columns(self):
+        """サンプルで数値型と判定された列名のリスト"""
+        return self.sample.select_dtypes(include="number").columns.tolist()
+
+
+def _read_head(path, max_bytes):
+    """ファイル先頭を最大 max_bytes 読み込む。途中で切れた最終行は捨てる"""
+    with open(path, "rb") as f:
+        head = f.read(max_bytes)
+        truncated = bool(f.read(1))
+    if truncated:
+        cut = head.rfind(b"\n")
+        if cut >= 0:
+            head = head[:cut + 1]
+    return head
+
+
+def _decode(head, path):
+    for encoding in ENCODINGS:
+        try:
+            return head.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"ファイル '{path}' の文字コードを判定できません（対応: {', '.join(ENCODINGS)}）")
+
+
+@functools.lru_cache(maxsize=64)
+def _sniff(path, size, mtime_ns, sample_rows, sample_bytes):
+    # size / mtime_ns はキャッシュのキーとしてのみ使う
+    text, encoding = _decode(_read_head(path, sample_bytes), path)
+    sample = pd.read_csv(io.StringIO(text), nrows=sample_rows)
+    return CsvSchema(path, encoding, sample)
+
+
+def sniff_csv(path, sample_rows=SAMPLE_ROWS, sample_bytes=SAMPLE_BYTES):
+    """
+    CSV のヘッダと先頭 sample_rows 行から列構成を推定する
+
+    Args:
+        path: CSV ファイルのパス
+        sample_rows: サンプルとして読み込む最大行数
+        sample_bytes: 読み込む最大バイト数
+
+    Returns:
+        CsvSchema: 列構成（同じファイルへの再呼び出しはキャッシュから返す）
+    """
+    path = os.path.abspath(str(path))
+    st = os.stat(path)
+    return _sniff(path, st.st_size, st.st_mtime_ns, int(sample_rows), int(sample_bytes))
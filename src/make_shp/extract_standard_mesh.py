@@ -8,31 +8,72 @@ extract_standard_mesh.py
 
 Usage:
     python extract_standard_mesh.py \
-        --standard-mesh standard_mesh.shp \
+        [--standard-mesh standard_mesh.shp | --level 3] \
         --domain domain.shp \
         --output extracted_mesh.shp
 
 --id オプションを指定すると、そのID列のみ保持します。
+
+標準メッシュの隣にパック形式のインデックス（mesh_index.py 参照）があれば、
+計算領域の範囲にかかる候補セルだけを読み込みます。無い場合は初回に作成します。
+
+--standard-mesh を省略すると、シェープを読まずにメッシュコードの計算
+（jis_mesh.py 参照）で重なるセルを列挙します（--level でメッシュレベルを指定）。
 """
 import argparse
 import os
 import geopandas as gpd
 
-def extract_cells(standard_shp, domain_shp, output_shp, id_col=None):
-    # シェープ読み込み
-    mesh_gdf = gpd.read_file(standard_shp)
-    domain_gdf = gpd.read_file(domain_shp)
+from src.common.gdf_io import read_gdf
+from src.make_shp.jis_mesh import cells_for_domain
+from src.make_shp.mesh_index import load_index
+
+def read_candidate_cells(standard_shp, domain_gdf, use_index=True):
+    """
+    計算領域の外接矩形にかかる標準メッシュのセルを読み込む。
+    インデックスが使えない場合はシェープ全体を読み込む。
+    """
+    index = load_index(standard_shp) if use_index else None
+    if index is None:
+        return gpd.read_file(standard_shp)
+    mesh_gdf = index.read(tuple(domain_gdf.total_bounds), bbox_crs=domain_gdf.crs)
+    print(f"[INFO] インデックスから候補セルを読み込みました: {len(mesh_gdf)} / {len(index)} cells")
+    return mesh_gdf
+
+def extract_cells(standard_shp, domain_shp, output_shp, id_col=None, use_index=True, mesh_level=3):
+    """
+    標準地域メッシュから計算領域と重なるセルを抽出し、1つのフィーチャに結合して出力する
 
-    # CRS を合わせる
-    if mesh_gdf.crs != domain_gdf.crs:
-        mesh_gdf = mesh_gdf.to_crs(domain_gdf.crs)
+    Args:
+        standard_shp: 標準地域メッシュ (.shp)。None の場合はメッシュコード計算で列挙する
+        domain_shp: 計算領域ポリゴン (.shp)、または GeoDataFrame
+        output_shp: 出力シェープ (.shp)。None の場合はファイルに書き出さない
+        id_col: 保持するID列名（メッシュコード計算時は 'mesh_code' が使える）
+        use_index: 標準メッシュのインデックスを使うか
+        mesh_level: メッシュコード計算時のメッシュレベル (1, 2, 3)
 
-    # ドメインを一つの形状に統合
-    domain_union = domain_gdf.unary_union
+    Returns:
+        geopandas.GeoDataFrame: 結合した1フィーチャの抽出結果
+    """
+    domain_gdf = read_gdf(domain_shp)
 
-    # 重なり判定: intersects でセル全体を抽出
-    mask = mesh_gdf.geometry.intersects(domain_union)
-    extracted = mesh_gdf.loc[mask].copy()
+    if standard_shp is None:
+        # メッシュコード計算で列挙（シェープの読み込みなし）
+        extracted = cells_for_domain(domain_gdf, mesh_level)
+    else:
+        # シェープ読み込み
+        mesh_gdf = read_candidate_cells(standard_shp, domain_gdf, use_index)
+
+        # CRS を合わせる
+        if mesh_gdf.crs != domain_gdf.crs:
+            mesh_gdf = mesh_gdf.to_crs(domain_gdf.crs)
+
+        # ドメインを一つの形状に統合
+        domain_union = domain_gdf.unary_union
+
+        # 重なり判定: intersects でセル全体を抽出
+        mask = mesh_gdf.geometry.intersects(domain_union)
+        extracted = mesh_gdf.loc[mask].copy()
 
     # すべてのポリゴンを1つのマルチポリゴンに結合
     from shapely.ops import unary_union
@@ -47,29 +88,37 @@ def extract_cells(standard_shp, domain_shp, output_shp, id_col=None):
         first_valid_id = extracted[id_col].iloc[0] if not extracted.empty else None
         combined_gdf[id_col] = first_valid_id
     
+    if output_shp is None:
+        print(f"Extracted {len(extracted)} cells")
+        return combined_gdf
+
     # 出力先ディレクトリ作成
     out_dir = os.path.dirname(output_shp)
     if out_dir:
         os.makedirs(out_dir, exist_ok=True)
 
     # ファイル出力
-    combined_file=combined_gdf.to_file(output_shp)
+    combined_gdf.to_file(output_shp)
     print(f"Extracted {len(extracted)} cells to {output_shp}")
-    return combined_file
+    return combined_gdf
 
 def main():
     parser = argparse.ArgumentParser(description='標準地域メッシュから重なるセルを抽出')
-    parser.add_argument('--standard-mesh', required=True, help='標準地域メッシュ (.shp)')
+    parser.add_argument('--standard-mesh', default=None, help='標準地域メッシュ (.shp)。省略時はメッシュコード計算で列挙')
     parser.add_argument('--domain',        required=True, help='計算領域ポリゴン (.shp)')
     parser.add_argument('--output',        required=True, help='抽出後のシェープ (.shp)')
     parser.add_argument('--id',            help='保持するID列名 (省略可)')
+    parser.add_argument('--no-index',      action='store_true', help='インデックスを使わずシェープ全体を読み込む')
+    parser.add_argument('--level',         type=int, default=3, choices=(1, 2, 3), help='メッシュコード計算時のメッシュレベル (デフォルト: 3)')
     args = parser.parse_args()
 
     file=extract_cells(
         args.standard_mesh,
         args.domain,
         args.output,
-        args.id
+        args.id,
+        use_index=not args.no_index,
+        mesh_level=args.level
     )
     return file
 
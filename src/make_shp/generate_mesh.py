@@ -7,72 +7,92 @@
 import argparse
 import os
 import numpy as np
-import pandas as pd
-import geopandas as gpd
-from shapely.geometry import box
 
-def build_grid(extent, num_cells_x, num_cells_y, crs):
-    """
-    指定した範囲(extent)とセル数でグリッドを作成
-    extent: (minx, miny, maxx, maxy)
-    num_cells_x, num_cells_y: セル数
-    crs: 投影法
+from src.common.gdf_io import read_gdf
+from src.make_shp.regular_grid import RegularGrid, GridMesh
+
+
+def build_mesh(domain_gdf, basin_gdf, cells_x, cells_y):
     """
-    minx, miny, maxx, maxy = extent
-    xs = np.linspace(minx, maxx, num_cells_x + 1)
-    ys = np.linspace(miny, maxy, num_cells_y + 1)
-    polys = []
-    for i in range(num_cells_x):
-        for j in range(num_cells_y):
-            polys.append(box(xs[i], ys[j], xs[i+1], ys[j+1]))
-    return gpd.GeoDataFrame(geometry=polys, crs=crs)
+    ドメインの各フィーチャを同一セル数で分割した GridMesh を作成する。
+    セルのポリゴンは生成せず、流域との交差判定のときだけブロック単位で一時生成する。
 
-def main(domain_shp, basin_shp, cells_x, cells_y, out_dir):
-    # シェープの読み込み
-    domain_gdf = gpd.read_file(domain_shp)
-    basin_gdf = gpd.read_file(basin_shp).to_crs(domain_gdf.crs)
+    Args:
+        domain_gdf: ドメインポリゴンの GeoDataFrame
+        basin_gdf: 流域ポリゴンの GeoDataFrame（ドメインと同じ CRS）
+        cells_x, cells_y: セル数（全フィーチャ共通）
+
+    Returns:
+        GridMesh: 計算領域メッシュと流域メッシュ（セルIDの部分集合）
+    """
     basin_union = basin_gdf.unary_union
 
     # 有効なジオメトリのみをフィルタリング
     valid_domain = domain_gdf[domain_gdf.geometry.notna() & domain_gdf.geometry.is_valid]
-    
+
     if valid_domain.empty:
         raise ValueError("有効なジオメトリが含まれていません")
 
-    all_grids = []
-    basin_grids = []
+    grids = []
+    feature_ids = []
+    basin_ids = []
+    offset = 0
 
     # 各フィーチャごとにグリッド生成
     for idx, row in valid_domain.iterrows():
         try:
-            extent = row.geometry.bounds
-            grid = build_grid(extent, cells_x, cells_y, valid_domain.crs)
-            grid['feature_id'] = row.get('id', idx)
-            all_grids.append(grid)
-
+            grid = RegularGrid.from_extent(row.geometry.bounds, cells_x, cells_y)
             # 流域界でクリップ
-            mask = grid.geometry.intersects(basin_union)
-            basin_sub = grid[mask].copy()
-            basin_sub['feature_id'] = row.get('id', idx)
-            basin_grids.append(basin_sub)
+            basin_ids.append(grid.intersecting_ids(basin_union) + offset)
         except Exception as e:
             print(f"[WARNING] 行 {idx} の処理中にエラーが発生しました: {str(e)}")
             continue
+        grids.append(grid)
+        feature_ids.append(row.get('id', idx))
+        offset += grid.size
 
-    if not all_grids:
+    if not grids:
         raise ValueError("有効なグリッドが生成されませんでした")
 
-    # 結合して出力
+    return GridMesh(grids, feature_ids, np.concatenate(basin_ids), valid_domain.crs)
+
+
+def write_mesh(mesh, out_dir):
+    """GridMesh を domain_mesh.shp / basin_mesh.shp（+ グリッド定義）として書き出す"""
     os.makedirs(out_dir, exist_ok=True)
-    domain_mesh = gpd.GeoDataFrame(pd.concat(all_grids, ignore_index=True), crs=valid_domain.crs)
-    basin_mesh = gpd.GeoDataFrame(pd.concat(basin_grids, ignore_index=True), crs=valid_domain.crs)
     domain_out = os.path.join(out_dir, 'domain_mesh.shp')
     basin_out = os.path.join(out_dir, 'basin_mesh.shp')
-    domain_mesh_file=domain_mesh.to_file(domain_out)
-    basin_mesh_file=basin_mesh.to_file(basin_out)
+    mesh.domain_frame().to_file(domain_out)
+    mesh.write_sidecar(domain_out)
+    mesh.basin_frame().to_file(basin_out)
+    mesh.write_sidecar(basin_out)
+    return domain_out, basin_out
+
+
+def main(domain_shp, basin_shp, cells_x, cells_y, out_dir):
+    """
+    メッシュを生成し、out_dir に domain_mesh.shp / basin_mesh.shp を書き出す
+
+    Args:
+        domain_shp, basin_shp: ドメイン・流域ポリゴン (.shp)、または GeoDataFrame
+        out_dir: 出力フォルダ。None の場合は書き出さずに GridMesh を返す
+
+    Returns:
+        tuple: (domain_mesh.shp, basin_mesh.shp) のパス。out_dir が None の場合は GridMesh
+    """
+    # シェープの読み込み
+    domain_gdf = read_gdf(domain_shp)
+    basin_gdf = read_gdf(basin_shp).to_crs(domain_gdf.crs)
+
+    mesh = build_mesh(domain_gdf, basin_gdf, cells_x, cells_y)
+    if out_dir is None:
+        return mesh
+
+    # ポリゴンは書き出し時にだけ生成する
+    domain_out, basin_out = write_mesh(mesh, out_dir)
     print(f"domain mesh -> {domain_out}")
     print(f"basin mesh  -> {basin_out}")
-    return domain_mesh_file, basin_mesh_file
+    return domain_out, basin_out
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='全フィーチャ共通セル数でメッシュ生成')
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+jis_mesh.py
+
+標準地域メッシュ（JIS X 0410）のメッシュコードを緯度経度から計算するモジュール。
+メッシュは緯度経度の演算だけで決まるため、標準メッシュのシェープを読まずに
+計算領域と重なるセルのコードとジオメトリを列挙できる。
+
+    1次メッシュ: 緯度 40分 × 経度 1度       コード4桁  (pp uu)
+    2次メッシュ: 1次を 8 × 8 分割（5分 × 7分30秒）   コード6桁  (pp uu q v)
+    3次メッシュ: 2次を 10 × 10 分割（30秒 × 45秒）   コード8桁  (pp uu q v r w)
+
+内部では緯度経度をセルの大きさで割った整数インデックス (iy, ix) で計算し、
+浮動小数点の境界誤差がコードに入らないようにしている。
+
+Usage:
+    python -m src.make_shp.jis_mesh --domain domain.shp --output mesh.shp [--level 3]
+"""
+import argparse
+import os
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+# 標準メッシュの座標系（config/standard_mesh.prj と同じ WGS84 経緯度）
+MESH_CRS = "EPSG:4326"
+
+# レベルごとのセル数 (緯度 2度あたり, 経度 1度あたり)
+# 1次メッシュの緯度幅が 2/3 度（1.5 セル/度）のため、緯度は 2度あたりで持ち _LAT_DENOM で割る
+_CELLS_PER_DEGREE = {
+    1: (3, 1),
+    2: (24, 8),
+    3: (240, 80),
+}
+_LAT_DENOM = 2
+# 1次メッシュ 1つあたりのセル数 (緯度方向, 経度方向)
+_CELLS_PER_FIRST = {1: (1, 1), 2: (8, 8), 3: (80, 80)}
+
+
+def _check_level(level):
+    if level not in _CELLS_PER_DEGREE:
+        raise ValueError(f"メッシュレベルは 1, 2, 3 のいずれかで指定してください: {level}")
+
+
+def _lat_step(level):
+    """セルの緯度方向の大きさ（度）"""
+    return _LAT_DENOM / _CELLS_PER_DEGREE[level][0]
+
+
+def _lon_step(level):
+    """セルの経度方向の大きさ（度）"""
+    return 1.0 / _CELLS_PER_DEGREE[level][1]
+
+
+def _index(lat, lon, level):
+    """緯度経度を含むセルの整数インデックス (iy, ix)"""
+    lat_cells, lon_cells = _CELLS_PER_DEGREE[level]
+    iy = np.floor(np.asarray(lat, dtype=np.float64) * lat_cells / _LAT_DENOM).astype(np.int64)
+    ix = np.floor(np.asarray(lon, dtype=np.float64) * lon_cells).astype(np.int64)
+    return iy, ix
+
+
+def _code_from_index(iy, ix, level):
+    """整数インデックスからメッシュコードを組み立てる"""
+    ny, nx = _CELLS_PER_FIRST[level]
+    p, sub_y = np.divmod(iy, ny)
+    u, sub_x = np.divmod(ix, nx)
+    code = p * 100 + (u - 100)
+    if level == 2:
+        code = code * 100 + sub_y * 10 + sub_x
+    elif level == 3:
+        q, r = np.divmod(sub_y, 10)
+        v, w = np.divmod(sub_x, 10)
+        code = (code * 100 + q * 10 + v) * 100 + r * 10 + w
+    return code
+
+
+def mesh_code(lat, lon, level=3):
+    """
+    緯度経度（度）からメッシュコードを計算する（配列可）
+
+    Args:
+        lat, lon: 緯度・経度（度）
+        level: メッシュレベル (1, 2, 3)
+
+    Returns:
+        ndarray[int64]: メッシュコード
+    """
+    _check_level(level)
+    iy, ix = _index(lat, lon, level)
+    return _code_from_index(iy, ix, level)
+
+
+def _index_from_code(code):
+    """メッシュコードから (iy, ix, level) を求める（桁数でレベルを判定）"""
+    code = np.asarray(code, dtype=np.int64)
+    digits = len(str(int(code.flat[0]))) if code.size else 8
+    level = {4: 1, 6: 2, 8: 3}.get(digits)
+    if level is None:
+        raise ValueError(f"メッシュコードの桁数が不正です: {digits}")
+
+    if level == 1:
+        first, sub_y, sub_x = code, 0, 0
+    elif level == 2:
+        first, sub_y, sub_x = code // 100, (code // 10) % 10, code % 10
+    else:
+        first = code // 10000
+        sub_y = (code // 1000) % 10 * 10 + (code // 10) % 10
+        sub_x = (code // 100) % 10 * 10 + code % 10
+    ny, nx = _CELLS_PER_FIRST[level]
+    iy = first // 100 * ny + sub_y
+    ix = (first % 100 + 100) * nx + sub_x
+    return iy, ix, level
+
+
+def mesh_bounds(code):
+    """
+    メッシュコードからセルの範囲を計算する（配列可）
+
+    Returns:
+        tuple: (minlon, minlat, maxlon, maxlat) の各 ndarray
+    """
+    iy, ix, level = _index_from_code(code)
+    lat_step, lon_step = _lat_step(level), _lon_step(level)
+    return ix * lon_step, iy * lat_step, (ix + 1) * lon_step, (iy + 1) * lat_step
+
+
+def cells_in(geom, level=3):
+    """
+    経緯度のジオメトリと重なるセルを列挙する
+
+    1次メッシュ単位で判定し、ジオメトリと重ならない1次メッシュは丸ごと飛ばす。
+    1次メッシュがジオメトリに完全に含まれる場合は、その中のセルの個別判定を省略する。
+
+    Args:
+        geom: shapely ジオメトリ（経緯度）
+        level: メッシュレベル (1, 2, 3)
+
+    Returns:
+        geopandas.GeoDataFrame: mesh_code 列とセルの矩形（MESH_CRS）
+    """
+    _check_level(level)
+    minlon, minlat, maxlon, maxlat = geom.bounds
+    shapely.prepare(geom)
+
+    ny, nx = _CELLS_PER_FIRST[level]
+    lat_step, lon_step = _lat_step(level), _lon_step(level)
+    iy0, ix0 = _index(minlat, minlon, level)
+    iy1, ix1 = _index(maxlat, maxlon, level)
+
+    ids_y = []
+    ids_x = []
+    # 1次メッシュ単位のループ
+    for p in range(int(iy0 // ny), int(iy1 // ny) + 1):
+        for u in range(int(ix0 // nx), int(ix1 // nx) + 1):
+            first = shapely.box(u * nx * lon_step, p * ny * lat_step,
+                                (u + 1) * nx * lon_step, (p + 1) * ny * lat_step)
+            if not geom.intersects(first):
+                continue
+            # 1次メッシュ内で bbox にかかる範囲のセル
+            ys = np.arange(max(iy0, p * ny), min(iy1, (p + 1) * ny - 1) + 1, dtype=np.int64)
+            xs = np.arange(max(ix0, u * nx), min(ix1, (u + 1) * nx - 1) + 1, dtype=np.int64)
+            cy, cx = np.meshgrid(ys, xs, indexing="ij")
+            cy, cx = cy.ravel(), cx.ravel()
+            if not geom.contains(first):
+                boxes = shapely.box(cx * lon_step, cy * lat_step, (cx + 1) * lon_step, (cy + 1) * lat_step)
+                hit = shapely.intersects(geom, boxes)
+                cy, cx = cy[hit], cx[hit]
+            ids_y.append(cy)
+            ids_x.append(cx)
+
+    iy = np.concatenate(ids_y) if ids_y else np.empty(0, dtype=np.int64)
+    ix = np.concatenate(ids_x) if ids_x else np.empty(0, dtype=np.int64)
+    codes = _code_from_index(iy, ix, level)
+    order = np.argsort(codes, kind="stable")
+    iy, ix, codes = iy[order], ix[order], codes[order]
+    geoms = shapely.box(ix * lon_step, iy * lat_step, (ix + 1) * lon_step, (iy + 1) * lat_step)
+    return gpd.GeoDataFrame({"mesh_code": codes}, geometry=geoms, crs=MESH_CRS)
+
+
+def cells_for_domain(domain_gdf, level=3):
+    """
+    計算領域（任意の CRS）と重なるセルを列挙し、計算領域の CRS で返す。
+    最終的な重なり判定は計算領域の CRS で行う。
+    """
+    domain_union = domain_gdf.unary_union
+    # 投影変換で辺が曲がる分を拾えるよう、頂点を補ってから経緯度へ変換する
+    minx, miny, maxx, maxy = domain_union.bounds
+    step = max(maxx - minx, maxy - miny) / 100 or None
+    dense = shapely.segmentize(domain_union, step) if step else domain_union
+    geom_ll = gpd.GeoSeries([dense], crs=domain_gdf.crs).to_crs(MESH_CRS).iloc[0]
+
+    cells = cells_in(geom_ll, level)
+    if cells.empty:
+        return cells.to_crs(domain_gdf.crs)
+    cells = cells.to_crs(domain_gdf.crs)
+    return cells.loc[cells.geometry.intersects(domain_union)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='計算領域と重なる標準地域メッシュを計算で列挙')
+    parser.add_argument('--domain', required=True, help='計算領域ポリゴン (.shp)')
+    parser.add_argument('--output', required=True, help='出力シェープ (.shp)')
+    parser.add_argument('--level',  type=int, default=3, choices=(1, 2, 3), help='メッシュレベル (デフォルト: 3)')
+    args = parser.parse_args()
+
+    cells = cells_for_domain(gpd.read_file(args.domain), args.level)
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    cells.to_file(args.output)
+    print(f"{len(cells)} cells -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+mesh_index.py
+
+標準地域メッシュ（config/standard_mesh.shp）を空間インデックス付きの
+パック形式へ一度だけ変換し、範囲内の候補セルだけを読み出すためのモジュール。
+
+パック形式はシェープファイルの隣のディレクトリ <name>.meshidx/ に保存する:
+    meta.json       元シェープの識別情報（サイズ・.shx のハッシュ）、CRS、属性列の一覧
+    bounds.npy      (n, 4) float64  各セルの外接矩形。minx の昇順に並べ替え済み
+    fid.npy         (n,)   int64    元シェープでのフィーチャ番号
+    wkb_offsets.npy (n+1,) int64    wkb.npy 内の各ジオメトリの開始位置
+    wkb.npy         (m,)   uint8    ジオメトリ (WKB) を連結したバイト列
+    attr_<列番号>.npy (n,)          属性値（列名は meta.json の columns の順）
+
+読み込みは np.load(mmap_mode="r") で行うため、実際にディスクから読まれるのは
+問い合わせ範囲にかかる部分だけになる。
+
+Usage:
+    python -m src.make_shp.mesh_index config/standard_mesh.shp
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from pyproj import CRS, Transformer
+
+INDEX_SUFFIX = ".meshidx"
+INDEX_VERSION = 1
+
+
+def index_dir(standard_shp):
+    """シェープファイルに対応するインデックスディレクトリのパス"""
+    return os.path.splitext(str(standard_shp))[0] + INDEX_SUFFIX
+
+
+def _source_stamp(standard_shp):
+    """
+    元シェープの識別情報。インデックスの鮮度確認に使う。
+    コピーや展開で更新時刻が変わっても再作成しないよう、.shp/.dbf のサイズと .shx のハッシュで判定する。
+    """
+    stamp = {}
+    base = os.path.splitext(str(standard_shp))[0]
+    for ext in (".shp", ".dbf"):
+        p = base + ext
+        if os.path.exists(p):
+            stamp[ext] = os.path.getsize(p)
+    shx = base + ".shx"
+    if os.path.exists(shx):
+        with open(shx, "rb") as f:
+            stamp[".shx"] = hashlib.sha1(f.read()).hexdigest()
+    return stamp
+
+
+def build_index(standard_shp, out_dir=None):
+    """
+    標準メッシュのシェープを読み込み、パック形式のインデックスを作成する
+
+    Args:
+        standard_shp: 標準地域メッシュ (.shp)
+        out_dir: 出力先ディレクトリ（省略時は <name>.meshidx）
+
+    Returns:
+        str: 作成したインデックスディレクトリのパス
+    """
+    out_dir = out_dir or index_dir(standard_shp)
+    gdf = gpd.read_file(standard_shp)
+
+    geoms = gdf.geometry.values
+    bounds = shapely.bounds(geoms)
+    order = np.argsort(bounds[:, 0], kind="stable")
+
+    wkb = shapely.to_wkb(geoms[order])
+    lengths = np.fromiter((len(b) for b in wkb), dtype=np.int64, count=len(wkb))
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    blob = np.frombuffer(b"".join(wkb), dtype=np.uint8)
+
+    # 一時ディレクトリに書いてから置き換える（書き込み途中のインデックスを読ませない）
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, "bounds.npy"), np.ascontiguousarray(bounds[order]))
+    np.save(os.path.join(tmp_dir, "fid.npy"), order.astype(np.int64))
+    np.save(os.path.join(tmp_dir, "wkb_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "wkb.npy"), blob)
+
+    columns = [c for c in gdf.columns if c != gdf.geometry.name]
+    for i, col in enumerate(columns):
+        values = gdf[col].to_numpy()[order]
+        if values.dtype == object:
+            values = values.astype(str)
+        np.save(os.path.join(tmp_dir, f"attr_{i}.npy"), values)
+
+    meta = {
+        "version": INDEX_VERSION,
+        "count": int(len(gdf)),
+        "crs": gdf.crs.to_wkt() if gdf.crs is not None else None,
+        "columns": columns,
+        "source": _source_stamp(standard_shp),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"[INFO] 標準メッシュのインデックスを作成しました: {out_dir} ({len(gdf)} cells)")
+    return out_dir
+
+
+class MeshIndex:
+    """パック形式の標準メッシュ。外接矩形で候補セルだけを取り出す"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.crs = CRS.from_wkt(self.meta["crs"]) if self.meta.get("crs") else None
+        self.columns = self.meta["columns"]
+        self.bounds = np.load(os.path.join(path, "bounds.npy"), mmap_mode="r")
+        self.fid = np.load(os.path.join(path, "fid.npy"), mmap_mode="r")
+        self.wkb_offsets = np.load(os.path.join(path, "wkb_offsets.npy"), mmap_mode="r")
+        self.wkb = np.load(os.path.join(path, "wkb.npy"), mmap_mode="r")
+        # 検索範囲を minx で絞り込むため、最大のセル幅を保持しておく
+        self.max_width = float(np.max(self.bounds[:, 2] - self.bounds[:, 0])) if len(self.bounds) else 0.0
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def query(self, bbox):
+        """外接矩形が bbox (minx, miny, maxx, maxy) と重なるセルの位置（元の並び順）を返す"""
+        qminx, qminy, qmaxx, qmaxy = bbox
+        minxs = self.bounds[:, 0]
+        lo = np.searchsorted(minxs, qminx - self.max_width, side="left")
+        hi = np.searchsorted(minxs, qmaxx, side="right")
+        b = np.asarray(self.bounds[lo:hi])
+        hit = (b[:, 2] >= qminx) & (b[:, 1] <= qmaxy) & (b[:, 3] >= qminy)
+        pos = np.nonzero(hit)[0] + lo
+        return pos[np.argsort(self.fid[pos], kind="stable")]
+
+    def read(self, bbox, bbox_crs=None):
+        """
+        bbox と重なるセルを GeoDataFrame として読み出す
+
+        Args:
+            bbox: (minx, miny, maxx, maxy)
+            bbox_crs: bbox の座標系。インデックスの CRS と異なる場合は変換する
+        """
+        if bbox_crs is not None and self.crs is not None and CRS.from_user_input(bbox_crs) != self.crs:
+            transformer = Transformer.from_crs(bbox_crs, self.crs, always_xy=True)
+            bbox = transformer.transform_bounds(*bbox, densify_pts=21)
+
+        pos = self.query(bbox)
+        starts = self.wkb_offsets[pos]
+        ends = self.wkb_offsets[pos + 1]
+        geoms = shapely.from_wkb([self.wkb[s:e].tobytes() for s, e in zip(starts, ends)])
+
+        data = {
+            col: np.load(os.path.join(self.path, f"attr_{i}.npy"), mmap_mode="r")[pos]
+            for i, col in enumerate(self.columns)
+        }
+        return gpd.GeoDataFrame(data, geometry=geoms, crs=self.crs, index=np.asarray(self.fid[pos]))
+
+
+def load_index(standard_shp, build=True):
+    """
+    標準メッシュのインデックスを開く。
+    無い・古い場合は build=True なら作成を試み、作成できなければ None を返す。
+    """
+    path = index_dir(standard_shp)
+    meta_path = os.path.join(path, "meta.json")
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") == INDEX_VERSION and meta.get("source") == _source_stamp(standard_shp):
+                return MeshIndex(path)
+            print(f"[INFO] 標準メッシュのインデックスが古いため再作成します: {path}")
+        except Exception as e:
+            print(f"[WARNING] 標準メッシュのインデックスを読み込めません: {path} - {e}")
+
+    if not build:
+        return None
+    try:
+        return MeshIndex(build_index(standard_shp))
+    except Exception as e:
+        print(f"[WARNING] 標準メッシュのインデックスを作成できませんでした: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='標準地域メッシュのインデックスを作成')
+    parser.add_argument('standard_mesh', help='標準地域メッシュ (.shp)')
+    parser.add_argument('--output', default=None, help='出力ディレクトリ (省略時は <name>.meshidx)')
+    args = parser.parse_args()
+    build_index(args.standard_mesh, args.output)
+
+
+if __name__ == '__main__':
+    main()
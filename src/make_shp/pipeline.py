@@ -2,10 +2,16 @@
 import os
 import argparse
 import glob
-from src.make_shp.add_elevation import main as elevation_main
+import geopandas as gpd
+
+from src.make_shp.add_elevation import mesh_elevation, stat_columns
+from src.make_shp.cell_stats import STAT_NAMES, percentile_name
 from src.make_shp.extract_standard_mesh import extract_cells
-from src.shp_to_asc.mesh_to_asc import convert_mesh_to_asc
-from src.make_shp.generate_mesh import main as generate_mesh_main
+from src.shp_to_asc.mesh_to_asc import convert_values_to_asc
+from src.make_shp.generate_mesh import main as generate_mesh_main, write_mesh
+from src.make_shp.tiled import tiled_mesh_to_asc
+from src.common.stage_cache import run_stage, run_file_stage
+from src.common.profiling import stage
 
 
 def clean_up(output_files, keep_files=None):
@@ -51,97 +57,166 @@ def clean_up(output_files, keep_files=None):
             print(f"[WARNING] ファイルの削除に失敗しました: {file_path} - {e}")
 
 def pipeline(domain_shp, basin_shp, num_cells_x, num_cells_y, points_path, out_dir, 
-             standard_mesh, zcol=None, nodata=None, mesh_id=None):
-    """メッシュ生成パイプラインを実行する"""
+             standard_mesh, zcol=None, nodata=None, mesh_id=None, mesh_level=3,
+             chunksize=None, workers=1, point_cache_dir=None, stats=None, percentiles=None,
+             keep_intermediates=False, stage_cache=None, tile_size=None):
+    """
+    メッシュ生成パイプラインを実行する
+    standard_mesh が None の場合は標準メッシュをメッシュコード計算（mesh_level）で列挙する
+    stats / percentiles を指定すると、標高の統計量ごとに domain_mesh_elev_<統計量>.asc も出力する
+
+    各段階の結果はメモリ上で次の段階へ渡し、ファイルに書き出すのは
+    domain_mesh_elev.shp / domain_mesh_elev.asc（と統計量の ASC）だけとする。
+    標高付与はメッシュのセル番号で集計して配列で受け渡し、セルのポリゴンはシェープを
+    書き出すときにだけ生成する。
+    keep_intermediates=True の場合は中間ファイル（domain_standard_mesh.shp, domain_mesh.shp,
+    basin_mesh.shp, basin_mesh_elev.shp）も書き出して残す。
+
+    stage_cache（common.stage_cache.StageCache）を指定すると、標準メッシュ抽出・メッシュ生成・
+    標高付与・ASC の各段階の結果を入力とパラメータのハッシュで保存し、変わっていない段階は読み込む。
+
+    tile_size を指定すると、メッシュ生成・標高付与・ASC 変換を tile_size セル四方のタイルごとに行い
+    （make_shp.tiled）、メモリ使用量をタイルの大きさに抑える。この場合は ASC だけを出力する。
+    """
     # 出力ファイルを格納する辞書を初期化
     output_files = {}
+    nodata = nodata if nodata is not None else -9999.0
+    os.makedirs(out_dir, exist_ok=True)
     
     try:
+        # 標高の統計量（指定時のみ）。シェープの列名が重複する指定は処理の前に止める
+        stat_names = [s for s in STAT_NAMES if s in (stats or ())]
+        stat_names += [percentile_name(float(q)) for q in (percentiles or ())]
+        stat_fields = stat_columns(stat_names)
+
         # 1) 標準メッシュの抽出
-        extracted = os.path.join(out_dir, "domain_standard_mesh.shp")
-        print(f"Extracting standard mesh cells intersecting domain → {extracted}")
+        extracted_shp = os.path.join(out_dir, "domain_standard_mesh.shp") if keep_intermediates else None
         print(f"Standard mesh path: {standard_mesh}")  # デバッグ用に追加
-        if not os.path.exists(standard_mesh):
+        if standard_mesh is None:
+            print(f"標準メッシュをメッシュコード計算で列挙します (レベル {mesh_level})")
+        elif not os.path.exists(standard_mesh):
             raise FileNotFoundError(f"標準メッシュファイルが見つかりません: {standard_mesh}")
 
-        extract_cells(standard_mesh, domain_shp, extracted, mesh_id)
-        print(f"Extracted standard mesh to {extracted}")
-        output_files['standard_mesh'] = extracted
-        
-        # 2) 標準メッシュに対してメッシュ生成を実行
-        print("\n=== 標準メッシュに対してメッシュ生成を実行 ===")
-        print(f"入力ファイル: {extracted}")
-        
-        # メッシュ生成を実行
-        try:
-            print(f"\n=== メッシュ生成を開始します ===")
-            domain_mesh = os.path.join(out_dir, "domain_mesh.shp")
-            basin_mesh = os.path.join(out_dir, "basin_mesh.shp")
-            
-            # 標準メッシュの抽出結果を入力としてメッシュ生成を実行
-            generate_mesh_main(extracted, basin_shp, num_cells_x, num_cells_y, out_dir)
-            
-            # 出力ファイルの存在を確認
-            if not os.path.exists(domain_mesh):
-                raise FileNotFoundError(f"ドメインメッシュが生成されていません: {domain_mesh}")
-            if not os.path.exists(basin_mesh):
-                print(f"警告: 流域メッシュが生成されていません: {basin_mesh}")
-            
-            # 出力ファイルパスを保存
-            output_files['domain_mesh'] = domain_mesh
-            output_files['basin_mesh'] = basin_mesh
-            
-            print(f"ドメインメッシュ: {domain_mesh}")
-            print(f"流域メッシュ: {basin_mesh}")
+        with stage("extraction"):
+            extracted = run_stage(
+                stage_cache, "extraction",
+                lambda: extract_cells(standard_mesh, gpd.read_file(domain_shp), None, mesh_id, mesh_level=mesh_level),
+                params={"mesh_id": mesh_id, "mesh_level": mesh_level if standard_mesh is None else None},
+                files=[domain_shp, standard_mesh],
+            )
+        if extracted_shp:
+            extracted.to_file(extracted_shp)
+            output_files['standard_mesh'] = extracted_shp
+
+        if tile_size:
+            # メッシュ生成・標高付与・ASC 変換をタイルごとに行う（メッシュのシェープは作らない）
+            print("\n=== タイル処理でメッシュ生成・標高付与・ASC 変換を実行 ===")
+            tile_names = ["domain_mesh_elev.asc"] + [f"domain_mesh_elev_{name}.asc" for name in stat_names]
+            with stage("tiled", cells=num_cells_x * num_cells_y):
+                run_file_stage(
+                    stage_cache, "tiled",
+                    lambda: tiled_mesh_to_asc(
+                        extracted, gpd.read_file(basin_shp), num_cells_x, num_cells_y, points_path, out_dir,
+                        zcol=zcol, nodata=nodata, chunksize=chunksize, cache_dir=point_cache_dir,
+                        stats=stats, percentiles=percentiles, tile_size=tile_size,
+                    ),
+                    out_dir, tile_names,
+                    params={"cells_x": num_cells_x, "cells_y": num_cells_y, "zcol": zcol, "nodata": nodata,
+                            "stats": sorted(stats or ()), "percentiles": [float(q) for q in (percentiles or ())]},
+                    files=[basin_shp, points_path],
+                    upstream=["extraction"],
+                )
+            output_files['domain_mesh_asc'] = os.path.join(out_dir, "domain_mesh_elev.asc")
+            for name in stat_names:
+                output_files[f'domain_mesh_{name}_asc'] = os.path.join(out_dir, f"domain_mesh_elev_{name}.asc")
+        else:
+            # 2) 標準メッシュに対してメッシュ生成を実行
+            print("\n=== 標準メッシュに対してメッシュ生成を実行 ===")
+            try:
+                print(f"\n=== メッシュ生成を開始します ===")
+                with stage("mesh") as s:
+                    mesh = run_stage(
+                        stage_cache, "mesh",
+                        lambda: generate_mesh_main(extracted, basin_shp, num_cells_x, num_cells_y, out_dir=None),
+                        params={"cells_x": num_cells_x, "cells_y": num_cells_y},
+                        files=[basin_shp],
+                        upstream=["extraction"],
+                    )
+                    s.count(cells=mesh.n_cells, basin_cells=len(mesh.basin_ids))
+                print(f"メッシュ: {mesh}")
+                if len(mesh.basin_ids) == 0:
+                    print("警告: 流域メッシュのセルがありません")
+
+                if keep_intermediates:
+                    with stage("write_shp", rows=mesh.n_cells + len(mesh.basin_ids)):
+                        domain_mesh, basin_mesh = write_mesh(mesh, out_dir)
+                    output_files['domain_mesh'] = domain_mesh
+                    output_files['basin_mesh'] = basin_mesh
+                    print(f"ドメインメッシュ: {domain_mesh}")
+                    print(f"流域メッシュ: {basin_mesh}")
             
-        except Exception as e:
-            print(f"[ERROR] メッシュ生成中にエラーが発生しました: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
-
-        # 3) 標高付与
-        print("\n=== 標高付与 ===")
-        elevation_main(domain_mesh, basin_mesh, points_path, out_dir, zcol, nodata)
-
-        # 4) ASC形式に変換
-        # 標高付与後のファイル名を設定（_elevが付く）
-        domain_mesh_elev = os.path.splitext(domain_mesh)[0] + "_elev.shp"
-        domain_mesh_asc = os.path.join(out_dir, "domain_mesh_elev.asc")
-        
-        print(f"\n=== ドメインメッシュをASC形式に変換 ===")
-        print(f"入力ファイル: {domain_mesh_elev}")
-        print(f"出力ファイル: {domain_mesh_asc}")
-        
-        # デバッグ用：シェープファイルのカラム名を表示
-        import geopandas as gpd
-        print("\n=== シェープファイルのカラム名 ===")
-        domain_df = gpd.read_file(domain_mesh_elev)
-        print("domain_mesh columns:", domain_df.columns.tolist())
-        print("Available numeric columns:", 
-              [col for col in domain_df.columns 
-               if domain_df[col].dtype in ['float64', 'int64', 'float32', 'int32']])
-        
-        # 標高データが含まれているフィールドを確認
-        elevation_field = "elevation"
-        if elevation_field not in domain_df.columns:
-            raise ValueError(f"標高データのカラム '{elevation_field}' が見つかりません。利用可能なカラム: {domain_df.columns.tolist()}")
-        
-        convert_mesh_to_asc(
-            input_mesh=domain_mesh_elev,  # _elevが付いたファイルを指定
-            output_asc=domain_mesh_asc,
-            field=elevation_field,
-            nodata=nodata if nodata is not None else -9999.0
-        )
-        output_files['domain_mesh_asc'] = domain_mesh_asc
+            except Exception as e:
+                print(f"[ERROR] メッシュ生成中にエラーが発生しました: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                raise
+
+            # 3) 標高付与
+            print("\n=== 標高付与 ===")
+            with stage("elevation", cells=len(mesh.basin_ids)):
+                values = run_stage(
+                    stage_cache, "elevation",
+                    lambda: mesh_elevation(
+                        mesh, points_path, zcol, nodata,
+                        chunksize=chunksize, workers=workers, cache_dir=point_cache_dir,
+                        stats=stats, percentiles=percentiles,
+                    ),
+                    params={"zcol": zcol, "nodata": nodata, "stats": sorted(stats or ()),
+                            "percentiles": [float(q) for q in (percentiles or ())]},
+                    files=[points_path],
+                    upstream=["mesh"],
+                )
+            # セルのポリゴンはシェープの書き出し時にだけ生成する
+            domain_mesh_elev = os.path.join(out_dir, "domain_mesh_elev.shp")
+            with stage("write_shp", rows=mesh.n_cells):
+                mesh.domain_frame(values).to_file(domain_mesh_elev)
+            mesh.write_sidecar(domain_mesh_elev)
+            output_files['domain_mesh_elev'] = domain_mesh_elev
+            if keep_intermediates:
+                basin_mesh_elev = os.path.join(out_dir, "basin_mesh_elev.shp")
+                with stage("write_shp", rows=len(mesh.basin_ids)):
+                    mesh.basin_frame(values).to_file(basin_mesh_elev)
+                output_files['basin_mesh_elev'] = basin_mesh_elev
+
+            # 4) ASC形式に変換（メモリ上の標高の配列から）
+            domain_mesh_asc = os.path.join(out_dir, "domain_mesh_elev.asc")
+            print(f"\n=== ドメインメッシュをASC形式に変換 ===")
+            print(f"出力ファイル: {domain_mesh_asc}")
+            print("domain_mesh columns:", list(values))
+
+            def write_ascs():
+                convert_values_to_asc(mesh, values["elevation"], domain_mesh_asc, nodata=nodata)
+                for name in stat_names:
+                    convert_values_to_asc(
+                        mesh, values[stat_fields[name]],
+                        os.path.join(out_dir, f"domain_mesh_elev_{name}.asc"), nodata=nodata
+                    )
+
+            asc_names = ["domain_mesh_elev.asc"] + [f"domain_mesh_elev_{name}.asc" for name in stat_names]
+            with stage("asc", cells=mesh.n_cells * len(asc_names)):
+                run_file_stage(stage_cache, "asc", write_ascs, out_dir, asc_names, upstream=["elevation"])
+            output_files['domain_mesh_asc'] = domain_mesh_asc
+            for name in stat_names:
+                output_files[f'domain_mesh_{name}_asc'] = os.path.join(out_dir, f"domain_mesh_elev_{name}.asc")
 
     except Exception as e:
         print(f"[WARNING] 処理中にエラーが発生しました: {e}")
         # エラーが発生しても、これまでに作成されたoutput_filesは保持する
 
-    # 5) 不要な一時ファイルを削除
-    print("\n=== 一時ファイルをクリーンアップします ===")
-    clean_up(output_files)
+    # 5) 不要な一時ファイル（以前の実行で残ったものを含む）を削除
+    if output_files and not keep_intermediates:
+        print("\n=== 一時ファイルをクリーンアップします ===")
+        clean_up(output_files)
     
     # 6) 出力ファイルのパスを表示
     print("\n=== 出力ファイル一覧 ===")
@@ -165,8 +240,16 @@ if __name__ == "__main__":
     ap.add_argument("--zcol",          default=None, help="Z 列名")
     ap.add_argument("--outdir",        default="./outputs", help="出力フォルダ")
     ap.add_argument("--nodata",        type=float, default=None, help="NODATA値 (デフォルト: -9999)")
-    ap.add_argument("--standard-mesh", required=True, help="標準地域メッシュ (.shp) を指定")
+    ap.add_argument("--standard-mesh", default=None, help="標準地域メッシュ (.shp)。省略時はメッシュコード計算で列挙")
+    ap.add_argument("--mesh-level",    type=int, default=3, choices=(1, 2, 3), help="メッシュコード計算時のメッシュレベル (デフォルト: 3)")
     ap.add_argument("--mesh-id",       default=None, help="標準メッシュのID列名 (省略可)")
+    ap.add_argument("--chunksize",     type=int, default=None, help="点群CSVを逐次読み込む行数 (省略時はファイル全体を一度に読み込む)")
+    ap.add_argument("--workers",       type=int, default=1, help="点群ファイルを並列に読み込むプロセス数 (デフォルト: 1)")
+    ap.add_argument("--point-cache",   default=None, help="点群キャッシュの保存先フォルダ (省略時はキャッシュしない)")
+    ap.add_argument("--stats",         nargs="*", choices=STAT_NAMES, default=None, help="平均以外に求める標高の統計量")
+    ap.add_argument("--percentiles",   nargs="*", type=float, default=None, help="求める標高のパーセンタイル (例: 50 で中央値)")
+    ap.add_argument("--keep-intermediates", action="store_true", help="中間ファイル (標準メッシュ抽出・メッシュ・流域メッシュの標高付与結果) も出力する")
+    ap.add_argument("--tile-size",     type=int, default=None, help="タイル処理の一辺のセル数 (指定時のみ。ASC だけを出力する)")
     args = ap.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
@@ -177,8 +260,16 @@ if __name__ == "__main__":
         args.cells_y,
         args.points,
         args.outdir,
-        args.zcol,
-        args.nodata,
-        args.standard_mesh,
-        args.mesh_id
+        standard_mesh=args.standard_mesh,
+        zcol=args.zcol,
+        nodata=args.nodata,
+        mesh_id=args.mesh_id,
+        mesh_level=args.mesh_level,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        point_cache_dir=args.point_cache,
+        stats=args.stats,
+        percentiles=args.percentiles,
+        keep_intermediates=args.keep_intermediates,
+        tile_size=args.tile_size
     )
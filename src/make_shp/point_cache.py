@@ -0,0 +1,147 @@
+# point_cache.py
+"""
+点群ファイルの読み込み結果（x, y, z の配列）をバイナリで保存するキャッシュ
+
+CSV をテキストとして解析し直す代わりに、前回の解析結果をメモリマップで読み込む。
+エントリは次のキーごとにディレクトリを分けて保存する:
+    - 元ファイル（パス・サイズ・更新時刻、または内容のハッシュ）
+    - 変換先の座標参照系
+    - 指定された標高値列
+
+エントリの構成:
+    meta.json   キーの内容、採用した列名、点数
+    x.bin, y.bin, z.bin   float64 のリトルエンディアン生データ（target_crs の座標）
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from pyproj import CRS
+
+CACHE_VERSION = 1
+_DTYPE = np.dtype("<f8")
+_HASH_BLOCK = 8 * 1024 * 1024
+
+
+def _crs_key(crs):
+    if crs is None:
+        return None
+    return CRS.from_user_input(crs).to_wkt()
+
+
+def _file_digest(path):
+    """ファイル内容の SHA-1"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PointCache:
+    """
+    点群ファイルごとの解析結果をディスクに保存・再利用するキャッシュ
+
+    Args:
+        root: キャッシュを保存するディレクトリ
+        use_content_hash: True の場合は内容のハッシュで元ファイルを識別する
+            （コピーや更新時刻の変化に強いが、初回に全体を読む分だけ時間がかかる）
+    """
+
+    def __init__(self, root, use_content_hash=False):
+        self.root = str(root)
+        self.use_content_hash = bool(use_content_hash)
+
+    def __repr__(self):
+        return f"PointCache({self.root!r}, use_content_hash={self.use_content_hash})"
+
+    def _source(self, path):
+        st = os.stat(path)
+        if self.use_content_hash:
+            return {"size": st.st_size, "sha1": _file_digest(path)}
+        return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def key(self, path, target_crs, zcol_arg=None):
+        """エントリのキー（キーの内容とディレクトリ名）を返す"""
+        payload = {
+            "version": CACHE_VERSION,
+            "source": self._source(path),
+            "crs": _crs_key(target_crs),
+            "zcol": zcol_arg or None,
+        }
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        return payload, digest
+
+    def load(self, path, target_crs, zcol_arg=None):
+        """
+        キャッシュ済みの (x, y, z) をメモリマップで返す。無い場合は None。
+        """
+        payload, digest = self.key(path, target_crs, zcol_arg)
+        entry = os.path.join(self.root, digest)
+        meta_path = os.path.join(entry, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("key") != payload:
+                return None
+            n = int(meta["count"])
+            if n == 0:
+                return tuple(np.empty(0, dtype=_DTYPE) for _ in "xyz")
+            return tuple(np.memmap(os.path.join(entry, f"{axis}.bin"), dtype=_DTYPE, mode="r", shape=(n,))
+                         for axis in "xyz")
+        except Exception as e:
+            print(f"[WARNING] 点群キャッシュを読み込めません: {entry} - {e}")
+            return None
+
+    def writer(self, path, target_crs, zcol_arg=None):
+        """チャンクを順に書き込むための CacheWriter を返す"""
+        payload, digest = self.key(path, target_crs, zcol_arg)
+        return CacheWriter(os.path.join(self.root, digest), payload)
+
+
+class CacheWriter:
+    """
+    キャッシュエントリを一時ディレクトリへ追記し、commit() で確定する。
+    途中で失敗した場合は abort() で一時ディレクトリを削除する。
+    """
+
+    def __init__(self, entry, payload):
+        self.entry = entry
+        self.payload = payload
+        self.count = 0
+        self.columns = None
+        self.tmp = f"{entry}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(self.tmp)
+        self._files = [open(os.path.join(self.tmp, f"{axis}.bin"), "wb") for axis in "xyz"]
+
+    def append(self, x, y, z):
+        for f, values in zip(self._files, (x, y, z)):
+            f.write(np.ascontiguousarray(values, dtype=_DTYPE).tobytes())
+        self.count += len(x)
+
+    def _close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def commit(self, columns=None):
+        """書き込みを確定し、エントリとして公開する"""
+        self._close()
+        meta = {"key": self.payload, "count": self.count, "columns": columns}
+        with open(os.path.join(self.tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        try:
+            shutil.rmtree(self.entry, ignore_errors=True)
+            os.replace(self.tmp, self.entry)
+        except OSError:
+            # 同じファイルを別プロセスが先に書き込んだ場合はそちらを使う
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def abort(self):
+        self._close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
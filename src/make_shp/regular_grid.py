@@ -0,0 +1,308 @@
+# regular_grid.py
+"""
+等間隔グリッド（原点・セルサイズ・セル数）を配列ベースで表すモデル
+
+generate_mesh が作るメッシュは (minx, miny, dx, dy, nx, ny) だけで完全に決まるため、
+セルごとの shapely ポリゴンを保持せずにこの情報と NumPy 配列で扱う。
+ポリゴンはシェープファイルを書き出すときにだけ生成する。
+
+セルID（グリッド内のローカルID）はラスタ順:
+    cell_id = row * nx + col   （row=0 が北端 / maxy 側、col=0 が西端 / minx 側）
+そのため値の配列は reshape(ny, nx) するだけで ASC の行列になる。
+
+メッシュのシェープには通しID（GridMesh を参照）を cell_id 列として書き出し、フィーチャもこの順
+（北端の行から）に並ぶ。以前のバージョンの並び（X 方向が外側、各列は南から北）とは異なる。
+計算領域メッシュと流域メッシュで同じセルは同じ cell_id を持つため、
+両者の対応付けはジオメトリの空間結合ではなく cell_id の照合で行える。
+"""
+import json
+import os
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+# 流域クリップ時に一度に生成する矩形の上限（メモリ使用量を抑えるため）
+_CLIP_BLOCK_CELLS = 1_000_000
+
+# メッシュのシェープに書き出すセルIDの列名
+CELL_ID_COLUMN = "cell_id"
+
+
+class RegularGrid:
+    """原点・セルサイズ・セル数で定義される等間隔グリッド"""
+
+    __slots__ = ("minx", "miny", "dx", "dy", "nx", "ny")
+
+    def __init__(self, minx, miny, dx, dy, nx, ny):
+        if nx <= 0 or ny <= 0:
+            raise ValueError(f"セル数は1以上で指定してください: nx={nx}, ny={ny}")
+        if dx <= 0 or dy <= 0:
+            raise ValueError(f"セルサイズは正の値で指定してください: dx={dx}, dy={dy}")
+        self.minx = float(minx)
+        self.miny = float(miny)
+        self.dx = float(dx)
+        self.dy = float(dy)
+        self.nx = int(nx)
+        self.ny = int(ny)
+
+    @classmethod
+    def from_extent(cls, extent, nx, ny):
+        """範囲 (minx, miny, maxx, maxy) をセル数で等分したグリッドを作成"""
+        minx, miny, maxx, maxy = extent
+        return cls(minx, miny, (maxx - minx) / nx, (maxy - miny) / ny, nx, ny)
+
+    def __repr__(self):
+        return (f"RegularGrid(minx={self.minx!r}, miny={self.miny!r}, dx={self.dx!r}, "
+                f"dy={self.dy!r}, nx={self.nx}, ny={self.ny})")
+
+    def __eq__(self, other):
+        if not isinstance(other, RegularGrid):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    # ── 基本プロパティ ───────────────────────────────────────
+    @property
+    def size(self):
+        """総セル数"""
+        return self.nx * self.ny
+
+    @property
+    def shape(self):
+        """ラスタとしての形状 (nrows, ncols)"""
+        return self.ny, self.nx
+
+    @property
+    def maxx(self):
+        return self.minx + self.dx * self.nx
+
+    @property
+    def maxy(self):
+        return self.miny + self.dy * self.ny
+
+    @property
+    def bounds(self):
+        """グリッド全体の範囲 (minx, miny, maxx, maxy)"""
+        return self.minx, self.miny, self.maxx, self.maxy
+
+    def x_edges(self):
+        """X 方向のセル境界座標 (nx + 1,)"""
+        return np.linspace(self.minx, self.maxx, self.nx + 1)
+
+    def y_edges(self):
+        """Y 方向のセル境界座標 (ny + 1,)、北から南の順"""
+        return np.linspace(self.maxy, self.miny, self.ny + 1)
+
+    # ── セルID ↔ 行列番号 ────────────────────────────────────
+    def cell_id(self, row, col):
+        """行・列番号からセルIDを返す"""
+        return np.asarray(row, dtype=np.int64) * self.nx + np.asarray(col, dtype=np.int64)
+
+    def row_col(self, cell_id):
+        """セルIDから (row, col) を返す"""
+        return np.divmod(np.asarray(cell_id, dtype=np.int64), self.nx)
+
+    def _ids(self, cell_ids):
+        if cell_ids is None:
+            return np.arange(self.size, dtype=np.int64)
+        return np.asarray(cell_ids, dtype=np.int64)
+
+    def cell_bounds(self, cell_ids=None):
+        """
+        セルの範囲を配列で返す
+
+        Returns:
+            tuple: (minx, miny, maxx, maxy) の各 ndarray
+        """
+        row, col = self.row_col(self._ids(cell_ids))
+        xs = self.x_edges()
+        ys = self.y_edges()
+        return xs[col], ys[row + 1], xs[col + 1], ys[row]
+
+    def centroids(self, cell_ids=None):
+        """セル中心座標 (cx, cy) を配列で返す"""
+        row, col = self.row_col(self._ids(cell_ids))
+        cx = self.minx + (col + 0.5) * self.dx
+        cy = self.maxy - (row + 0.5) * self.dy
+        return cx, cy
+
+    def locate(self, x, y):
+        """
+        座標を含むセルIDを返す。グリッド外は -1。
+        セルは西側・北側の境界線を含む半開区間として扱う（グリッド東端・南端の境界線上の点は端のセルに含める）。
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        col = np.floor((x - self.minx) / self.dx).astype(np.int64)
+        row = np.floor((self.maxy - y) / self.dy).astype(np.int64)
+        # 外周の境界線上の点は端のセルに含める
+        col[(col == self.nx) & (x <= self.maxx)] = self.nx - 1
+        row[(row == self.ny) & (y >= self.miny)] = self.ny - 1
+        inside = (col >= 0) & (col < self.nx) & (row >= 0) & (row < self.ny)
+        return np.where(inside, row * self.nx + col, -1)
+
+    # ── ジオメトリ（遅延生成） ───────────────────────────────
+    def polygons(self, cell_ids=None):
+        """セルの矩形ポリゴンを shapely 配列として生成"""
+        return shapely.box(*self.cell_bounds(cell_ids))
+
+    def intersecting_ids(self, geom, window=None):
+        """
+        geom と交差するセルIDを昇順で返す（ブロック単位で矩形を生成して判定）
+
+        window: (row0, row1, col0, col1)（両端を含む）を指定すると、その範囲のセルだけを判定する
+        """
+        gminx, gminy, gmaxx, gmaxy = geom.bounds
+        if gmaxx < self.minx or gminx > self.maxx or gmaxy < self.miny or gminy > self.maxy:
+            return np.empty(0, dtype=np.int64)
+
+        # geom の外接矩形にかかる行・列だけを対象にする
+        col0 = max(int(np.floor((gminx - self.minx) / self.dx)) - 1, 0)
+        col1 = min(int(np.floor((gmaxx - self.minx) / self.dx)) + 1, self.nx - 1)
+        row0 = max(int(np.floor((self.maxy - gmaxy) / self.dy)) - 1, 0)
+        row1 = min(int(np.floor((self.maxy - gminy) / self.dy)) + 1, self.ny - 1)
+        if window is not None:
+            row0, row1 = max(row0, window[0]), min(row1, window[1])
+            col0, col1 = max(col0, window[2]), min(col1, window[3])
+            if row0 > row1 or col0 > col1:
+                return np.empty(0, dtype=np.int64)
+        cols = np.arange(col0, col1 + 1, dtype=np.int64)
+
+        shapely.prepare(geom)
+        rows_per_block = max(1, _CLIP_BLOCK_CELLS // len(cols))
+        hits = []
+        for start in range(row0, row1 + 1, rows_per_block):
+            rows = np.arange(start, min(start + rows_per_block, row1 + 1), dtype=np.int64)
+            ids = (rows[:, None] * self.nx + cols[None, :]).ravel()
+            mask = shapely.intersects(geom, self.polygons(ids))
+            hits.append(ids[mask])
+        return np.concatenate(hits)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{k: d[k] for k in cls.__slots__})
+
+
+class GridMesh:
+    """
+    計算領域メッシュと流域メッシュをまとめて表すモデル
+
+    - grids: ドメインのフィーチャごとの RegularGrid
+    - basin_ids: 流域メッシュに含まれるセルの通しID（昇順）
+    通しIDは grids の順にローカルIDを連結したもの（grid k のセルは offsets[k] から始まる）。
+    """
+
+    __slots__ = ("grids", "feature_ids", "basin_ids", "crs")
+
+    SIDECAR_SUFFIX = ".grid.json"
+
+    def __init__(self, grids, feature_ids, basin_ids, crs):
+        if len(grids) != len(feature_ids):
+            raise ValueError("grids と feature_ids の数が一致しません")
+        self.grids = list(grids)
+        self.feature_ids = list(feature_ids)
+        self.basin_ids = np.asarray(basin_ids, dtype=np.int64)
+        self.crs = crs
+
+    def __repr__(self):
+        return (f"GridMesh(grids={len(self.grids)}, cells={self.n_cells}, "
+                f"basin_cells={len(self.basin_ids)})")
+
+    @property
+    def offsets(self):
+        """各グリッドの通しIDの開始位置 (len(grids) + 1,)"""
+        return np.concatenate([[0], np.cumsum([g.size for g in self.grids])]).astype(np.int64)
+
+    @property
+    def n_cells(self):
+        return int(sum(g.size for g in self.grids))
+
+    @property
+    def is_single_grid(self):
+        """1枚の等間隔グリッドで構成されているか"""
+        return len(self.grids) == 1
+
+    @property
+    def grid(self):
+        """単一グリッドの場合にその RegularGrid を返す"""
+        if not self.is_single_grid:
+            raise ValueError(f"メッシュが複数のグリッド({len(self.grids)})で構成されています")
+        return self.grids[0]
+
+    # ── GeoDataFrame 化（シェープ出力時のみ） ────────────────
+    def _frame(self, ids, values=None):
+        ids = np.asarray(ids, dtype=np.int64)
+        offsets = self.offsets
+        part = np.searchsorted(offsets, ids, side="right") - 1
+        polys = np.empty(len(ids), dtype=object)
+        for k, grid in enumerate(self.grids):
+            sel = part == k
+            if sel.any():
+                polys[sel] = grid.polygons(ids[sel] - offsets[k])
+        if values is None:
+            columns = {CELL_ID_COLUMN: ids, "feature_id": np.asarray(self.feature_ids)[part]}
+        else:
+            columns = {CELL_ID_COLUMN: ids}
+            columns.update((name, np.asarray(v)[ids]) for name, v in values.items())
+        return gpd.GeoDataFrame(columns, geometry=polys, crs=self.crs)
+
+    def domain_frame(self, values=None):
+        """
+        計算領域メッシュの GeoDataFrame を生成
+
+        values（列名 → 通しID順の全セルの配列、add_elevation.mesh_elevation の戻り値）を指定すると
+        feature_id の代わりにその列を持つ（標高付与済みメッシュ）
+        """
+        return self._frame(np.arange(self.n_cells, dtype=np.int64), values)
+
+    def basin_frame(self, values=None):
+        """流域メッシュの GeoDataFrame を生成（values は domain_frame と同じ）"""
+        return self._frame(self.basin_ids, values)
+
+    # ── サイドカー（グリッド定義）の入出力 ─────────────────────
+    @classmethod
+    def sidecar_path(cls, shp_path):
+        return os.path.splitext(str(shp_path))[0] + cls.SIDECAR_SUFFIX
+
+    def write_sidecar(self, shp_path):
+        """シェープファイルの隣にグリッド定義 (<name>.grid.json) を書き出す"""
+        crs = self.crs
+        if crs is not None and hasattr(crs, "to_wkt"):
+            crs = crs.to_wkt()
+        payload = {
+            "crs": crs,
+            "grids": [dict(g.to_dict(), feature_id=_jsonable(fid))
+                      for g, fid in zip(self.grids, self.feature_ids)],
+            "basin_cells": int(len(self.basin_ids)),
+        }
+        path = self.sidecar_path(shp_path)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        return path
+
+    @classmethod
+    def read_sidecar(cls, shp_path, basin_ids=None):
+        """
+        シェープファイルに対応するグリッド定義を読み込む。
+        サイドカーが無い場合は None を返す。
+        """
+        path = cls.sidecar_path(shp_path)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        grids = [RegularGrid.from_dict(g) for g in payload["grids"]]
+        feature_ids = [g.get("feature_id") for g in payload["grids"]]
+        if basin_ids is None:
+            basin_ids = np.empty(0, dtype=np.int64)
+        return cls(grids, feature_ids, basin_ids, payload.get("crs"))
+
+
+def _jsonable(value):
+    """NumPy のスカラーなどを JSON に書ける型へ変換"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,281 @@
+# tiled.py
+"""
+計算領域をタイルに分けて、メッシュ生成・標高付与・ASC 出力を行う（全国規模のグリッド用）
+
+通常の処理（generate_mesh → add_elevation → mesh_to_asc）はメッシュ全体・点群全体・ラスタ全体を
+同時にメモリに置く。ここではグリッドを tile_size × tile_size セルのタイルに分け、
+タイルごとに処理して1つの ASC に行順で書き足すため、メモリ使用量はタイルの大きさで決まる。
+
+    1. 点群を chunksize 行ずつ読み、点を含むセルのタイルごとに一時ファイルへ振り分ける
+       （セルID と標高だけを保存する。グリッド外の点は捨てる）
+    2. タイルの行ごとに、各タイルについて
+         - 流域と交差するセルを判定する（セルの矩形はそのタイルの分だけ生成する）
+         - そのタイルの点だけを読み込み、セルごとに集計する（CellAccumulator）
+         - 値を ASC の書式に整形して一時ファイルに書き出す
+       タイルの行がそろったら、各タイルの一時ファイルから1行ずつ読んでつなぎ、ASC に書き足す
+       （メモリに置くのは1タイル分の値と ASC の1行だけで、グリッドの幅 × タイルの大きさにはならない）
+
+    - 点は座標からセルを1つだけ決めて振り分けるため、タイルの境界付近の点も重複・欠落しない
+      （タイルの境界はセルの境界に一致するので、点の読み込みにタイルの外周の余白は不要）
+    - 出力（ヘッダ・値・書式）は通常の処理の domain_mesh_elev.asc と同じ
+    - 失敗した場合は書きかけの ASC を削除して例外を送出する（途中までの ASC が後続の処理に渡らないように、
+      開始時に以前の出力も削除する）
+    - メッシュのシェープ（domain_mesh_elev.shp など）は出力しない
+    - 窪地処理・流向はグリッド全体の処理のため、つなぎ合わせた ASC に対して通常どおり行う
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from src.common.profiling import stage
+from src.make_shp.add_elevation import iter_point_chunks, DEFAULT_CHUNKSIZE, DEFAULT_NODATA
+from src.make_shp.cell_stats import CellAccumulator, STAT_NAMES, percentile_name
+from src.make_shp.point_cache import PointCache
+from src.make_shp.regular_grid import RegularGrid
+from src.shp_to_asc.core import GridAsciiWriter
+
+# タイルの一辺のセル数の既定値
+DEFAULT_TILE_SIZE = 1024
+
+_CELL_DTYPE = np.dtype("<i8")
+_Z_DTYPE = np.dtype("<f8")
+
+
+class TileLayout:
+    """グリッドを tile_size × tile_size セルのタイルに分けた配置（北西から行順に番号を付ける）"""
+
+    def __init__(self, grid, tile_size=DEFAULT_TILE_SIZE):
+        if tile_size <= 0:
+            raise ValueError(f"タイルの大きさは1以上で指定してください: {tile_size}")
+        self.grid = grid
+        self.tile_size = int(tile_size)
+        self.n_tile_rows = -(-grid.ny // self.tile_size)
+        self.n_tile_cols = -(-grid.nx // self.tile_size)
+
+    def __repr__(self):
+        return f"TileLayout({self.grid!r}, tile_size={self.tile_size})"
+
+    def __len__(self):
+        return self.n_tile_rows * self.n_tile_cols
+
+    def tile_of(self, cell_ids):
+        """セルIDを含むタイルの番号"""
+        row, col = self.grid.row_col(cell_ids)
+        return (row // self.tile_size) * self.n_tile_cols + col // self.tile_size
+
+    def window(self, tile):
+        """タイルの行・列の範囲 (row0, row1, col0, col1)（row1 / col1 は含まない）"""
+        tr, tc = divmod(int(tile), self.n_tile_cols)
+        row0, col0 = tr * self.tile_size, tc * self.tile_size
+        return row0, min(row0 + self.tile_size, self.grid.ny), col0, min(col0 + self.tile_size, self.grid.nx)
+
+
+class PointBuckets:
+    """
+    点をタイルごとの一時ファイル（セルID・標高）に振り分けて保存する
+
+    tile_<n>.cell / tile_<n>.z に追記し、read(tile) でそのタイルの点だけを読み込む。
+    """
+
+    def __init__(self, layout, root):
+        self.layout = layout
+        self.root = str(root)
+        self.counts = np.zeros(len(layout), dtype=np.int64)
+
+    def _path(self, tile, kind):
+        return os.path.join(self.root, f"tile_{tile}.{kind}")
+
+    def add(self, x, y, z):
+        """点を振り分ける。グリッド外の点は捨てる"""
+        cid = self.layout.grid.locate(x, y)
+        inside = cid >= 0
+        if not inside.any():
+            return
+        cid, z = cid[inside], np.asarray(z, dtype=np.float64)[inside]
+        tiles = self.layout.tile_of(cid)
+        # タイルごとにまとめる（同じタイル内では読み込み順を保つ）
+        order = np.argsort(tiles, kind="stable")
+        tiles, cid, z = tiles[order], cid[order], z[order]
+        starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]])
+        ends = np.r_[starts[1:], tiles.size]
+        for s, e in zip(starts, ends):
+            t = int(tiles[s])
+            with open(self._path(t, "cell"), "ab") as f:
+                f.write(cid[s:e].astype(_CELL_DTYPE).tobytes())
+            with open(self._path(t, "z"), "ab") as f:
+                f.write(z[s:e].astype(_Z_DTYPE).tobytes())
+            self.counts[t] += e - s
+
+    def read(self, tile):
+        """タイルの (セルID, 標高)"""
+        if self.counts[tile] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return (np.fromfile(self._path(tile, "cell"), dtype=_CELL_DTYPE),
+                np.fromfile(self._path(tile, "z"), dtype=_Z_DTYPE))
+
+
+def _grid_for(domain_gdf, cells_x, cells_y):
+    """generate_mesh.build_mesh と同じく、最初の有効なフィーチャの範囲を等分したグリッド"""
+    valid = domain_gdf[domain_gdf.geometry.notna() & domain_gdf.geometry.is_valid]
+    if valid.empty:
+        raise ValueError("有効なジオメトリが含まれていません")
+    if len(valid) > 1:
+        raise ValueError(f"タイル処理は計算領域が1フィーチャの場合のみ使えます: {len(valid)} フィーチャ")
+    return RegularGrid.from_extent(valid.geometry.iloc[0].bounds, cells_x, cells_y)
+
+
+def tiled_mesh_to_asc(domain_gdf, basin_gdf, num_cells_x, num_cells_y, points_path, out_dir,
+                      zcol=None, nodata=None, chunksize=None, cache_dir=None, stats=None, percentiles=None,
+                      tile_size=DEFAULT_TILE_SIZE):
+    """
+    タイルごとにメッシュ生成・標高付与を行い、domain_mesh_elev.asc（と統計量の ASC）を書き出す
+
+    Args:
+        domain_gdf: 計算領域（標準メッシュの抽出結果）の GeoDataFrame（1フィーチャ）
+        basin_gdf: 流域ポリゴンの GeoDataFrame
+        num_cells_x, num_cells_y: セル数
+        points_path: 点群ファイルのパス（またはそのリスト）
+        out_dir: 出力フォルダ
+        chunksize: 点群CSVを読み込む行数（None の場合は DEFAULT_CHUNKSIZE）
+        cache_dir: 点群キャッシュの保存先
+        stats, percentiles: pipeline と同じ
+        tile_size: タイルの一辺のセル数
+
+    Returns:
+        dict: {'domain_mesh_asc': パス, 'domain_mesh_<統計量>_asc': パス, ...}
+    """
+    nodata = nodata if nodata is not None else DEFAULT_NODATA
+    paths = [points_path] if isinstance(points_path, str) else list(points_path)
+    crs = domain_gdf.crs
+    basin_geom = basin_gdf.to_crs(crs).unary_union
+    grid = _grid_for(domain_gdf, num_cells_x, num_cells_y)
+    layout = TileLayout(grid, tile_size)
+    print(f"[INFO] タイル処理: {grid.nx} x {grid.ny} セルを {layout.n_tile_cols} x {layout.n_tile_rows} タイル"
+          f"（{layout.tile_size} セル四方）に分けて処理します")
+
+    stat_names = [s for s in STAT_NAMES if s in (stats or ())]
+    stat_names += [percentile_name(float(q)) for q in (percentiles or ())]
+    outputs = {'domain_mesh_asc': os.path.join(out_dir, "domain_mesh_elev.asc")}
+    for name in stat_names:
+        outputs[f'domain_mesh_{name}_asc'] = os.path.join(out_dir, f"domain_mesh_elev_{name}.asc")
+
+    os.makedirs(out_dir, exist_ok=True)
+    # 以前の実行の出力が残っていると、失敗したときにそれが後続の処理に使われるため先に消す
+    _remove_outputs(outputs.values())
+    bucket_dir = tempfile.mkdtemp(prefix=".tiles_", dir=out_dir)
+    try:
+        # 1) 点群をタイルごとに振り分ける
+        buckets = PointBuckets(layout, bucket_dir)
+        cache = PointCache(cache_dir) if cache_dir else None
+        n_points = 0
+        with stage("bucket_points") as s:
+            for path in paths:
+                for x, y, z in iter_point_chunks(path, crs, zcol, chunksize or DEFAULT_CHUNKSIZE, cache):
+                    buckets.add(x, y, z)
+                    n_points += x.size
+            s.count(points=n_points)
+        if n_points == 0:
+            raise ValueError("有効なデータが読み込めませんでした")
+        print(f"点群データの点数: {n_points}（グリッド内: {int(buckets.counts.sum())}）")
+
+        # 2) タイルの行ごとに集計して ASC に書き足す
+        with contextlib.ExitStack() as stack:
+            writers = [stack.enter_context(GridAsciiWriter(grid, p, nodata=nodata, crs=crs))
+                       for p in outputs.values()]
+            n_basin = 0
+            with stage("write_tiles", tiles=len(layout)) as s:
+                for tr in range(layout.n_tile_rows):
+                    n_basin += _write_tile_row(grid, layout, tr, basin_geom, buckets, writers, bucket_dir,
+                                               nodata, stats, percentiles, stat_names)
+                    print(f"  タイル行 {tr + 1}/{layout.n_tile_rows} を書き出しました")
+                s.count(basin_cells=n_basin)
+        print(f"流域メッシュのセル数: {n_basin}")
+    except BaseException:
+        # 書きかけの ASC を残さない
+        _remove_outputs(outputs.values())
+        raise
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+
+    for p in outputs.values():
+        print(f"出力ファイル: {p}")
+    return outputs
+
+
+def _remove_outputs(paths):
+    """ASC と .prj を削除する（無ければ何もしない）"""
+    for p in paths:
+        for f in (p, os.path.splitext(p)[0] + ".prj"):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def _write_tile_row(grid, layout, tile_row, basin_geom, buckets, writers, work_dir, nodata, stats, percentiles,
+                    stat_names):
+    """
+    タイルの1行分を ASC に書き足す
+
+    各タイルの値を整形して出力ごとの一時ファイルに書き出し、タイルの行がそろったら
+    一時ファイルを1行ずつ読んで左のタイルから順につなぐ。
+
+    Returns:
+        int: 流域セル数
+    """
+    tiles = range(tile_row * layout.n_tile_cols, (tile_row + 1) * layout.n_tile_cols)
+    row0, row1, _, _ = layout.window(tiles[0])
+
+    def segment(k, t):
+        return os.path.join(work_dir, f"row_{k}_{t}.txt")
+
+    n_basin = 0
+    for t in tiles:
+        values, n = _tile_values(grid, layout, t, basin_geom, buckets, nodata, stats, percentiles, stat_names)
+        for k, writer in enumerate(writers):
+            with open(segment(k, t), "wb") as f:
+                f.write(writer.format(values[k]))
+        n_basin += n
+
+    for k, writer in enumerate(writers):
+        with contextlib.ExitStack() as stack:
+            files = [stack.enter_context(open(segment(k, t), "rb")) for t in tiles]
+            for _ in range(row1 - row0):
+                # 各タイルの行末の改行を区切りの空白に置き換えてつなぐ
+                writer.write_formatted(b" ".join(f.readline()[:-1] for f in files) + b"\n", 1)
+        for t in tiles:
+            os.remove(segment(k, t))
+    return n_basin
+
+
+def _tile_values(grid, layout, tile, basin_geom, buckets, nodata, stats, percentiles, stat_names):
+    """
+    1タイル分の標高（と統計量）を求める
+
+    Returns:
+        tuple: ((出力数, 行数, 列数) の値, 流域セル数)
+    """
+    row0, row1, col0, col1 = layout.window(tile)
+    h, w = row1 - row0, col1 - col0
+    values = np.full((1 + len(stat_names), h, w), nodata, dtype=np.float64)
+
+    basin_ids = grid.intersecting_ids(basin_geom, window=(row0, row1 - 1, col0, col1 - 1))
+    if basin_ids.size == 0:
+        return values, 0
+    in_basin = np.zeros(h * w, dtype=bool)
+    brow, bcol = grid.row_col(basin_ids)
+    in_basin[(brow - row0) * w + (bcol - col0)] = True
+
+    cells, z = buckets.read(tile)
+    row, col = grid.row_col(cells)
+    local = (row - row0) * w + (col - col0)
+    keep = in_basin[local]
+    acc = CellAccumulator(h * w, stats, percentiles)
+    acc.add(local[keep], z[keep])
+
+    values[0] = np.where(in_basin, acc.mean(nodata), nodata).reshape(h, w)
+    statistics = acc.statistics(nodata)
+    for i, name in enumerate(stat_names, start=1):
+        values[i] = np.where(in_basin, statistics[name], nodata).reshape(h, w)
+    return values, int(basin_ids.size)
@@ -2,9 +2,10 @@
 """
 複数の点群ファイルの共通の標高値列を返す。
 見つからない場合はエラーを返す。
+列はヘッダと先頭行のサンプルから判定する（ファイル全体は読み込まない）。
 """
-import pandas as pd
 from src.make_shp.add_elevation import get_xy_columns, get_z_candidates
+from src.make_shp.csv_schema import sniff_csv
 
 def get_zcol_list(files) -> list:
     """
@@ -27,9 +28,9 @@ def get_zcol_list(files) -> list:
     
     # 各ファイルの標高値列候補を取得
     for file in files:
-        # ファイルを読み込む
+        # ヘッダと先頭行のサンプルを読み込む
         try:
-            points = pd.read_csv(file)
+            points = sniff_csv(file)
         except Exception as e:
             raise ValueError(f"ファイルの読み込みに失敗しました: {file}\n{str(e)}")
             
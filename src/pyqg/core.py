@@ -6,6 +6,7 @@ from pathlib import Path
 # 自作モジュールのインポート
 from src.pyqg.processor import process_dem
 from src.pyqg.processor import MIN_SLOPE, THRESHOLD  # デフォルト値をインポート
+from src.pyqg.processor import FILL_BACKENDS, DIRECTION_BACKENDS, TRANSLATE_BACKENDS
 
 def main():
     """
@@ -25,6 +26,26 @@ def main():
                        type=int, 
                        default=THRESHOLD,
                        help=f'Threshold for channel network (default: {THRESHOLD})')
+    parser.add_argument('--fill-backend',
+                       choices=FILL_BACKENDS,
+                       default='saga',
+                       help='Sink filling implementation (default: saga)')
+    parser.add_argument('--direction-backend',
+                       choices=DIRECTION_BACKENDS,
+                       default='saga',
+                       help='Flow direction implementation (default: saga)')
+    parser.add_argument('--use-worker',
+                       action='store_true',
+                       help='Run QGIS algorithms in one persistent PyQGIS worker instead of one qgis_process per step')
+    parser.add_argument('--qgis-python-path',
+                       help='Path to the QGIS Python launcher (python-qgis-ltr.bat) used by --use-worker')
+    parser.add_argument('--use-model',
+                       action='store_true',
+                       help='Run the whole chain as one Processing model (models/dem_chain.model3)')
+    parser.add_argument('--translate-backend',
+                       choices=TRANSLATE_BACKENDS,
+                       default='rasterio',
+                       help='SDAT to ASC conversion (default: rasterio, in-process)')
     
     # 引数のパース
     args = parser.parse_args()
@@ -38,7 +59,13 @@ def main():
         input_path=args.input_file,
         output_dir=output_dir,
         min_slope=args.min_slope,
-        threshold=args.threshold
+        threshold=args.threshold,
+        fill_backend=args.fill_backend,
+        direction_backend=args.direction_backend,
+        use_worker=args.use_worker,
+        qgis_python_path=args.qgis_python_path,
+        use_model=args.use_model,
+        translate_backend=args.translate_backend
     )
     
     # エラーチェック
@@ -0,0 +1,179 @@
+# flow_direction.py
+"""
+D8 流向を NumPy 配列に対して求める
+
+sagang:channelnetworkanddrainagebasins の DIRECTION と同じ符号で出力する:
+    0: 北, 1: 北東, 2: 東, 3: 南東, 4: 南, 5: 南西, 6: 西, 7: 北西, -1: 流出先なし / NoData
+
+    - 8近傍それぞれの勾配 (z - z近傍) / セル間距離 をまとめて計算し、最も急な下り勾配の方向を選ぶ
+      （同じ勾配の場合は上の番号の小さい方。グリッド外・NoData の近傍は候補にしない）
+    - 下り勾配の近傍が無いセルは、resolve_flats=True の場合、同じ標高でつながる平坦部を
+      流出先のあるセルから幅優先でたどり、近い方のセルへ向ける（同じ距離なら番号の小さい方）。
+      グリッドの外周・NoData に接するセルは -1 のまま流出口（グリッド外へ流れ出るセル）として扱い、
+      平坦部はそこからもたどる（MINSLOPE = 0 で窪地処理した DEM の外周の平坦部も流れ出る）。
+      MINSLOPE > 0 で窪地処理した DEM には平坦部が無いため、SAGA の出力と一致する
+"""
+import argparse
+
+import numpy as np
+
+from src.pyqg.priority_flood import NEIGHBORS, neighbor_lengths, valid_mask, read_raster, copy_prj
+from src.shp_to_asc.asc_reader import parse_asc
+from src.shp_to_asc.asc_writer import write_asc
+
+NO_DIRECTION = -1
+
+# 出力 ASC の書式
+DIRECTION_FMT = "%2d"
+
+
+def _pad(values, fill):
+    out = np.full((values.shape[0] + 2, values.shape[1] + 2), fill, dtype=values.dtype)
+    out[1:-1, 1:-1] = values
+    return out
+
+
+def flow_direction(dem, dx, dy=None, nodata=None, resolve_flats=True):
+    """
+    D8 流向を求める
+
+    Args:
+        dem: (nrows, ncols) の標高配列（1行目が北端）
+        dx, dy: セルサイズ（dy を省略した場合は dx と同じ）
+        nodata: NoData 値。NaN は常に NoData として扱う
+        resolve_flats: 平坦部のセルにも流向を与える
+
+    Returns:
+        np.ndarray: int8 の流向（0～7、流出先なし・NoData は -1）
+    """
+    dem = np.asarray(dem, dtype=np.float64)
+    if dem.ndim != 2:
+        raise ValueError(f"2次元配列を指定してください: shape={dem.shape}")
+    nrows, ncols = dem.shape
+    valid = valid_mask(dem, nodata)
+    # NoData と外周は NaN にして比較から外す
+    z = _pad(np.where(valid, dem, np.nan), np.nan)
+    center = z[1:-1, 1:-1]
+
+    direction = np.full((nrows, ncols), NO_DIRECTION, dtype=np.int8)
+    steepest = np.zeros((nrows, ncols), dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        for i, ((dr, dc), length) in enumerate(zip(NEIGHBORS, neighbor_lengths(dx, dy))):
+            slope = (center - z[1 + dr:nrows + 1 + dr, 1 + dc:ncols + 1 + dc]) / length
+            steeper = slope > steepest
+            direction[steeper] = i
+            steepest[steeper] = slope[steeper]
+
+    if resolve_flats:
+        _resolve_flats(z, direction, edge_cells(valid))
+    return direction
+
+
+def edge_cells(valid):
+    """グリッドの外周または NoData に接する有効なセル（流出口になり得るセル）の真偽配列"""
+    nrows, ncols = valid.shape
+    padded = _pad(valid, False)
+    edge = np.zeros_like(valid)
+    for dr, dc in NEIGHBORS:
+        edge |= ~padded[1 + dr:nrows + 1 + dr, 1 + dc:ncols + 1 + dc]
+    return edge & valid
+
+
+def dead_ends(direction, valid):
+    """
+    流出先が無く、外周・NoData にも接していない有効なセル（流れが途中で止まるセル）の真偽配列
+
+    流向は常に低いセルか、流出口に近い同じ標高のセルへ向くため、この配列がすべて False なら
+    すべての有効なセルからの流れは外周または NoData に達する。
+    """
+    return valid & (direction < 0) & ~edge_cells(valid)
+
+
+def _resolve_flats(z, direction, outlets):
+    """流出先の無いセルを、同じ標高の隣接セルのうち流出先に近いものへ向ける（direction を更新）"""
+    nrows, ncols = direction.shape
+    width = ncols + 2
+    flat_z = z.ravel()
+    # 外周・NoData に接するセルは -1 のまま流出口とする
+    resolved = _pad((direction >= 0) | outlets, False).ravel()
+    rows, cols = np.nonzero((direction < 0) & ~outlets & np.isfinite(z[1:-1, 1:-1]))
+    todo = (rows + 1) * width + cols + 1
+    offsets = [dr * width + dc for dr, dc in NEIGHBORS]
+
+    # 1周ごとに、前の周までに流向が決まったセルの隣だけを決める（幅優先）
+    while todo.size:
+        chosen = np.full(todo.size, NO_DIRECTION, dtype=np.int8)
+        for i, off in reversed(list(enumerate(offsets))):
+            n = todo + off
+            hit = resolved[n] & (flat_z[n] == flat_z[todo])
+            chosen[hit] = i
+        done = chosen >= 0
+        if not done.any():
+            break
+        cells = todo[done]
+        direction[cells // width - 1, cells % width - 1] = chosen[done]
+        resolved[cells] = True
+        todo = todo[~done]
+
+
+def flow_direction_asc(dem_path, output_path, grid_path=None, resolve_flats=True, fmt=DIRECTION_FMT):
+    """
+    DEM から D8 流向を求め、ASC として書き出す
+
+    Args:
+        dem_path: 窪地処理済みの DEM (.asc / .sdat など)
+        output_path: 出力 (.asc)。NoData 値は -1
+        grid_path: 範囲・セルサイズを取る ASC（dem_path が ASC でない場合に必要）
+        resolve_flats: 平坦部のセルにも流向を与える
+        fmt: 値の書式
+
+    Returns:
+        str: output_path
+    """
+    grid_path = dem_path if grid_path is None else grid_path
+    if not str(grid_path).lower().endswith(".asc"):
+        raise ValueError(f"範囲・セルサイズを取る ASC を指定してください: {grid_path}")
+    grid = parse_asc(grid_path)
+    h = grid.header
+    if grid_path == dem_path:
+        dem, nodata = grid.data, grid.nodata
+    else:
+        dem, nodata = read_raster(dem_path)
+        if dem.shape != grid.shape:
+            raise ValueError(f"DEM の大きさが一致しません: {dem.shape} != {grid.shape}")
+    # SAGA と同じく単精度のグリッドとして勾配を求める
+    dem = np.asarray(dem, dtype=np.float32)
+    direction = flow_direction(dem, h["dx"], h["dy"], nodata=nodata, resolve_flats=resolve_flats)
+    if resolve_flats:
+        n_dead = int(np.count_nonzero(dead_ends(direction, valid_mask(dem, nodata))))
+        if n_dead:
+            print(f"[WARN] 流出先の無いセルが {n_dead} あります（窪地処理されていない DEM の可能性があります）")
+    write_asc(output_path, direction, h["xllcorner"], h["yllcorner"], h["dx"], h["dy"], NO_DIRECTION, fmt=fmt)
+    copy_prj(grid_path, output_path)
+    return str(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy による D8 流向")
+    parser.add_argument("input", help="窪地処理済みの DEM (.asc)")
+    parser.add_argument("output", help="出力 (.asc)")
+    parser.add_argument("--keep-flats", action="store_true", help="平坦部のセルを流出先なし (-1) のままにする")
+    parser.add_argument("--compare", help="比較する SAGA の出力 (direction.sdat / direction.asc)")
+    args = parser.parse_args()
+
+    flow_direction_asc(args.input, args.output, resolve_flats=not args.keep_flats)
+    print(f"[INFO] 流向の出力: {args.output}")
+
+    if args.compare:
+        ours, _ = read_raster(args.output)
+        ref, ref_nodata = read_raster(args.compare)
+        if ours.shape != ref.shape:
+            raise ValueError(f"ラスタの大きさが一致しません: {ours.shape} != {ref.shape}")
+        if ref_nodata is not None:
+            ref = np.where(ref == ref_nodata, NO_DIRECTION, ref)
+        mismatch = int(np.count_nonzero(ours != ref))
+        print(f"[INFO] {args.compare} との比較: 流向の不一致 {mismatch} / {ours.size} セル")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# priority_flood.py
+"""
+窪地処理（Wang & Liu の priority-flood）を NumPy 配列に対して行う
+
+sagang:fillsinksxxlwangliu（SAGA の Fill Sinks XXL (Wang & Liu)）と同じ手順:
+    1) 外周のセル（グリッド外または NoData に隣接する有効セル）を元の標高で確定し、キューに入れる
+    2) キューから最も低いセルを取り出し、未確定の8近傍を確定してキューに入れる。
+       MINSLOPE > 0 の場合、近傍の標高は「取り出したセル + tan(MINSLOPE) × セル間距離」
+       より低ければその値まで嵩上げする（MINSLOPE <= 0 の場合は取り出したセルと同じ高さまで）
+    3) キューが空になるまで繰り返す
+
+    - MINSLOPE の単位は SAGA と同じく度
+    - 確定した値は dtype（既定は SAGA の出力と同じ float32）に丸めてから次の計算に使う
+    - 同じ標高のセルはセル位置（行優先）の順に取り出す
+"""
+import argparse
+import heapq
+import math
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+from src.shp_to_asc.asc_reader import parse_asc
+from src.shp_to_asc.asc_writer import write_asc
+
+MIN_SLOPE = 0.1
+
+# 出力 ASC の書式（MINSLOPE による嵩上げ分が丸めで消えないよう小数6桁）
+FILLED_FMT = "%14.6f"
+
+# 8近傍の (行, 列) のずれ。SAGA と同じく北から時計回り（1行目が北端）
+NEIGHBORS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+_TYPECODES = {np.dtype(np.float32): "f", np.dtype(np.float64): "d"}
+
+
+def neighbor_lengths(dx, dy=None):
+    """NEIGHBORS の順のセル間距離（斜めは対角線の長さ）"""
+    dy = dx if dy is None else dy
+    diag = math.hypot(dx, dy)
+    return tuple(diag if dr and dc else (dx if dc else dy) for dr, dc in NEIGHBORS)
+
+
+def valid_mask(dem, nodata=None):
+    """有効なセル（有限かつ NoData でない）の真偽配列"""
+    valid = np.isfinite(dem)
+    if nodata is not None:
+        valid &= dem != nodata
+    return valid
+
+
+def fill_sinks(dem, dx, dy=None, min_slope=MIN_SLOPE, nodata=None, dtype=np.float32):
+    """
+    DEM の窪地を埋める
+
+    Args:
+        dem: (nrows, ncols) の標高配列（1行目が北端）
+        dx, dy: セルサイズ（dy を省略した場合は dx と同じ）
+        min_slope: 最小勾配 [度]
+        nodata: NoData 値。NaN は常に NoData として扱う
+        dtype: 計算・出力の型（np.float32 または np.float64）
+
+    Returns:
+        np.ndarray: 窪地処理済みの標高（dtype）。NoData のセルは nodata（None の場合は NaN）
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in _TYPECODES:
+        raise ValueError(f"未対応の型です: {dtype}（float32 または float64 を指定してください）")
+    dem = np.asarray(dem, dtype=np.float64)
+    if dem.ndim != 2:
+        raise ValueError(f"2次元配列を指定してください: shape={dem.shape}")
+    nrows, ncols = dem.shape
+    valid = valid_mask(dem, nodata)
+
+    # 外周に NoData の枠を付け、近傍を1次元の位置のずれだけで引けるようにする
+    width = ncols + 2
+    padded = np.zeros((nrows + 2, width), dtype=bool)
+    padded[1:-1, 1:-1] = valid
+    edge = np.zeros_like(valid)
+    for dr, dc in NEIGHBORS:
+        edge |= ~padded[1 + dr:nrows + 1 + dr, 1 + dc:ncols + 1 + dc]
+    edge &= valid
+
+    elev_grid = np.zeros((nrows + 2, width), dtype=np.float64)
+    elev_grid[1:-1, 1:-1] = np.where(valid, dem, 0.0)
+    elev = elev_grid.ravel().tolist()
+    # 確定前のセル（1: 未確定）。外周のセルは最初に確定する
+    pending = padded.copy()
+    pending[1:-1, 1:-1] &= ~edge
+    pending = bytearray(pending.ravel().tobytes())
+
+    # 確定値は array に入れることで dtype に丸める
+    filled = array(_TYPECODES[dtype], elev_grid.astype(dtype).ravel().tobytes())
+    rows, cols = np.nonzero(edge)
+    seeds = ((rows + 1) * width + cols + 1).tolist()
+    heap = [(filled[c], c) for c in seeds]
+    heapq.heapify(heap)
+
+    offsets = [dr * width + dc for dr, dc in NEIGHBORS]
+    if min_slope > 0:
+        steps = [math.tan(math.radians(min_slope)) * length for length in neighbor_lengths(dx, dy)]
+    else:
+        steps = None
+    pop, push = heapq.heappop, heapq.heappush
+
+    while heap:
+        z, c = pop(heap)
+        if steps is None:
+            for off in offsets:
+                n = c + off
+                if pending[n]:
+                    pending[n] = 0
+                    zn = elev[n]
+                    if zn < z:
+                        zn = z
+                    filled[n] = zn
+                    push(heap, (filled[n], n))
+        else:
+            for off, step in zip(offsets, steps):
+                n = c + off
+                if pending[n]:
+                    pending[n] = 0
+                    zn = elev[n]
+                    if zn < z + step:
+                        zn = z + step
+                    filled[n] = zn
+                    push(heap, (filled[n], n))
+
+    out = np.frombuffer(filled, dtype=dtype).reshape(nrows + 2, width)[1:-1, 1:-1].copy()
+    out[~valid] = np.nan if nodata is None else nodata
+    return out
+
+
+def copy_prj(src_path, dst_path):
+    """入力 ASC に .prj があれば出力 ASC の隣に複製する"""
+    src_prj = os.path.splitext(str(src_path))[0] + ".prj"
+    if not os.path.exists(src_prj):
+        return None
+    dst_prj = os.path.splitext(str(dst_path))[0] + ".prj"
+    shutil.copyfile(src_prj, dst_prj)
+    return dst_prj
+
+
+def fill_sinks_asc(input_path, output_path, min_slope=MIN_SLOPE, fmt=FILLED_FMT):
+    """
+    ASC の DEM に窪地処理を行い、ASC として書き出す
+
+    Args:
+        input_path: 入力 DEM (.asc)
+        output_path: 出力 (.asc)。ヘッダは入力と同じ範囲・セルサイズ・NoData 値
+        min_slope: 最小勾配 [度]
+        fmt: 値の書式
+
+    Returns:
+        str: output_path
+    """
+    raster = parse_asc(input_path)
+    h = raster.header
+    nodata = -9999 if h["nodata"] is None else h["nodata"]
+    filled = fill_sinks(raster.data, h["dx"], h["dy"], min_slope=min_slope, nodata=h["nodata"])
+    if h["nodata"] is None:
+        filled[np.isnan(filled)] = nodata
+    write_asc(output_path, filled, h["xllcorner"], h["yllcorner"], h["dx"], h["dy"], nodata, fmt=fmt)
+    copy_prj(input_path, output_path)
+    return str(output_path)
+
+
+def read_raster(path):
+    """比較用に ASC / SAGA グリッド (.sdat) などを (配列, NoData) として読み込む"""
+    if str(path).lower().endswith(".asc"):
+        raster = parse_asc(path)
+        return raster.data, raster.nodata
+    import rasterio
+    with rasterio.open(path) as src:
+        return src.read(1).astype(np.float64), src.nodata
+
+
+def compare_rasters(a, b, nodata_a=None, nodata_b=None):
+    """
+    2つのラスタの差を調べる
+
+    Returns:
+        dict: mask_mismatch（有効セルの位置が異なる数）, max_abs_diff, mean_abs_diff
+    """
+    if a.shape != b.shape:
+        raise ValueError(f"ラスタの大きさが一致しません: {a.shape} != {b.shape}")
+    va, vb = valid_mask(a, nodata_a), valid_mask(b, nodata_b)
+    both = va & vb
+    diff = np.abs(a[both] - b[both])
+    return {
+        "mask_mismatch": int(np.count_nonzero(va != vb)),
+        "max_abs_diff": float(diff.max()) if diff.size else 0.0,
+        "mean_abs_diff": float(diff.mean()) if diff.size else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy による窪地処理 (Wang & Liu)")
+    parser.add_argument("input", help="入力 DEM (.asc)")
+    parser.add_argument("output", help="出力 (.asc)")
+    parser.add_argument("--min-slope", type=float, default=MIN_SLOPE, help=f"最小勾配 [度] (デフォルト: {MIN_SLOPE})")
+    parser.add_argument("--compare", help="比較する SAGA の出力 (filled.sdat / filled.asc)")
+    args = parser.parse_args()
+
+    fill_sinks_asc(args.input, args.output, min_slope=args.min_slope)
+    print(f"[INFO] 窪地処理の出力: {args.output}")
+
+    if args.compare:
+        ours, ours_nodata = read_raster(args.output)
+        ref, ref_nodata = read_raster(args.compare)
+        result = compare_rasters(ours, ref, ours_nodata, ref_nodata)
+        print(f"[INFO] {args.compare} との比較: 有効セルの不一致 {result['mask_mismatch']}, "
+              f"最大差 {result['max_abs_diff']:.6g}, 平均差 {result['mean_abs_diff']:.6g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,27 @@ import os
 from typing import Dict, Optional
 from contextlib import contextmanager
 
+from src.pyqg.priority_flood import fill_sinks_asc, copy_prj
+from src.pyqg.flow_direction import flow_direction_asc
+from src.pyqg.qgis_worker import QgisWorker, init_shared_worker
+from src.pyqg.sdat_to_asc import convert_many
+from src.common.profiling import stage
+from src.common.stage_cache import run_file_stage
+
 # ── デフォルト値 ─────────────────────────────────────────────
 MIN_SLOPE = 0.1
 THRESHOLD = 5
 DEFAULT_QGIS_VERSION = "3.34.9"   # ← ここを明示（以前は未定義参照の可能性あり）
 
+# 窪地処理の実装: "saga"（qgis_process で sagang:fillsinksxxlwangliu）/ "numpy"（priority_flood）
+FILL_BACKENDS = ("saga", "numpy")
+# 流向の実装: "saga"（sagang:channelnetworkanddrainagebasins の DIRECTION）/ "numpy"（flow_direction）
+DIRECTION_BACKENDS = ("saga", "numpy")
+# SDAT → ASC 変換の実装: "rasterio"（sdat_to_asc、プロセス内で2つ同時）/ "gdal"（qgis_process で gdal:translate）
+TRANSLATE_BACKENDS = ("rasterio", "gdal")
+# 窪地処理 → 流向 → ラスタ変換 をまとめた Processing モデル（use_model=True で使用）
+DEM_MODEL = Path(__file__).resolve().parent / "models" / "dem_chain.model3"
+
 # ── qgis_process の解決 ─────────────────────────────────────
 def resolve_qgis_process(
     qgis_process_path: Optional[str] = None,
@@ -48,12 +64,61 @@ def resolve_qgis_process(
         "環境変数 QGIS_PROCESS_PATH を設定してください。"
     )
 
+# ── QGIS の Python の解決（常駐 worker 用）──────────────────
+def resolve_qgis_python(
+    qgis_python_path: Optional[str] = None,
+    qgis_version: Optional[str] = None,
+    qgis_process_path: Optional[str] = None
+) -> str:
+    """
+    優先順:
+      1) 引数 qgis_python_path（存在必須）
+      2) 環境変数 QGIS_PYTHON_PATH（存在必須）
+      3) qgis_process と同じフォルダの python-qgis-ltr.bat
+      4) qgis_version から Windows 既定パスを組み立て（存在必須）
+    """
+    if qgis_python_path:
+        p = Path(qgis_python_path)
+        if p.exists():
+            return str(p)
+        raise FileNotFoundError(f"指定された QGIS の Python が見つかりません: {qgis_python_path}")
+
+    env_p = os.getenv("QGIS_PYTHON_PATH")
+    if env_p:
+        p = Path(env_p)
+        if p.exists():
+            return str(p)
+        raise FileNotFoundError(f"環境変数 QGIS_PYTHON_PATH のパスが見つかりません: {env_p}")
+
+    if qgis_process_path:
+        p = Path(qgis_process_path).parent / "python-qgis-ltr.bat"
+        if p.exists():
+            return str(p)
+
+    qv = qgis_version or DEFAULT_QGIS_VERSION
+    default_path = Path(rf"C:\Program Files\QGIS {qv}\bin\python-qgis-ltr.bat")
+    if default_path.exists():
+        return str(default_path)
+
+    raise FileNotFoundError(
+        "QGIS の Python (python-qgis-ltr.bat) が見つかりませんでした。"
+        " --qgis-python-path を指定するか、環境変数 QGIS_PYTHON_PATH を設定してください。"
+    )
+
 # ── qgis_process 実行（★空stdout検出を追加）──────────────────
-def run_qgis(alg_id: str, params: dict, qgis_process_path: str) -> str:
+def run_qgis(alg_id: str, params: dict, qgis_process_path: str, worker: Optional[QgisWorker] = None) -> str:
     """
     qgis_process を実行（--json）。戻りコード≠0 ならエラー。
     ★ 追記: 標準出力が空 or 空白のみならエラーとして停止。
+    worker を渡した場合は qgis_process を起動せず、常駐 worker で実行する。
     """
+    with stage(f"qgis:{alg_id}"):
+        if worker is not None:
+            return worker.run(alg_id, params)
+        return _run_qgis_process(alg_id, params, qgis_process_path)
+
+
+def _run_qgis_process(alg_id: str, params: dict, qgis_process_path: str) -> str:
     cmd = [qgis_process_path, "run", alg_id, "--json"]
     for k, v in params.items():
         if isinstance(v, bool):
@@ -103,6 +168,101 @@ def temp_sdat_files(*filenames: str) -> Generator[Dict[str, str], None, None]:
     finally:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
+# ── 窪地処理 ─────────────────────────────────────────────────
+def _fill(input_path, filled_dem, min_slope, fill_backend, qgis_exec, worker):
+    """窪地処理を行い filled_dem に書き出す（numpy: .asc / saga: .sdat）"""
+    if fill_backend == "numpy":
+        print("  実装: NumPy (priority-flood)")
+        fill_sinks_asc(input_path, filled_dem, min_slope=min_slope)
+    else:
+        run_qgis(
+            "sagang:fillsinksxxlwangliu",
+            {
+                "ELEV": str(input_path),
+                "FILLED": str(filled_dem),
+                "MINSLOPE": min_slope
+            },
+            qgis_exec,
+            worker
+        )
+
+
+def fill_dem(
+    input_path: str | Path,
+    output_dir: str | Path,
+    min_slope: float = MIN_SLOPE,
+    *,
+    qgis_version: Optional[str] = None,
+    qgis_process_path: Optional[str] = None,
+    fill_backend: str = "saga",
+    worker: Optional[QgisWorker] = None
+) -> dict:
+    """
+    窪地処理だけを行い、process_dem(filled_dem=...) に渡せる DEM を output_dir に書き出す
+    （fill_backend="numpy" は filled.asc、"saga" は filled.sdat）。
+    同じ MINSLOPE の DEM を複数の THRESHOLD で使い回す場合（run_sweep）に使う。
+
+    Returns:
+        dict: {'success': True, 'filled_dem': パス} または {'success': False, 'error', 'error_type'}
+    """
+    try:
+        if fill_backend not in FILL_BACKENDS:
+            raise ValueError(f"未対応の窪地処理の実装です: {fill_backend}（指定可能: {', '.join(FILL_BACKENDS)}）")
+        qgis_exec = None
+        if fill_backend == "saga" and worker is None:
+            qgis_exec = resolve_qgis_process(qgis_process_path=qgis_process_path, qgis_version=qgis_version)
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        filled_dem = output_dir / ("filled.asc" if fill_backend == "numpy" else "filled.sdat")
+        print(f"\n窪地処理: {input_path} → {filled_dem} (最小勾配: {min_slope})")
+        _fill(input_path, filled_dem, min_slope, fill_backend, qgis_exec, worker)
+        _must_exist(filled_dem, f"窪地処理の出力 ({filled_dem.name})")
+        return {'success': True, 'filled_dem': str(filled_dem)}
+    except Exception as e:
+        print(f"[ERROR] 窪地処理に失敗しました: {e}")
+        return {'success': False, 'error': str(e), 'error_type': type(e).__name__}
+
+# ── プロセスプールでの worker の共有 ────────────────────────
+def needs_qgis(
+    fill_backend: str = "saga",
+    direction_backend: str = "saga",
+    translate_backend: str = "rasterio",
+    filled_dem: Optional[str | Path] = None,
+    use_model: bool = False
+) -> bool:
+    """process_dem（filled_dem が無い場合は窪地処理も含む）が QGIS を使うか"""
+    if use_model:
+        return True
+    if filled_dem is not None:
+        return direction_backend == "saga" or (
+            translate_backend == "gdal" and not str(filled_dem).lower().endswith(".asc")
+        )
+    return "saga" in (fill_backend, direction_backend)
+
+
+def shared_worker_pool_args(
+    qgis_python_path: Optional[str] = None,
+    qgis_version: Optional[str] = None,
+    qgis_process_path: Optional[str] = None
+) -> dict:
+    """
+    ProcessPoolExecutor の各プロセスで QGIS worker を1つずつ使い回すための引数
+    （initializer / initargs）。各ジョブでは qgis_worker.shared_worker() で取得する。
+    QGIS の Python が見つからない場合は {} を返す（各ステップを qgis_process で実行する）。
+    """
+    try:
+        qgis_exec = resolve_qgis_process(qgis_process_path=qgis_process_path, qgis_version=qgis_version)
+    except FileNotFoundError:
+        qgis_exec = None
+    try:
+        qgis_python = resolve_qgis_python(
+            qgis_python_path=qgis_python_path, qgis_version=qgis_version, qgis_process_path=qgis_exec
+        )
+    except FileNotFoundError as e:
+        print(f"[WARNING] QGIS worker を使わずに qgis_process で実行します: {e}")
+        return {}
+    return {"initializer": init_shared_worker, "initargs": (qgis_python,)}
+
 # ── メイン処理 ───────────────────────────────────────────────
 def process_dem(
     input_path: str | Path,
@@ -112,16 +272,71 @@ def process_dem(
     keep_temp_files: bool = False,
     *,
     qgis_version: Optional[str] = None,
-    qgis_process_path: Optional[str] = None
+    qgis_process_path: Optional[str] = None,
+    fill_backend: str = "saga",
+    direction_backend: str = "saga",
+    worker: Optional[QgisWorker] = None,
+    use_worker: bool = False,
+    qgis_python_path: Optional[str] = None,
+    use_model: bool = False,
+    translate_backend: str = "rasterio",
+    stage_cache=None,
+    filled_dem: Optional[str | Path] = None
 ) -> dict:
     """
     DEMデータを処理（窪地 → 流向 → ASC 変換）。
     重要: qgis_process の“無出力”や成果物未生成を検知して停止。
+
+    fill_backend="numpy" の場合は窪地処理を QGIS を使わずに行い（priority_flood）、
+    filled.asc を直接書き出す（filled のラスタ変換は行わない）。
+    direction_backend="numpy" の場合は D8 流向を QGIS を使わずに求め（flow_direction）、
+    direction.asc を直接書き出す（SEGMENTS / BASINS は作らない）。
+    どちらも "numpy" の場合は qgis_process を使わない。
+
+    worker を渡した場合は各ステップを常駐 worker（qgis_worker）で実行する（呼び出し側が閉じる）。
+    use_worker=True の場合はこの呼び出しの間だけ worker を起動し、全ステップで使い回す。
+
+    SDAT → ASC 変換は translate_backend="rasterio"（既定）ではプロセス内で2つ同時に行い、
+    ヘッダは shp_to_ascii と同じ dx / dy 形式になる。"gdal" の場合は従来どおり gdal:translate。
+
+    use_model=True の場合は4つのステップを Processing モデル（models/dem_chain.model3）として
+    1回の qgis_process で実行する（中間ファイルはモデル内で受け渡す。backend は "saga" のみ）。
+    モデル内の変換は gdal:translate のため、translate_backend="rasterio" の場合はモデルの ASC を
+    一時フォルダに出力し、sdat_to_asc で書き直す（モデルを使わない場合と同じヘッダ・書式になる）。
+
+    stage_cache（common.stage_cache.StageCache）を指定すると、窪地処理（fill）・流向（direction）・
+    ラスタ変換（translate）の結果を入力 ASC の内容とパラメータのハッシュで保存し、
+    変わっていない段階は実行せずに読み込む（use_model=True の場合は使わない）。
+
+    filled_dem（fill_dem の出力 .asc / .sdat）を指定した場合は窪地処理を行わず、その DEM から
+    流向を求める（run_sweep で同じ MINSLOPE の DEM を複数の THRESHOLD で共有するため）。
     """
     try:
-        qgis_exec = resolve_qgis_process(
-            qgis_process_path=qgis_process_path, qgis_version=qgis_version
-        )
+        if fill_backend not in FILL_BACKENDS:
+            raise ValueError(f"未対応の窪地処理の実装です: {fill_backend}（指定可能: {', '.join(FILL_BACKENDS)}）")
+        if direction_backend not in DIRECTION_BACKENDS:
+            raise ValueError(f"未対応の流向の実装です: {direction_backend}（指定可能: {', '.join(DIRECTION_BACKENDS)}）")
+        if translate_backend not in TRANSLATE_BACKENDS:
+            raise ValueError(f"未対応のラスタ変換の実装です: {translate_backend}（指定可能: {', '.join(TRANSLATE_BACKENDS)}）")
+        if use_model and (fill_backend, direction_backend) != ("saga", "saga"):
+            raise ValueError("use_model は fill_backend / direction_backend が \"saga\" の場合のみ指定できます")
+        if use_model and filled_dem is not None:
+            raise ValueError("use_model と filled_dem は同時に指定できません")
+        if filled_dem is not None:
+            # 窪地処理は済んでいるため、QGIS が必要かは流向と .sdat の変換だけで決まる
+            fill_backend = "numpy" if str(filled_dem).lower().endswith(".asc") else "saga"
+        qgis_exec = None
+        own_worker = None
+        if needs_qgis(fill_backend, direction_backend, translate_backend, filled_dem) and worker is None:
+            qgis_exec = resolve_qgis_process(
+                qgis_process_path=qgis_process_path, qgis_version=qgis_version
+            )
+            if use_worker:
+                print("\nQGIS worker を起動しています...")
+                with stage("qgis_worker.start"):
+                    worker = own_worker = QgisWorker.start(resolve_qgis_python(
+                        qgis_python_path=qgis_python_path, qgis_version=qgis_version, qgis_process_path=qgis_exec
+                    ))
     except Exception as e:
         return {'success': False, 'error': str(e), 'error_type': type(e).__name__}
 
@@ -142,82 +357,166 @@ def process_dem(
     }
 
     try:
-        with temp_sdat_files(*temp_sdat_files_map.values()) as temp_files:
-            # 1) 窪地処理
-            print("\n[1/4] 窪地処理を開始しています...")
+        if use_model:
+            # 1) ～ 4) をまとめて1回の qgis_process で実行
+            print("\n[1/1] DEM処理モデルを実行しています (窪地処理 → 流向 → ラスタ変換)...")
             print(f"  入力ファイル: {input_path}")
-            print(f"  一時ファイル: {temp_files['filled']}" if not keep_temp_files else f"  出力先: {temp_files['filled']}")
+            print(f"  モデル: {DEM_MODEL}")
             print(f"  最小勾配: {min_slope}")
-
-            run_qgis(
-                "sagang:fillsinksxxlwangliu",
-                {
-                    "ELEV": str(input_path),
-                    "FILLED": temp_files['filled'],
-                    "MINSLOPE": min_slope
-                },
-                qgis_exec
-            )
-            # ★ 成果物の存在チェック
-            _must_exist(temp_files['filled'], "窪地処理の出力 (filled.sdat)")
-            print("  ✅ 窪地処理が完了しました")
-
-            # 2) 流向・流域解析
-            print("\n[2/4] 流向・流域解析を開始しています...")
             print(f"  閾値: {threshold}")
-            print(f"  流向データ一時ファイル: {temp_files['direction']}" if not keep_temp_files else f"  流向データ出力先: {temp_files['direction']}")
-
-            run_qgis(
-                "sagang:channelnetworkanddrainagebasins",
-                {
-                    "DEM": temp_files['filled'],
-                    "DIRECTION": temp_files['direction'],
-                    "SEGMENTS": temp_files['segments'],
-                    "BASINS": temp_files['basins'],
-                    "THRESHOLD": threshold,
-                    "SUBBASINS": True
-                },
-                qgis_exec
-            )
-            # ★ DIRECTION だけは必須なので確実にチェック（SEGMENTS/BASINS は用途に応じて）
-            _must_exist(temp_files['direction'], "流向の出力 (direction.sdat)")
-            print("  ✅ 流向・流域解析が完了しました")
-
-            # 3) ラスタ変換 (filled.sdat → filled.asc)
-            print("\n[3/4] ラスタ変換を実行しています (filled.sdat → filled.asc)...")
-            run_qgis(
-                "gdal:translate",
-                {
-                    "INPUT": temp_files['filled'],
-                    "OUTPUT": str(output_files['filled_asc'])
-                },
-                qgis_exec
-            )
-            # ★ 生成 ASC の存在チェック
+            if translate_backend == "rasterio":
+                # gdal:translate の ASC（cellsize ヘッダ・GDAL の数値書式）は一時フォルダに出力し、
+                # 通常の処理と同じ書式で書き直す（GDAL は値を丸めずに書くため値は変わらない）
+                model_dir = Path(tempfile.mkdtemp(prefix="dem_model_"))
+                model_files = {k: model_dir / Path(v).name for k, v in output_files.items()}
+            else:
+                model_dir = None
+                model_files = output_files
+            try:
+                with stage("dem_model"):
+                    run_qgis(
+                        str(DEM_MODEL),
+                        {
+                            "dem": str(input_path),
+                            "minslope": min_slope,
+                            "threshold": threshold,
+                            "translate_filled:filled_asc": str(model_files['filled_asc']),
+                            "translate_direction:direction_asc": str(model_files['direction_asc'])
+                        },
+                        qgis_exec,
+                        worker
+                    )
+                # ★ モデルの成果物の存在チェック（中間ファイルはモデル内の一時ファイル）
+                _must_exist(model_files['filled_asc'], "ラスタ変換の出力 (filled.asc)")
+                _must_exist(model_files['direction_asc'], "ラスタ変換の出力 (direction.asc)")
+                if model_dir is not None:
+                    with stage("translate", rasters=2):
+                        convert_many([(str(model_files[k]), output_files[k]) for k in ('filled_asc', 'direction_asc')])
+            finally:
+                if model_dir is not None:
+                    shutil.rmtree(model_dir, ignore_errors=True)
             _must_exist(output_files['filled_asc'], "ラスタ変換の出力 (filled.asc)")
-            print("  ✅ ラスタ変換が完了しました (filled)")
-
-            # 4) ラスタ変換 (direction.sdat → direction.asc)
-            print("\n[4/4] ラスタ変換を実行しています (direction.sdat → direction.asc)...")
-            run_qgis(
-                "gdal:translate",
-                {
-                    "INPUT": temp_files['direction'],
-                    "OUTPUT": str(output_files['direction_asc'])
-                },
-                qgis_exec
-            )
             _must_exist(output_files['direction_asc'], "ラスタ変換の出力 (direction.asc)")
-            print("  ✅ ラスタ変換が完了しました (direction)")
+            print("  ✅ DEM処理モデルが完了しました")
+        else:
+            with temp_sdat_files(*temp_sdat_files_map.values()) as temp_files:
+                temp_dir = Path(temp_files['filled']).parent
+                filled_dir = output_dir if fill_backend == "numpy" else temp_dir
+                direction_dir = output_dir if direction_backend == "numpy" else temp_dir
 
-            # 必要なら一時ファイルを保持
-            if keep_temp_files:
-                for key, temp_path in temp_files.items():
-                    if Path(temp_path).exists():
-                        dest_path = output_dir / f"{key}.sdat"
-                        shutil.copy2(temp_path, dest_path)
-                        output_files[f"{key}_sdat"] = dest_path
-                        print(f"  ✅ 一時ファイルを保持: {dest_path}")
+                # 1) 窪地処理
+                if filled_dem is not None:
+                    filled_dem = str(filled_dem)
+                    print(f"\n[1/4] 窪地処理済みの DEM を使用します: {filled_dem}")
+                    _must_exist(filled_dem, f"窪地処理済みの DEM ({Path(filled_dem).name})")
+                    if stage_cache is not None:
+                        # 渡された DEM の内容を fill のキーとし、下流の段階のキーに含める
+                        stage_cache.key("fill", params={"filled_dem": True}, files=[filled_dem])
+                    if fill_backend == "numpy" and Path(filled_dem).resolve() != output_files['filled_asc'].resolve():
+                        shutil.copy2(filled_dem, output_files['filled_asc'])
+                        copy_prj(filled_dem, output_files['filled_asc'])
+                else:
+                    filled_dem = str(filled_dir / ("filled.asc" if fill_backend == "numpy" else "filled.sdat"))
+                    print("\n[1/4] 窪地処理を開始しています...")
+                    print(f"  入力ファイル: {input_path}")
+                    print(f"  一時ファイル: {temp_files['filled']}" if not keep_temp_files else f"  出力先: {temp_files['filled']}")
+                    print(f"  最小勾配: {min_slope}")
+
+                    with stage("fill"):
+                        run_file_stage(
+                            stage_cache, "fill",
+                            lambda: _fill(input_path, filled_dem, min_slope, fill_backend, qgis_exec, worker),
+                            filled_dir, [Path(filled_dem).name],
+                            params={"min_slope": min_slope, "backend": fill_backend}, files=[input_path]
+                        )
+                    # ★ 成果物の存在チェック
+                    _must_exist(filled_dem, f"窪地処理の出力 ({Path(filled_dem).name})")
+                    print("  ✅ 窪地処理が完了しました")
+
+                # 2) 流向・流域解析
+                print("\n[2/4] 流向・流域解析を開始しています...")
+
+                def direction():
+                    if direction_backend == "numpy":
+                        print("  実装: NumPy (D8)")
+                        # SAGA の filled.sdat から求める場合、範囲・セルサイズは入力 ASC から取る
+                        grid_path = None if filled_dem.lower().endswith(".asc") else str(input_path)
+                        flow_direction_asc(filled_dem, output_files['direction_asc'], grid_path=grid_path)
+                    else:
+                        print(f"  閾値: {threshold}")
+                        print(f"  流向データ一時ファイル: {temp_files['direction']}" if not keep_temp_files else f"  流向データ出力先: {temp_files['direction']}")
+
+                        run_qgis(
+                            "sagang:channelnetworkanddrainagebasins",
+                            {
+                                "DEM": filled_dem,
+                                "DIRECTION": temp_files['direction'],
+                                "SEGMENTS": temp_files['segments'],
+                                "BASINS": temp_files['basins'],
+                                "THRESHOLD": threshold,
+                                "SUBBASINS": True
+                            },
+                            qgis_exec,
+                            worker
+                        )
+
+                direction_name = "direction.asc" if direction_backend == "numpy" else "direction.sdat"
+                with stage("direction"):
+                    run_file_stage(
+                        stage_cache, "direction", direction, direction_dir, [direction_name],
+                        params={"threshold": threshold, "backend": direction_backend}, upstream=["fill"]
+                    )
+                # ★ DIRECTION だけは必須なので確実にチェック（SEGMENTS/BASINS は用途に応じて）
+                _must_exist(direction_dir / direction_name, f"流向の出力 ({direction_name})")
+                print("  ✅ 流向・流域解析が完了しました")
+
+                # 3) 4) ラスタ変換 (SDAT → ASC)
+                pairs = []
+                if fill_backend == "saga":
+                    pairs.append((filled_dem, output_files['filled_asc']))
+                if direction_backend == "saga":
+                    pairs.append((temp_files['direction'], output_files['direction_asc']))
+
+                def translate():
+                    if translate_backend == "rasterio":
+                        print("\n[3-4/4] ラスタ変換を実行しています (rasterio, 同時実行)...")
+                        for src, dst in pairs:
+                            print(f"  {Path(src).name} → {Path(dst).name}")
+                        convert_many(pairs)
+                        return
+                    for step, (src, dst) in zip(("3/4", "4/4"), pairs):
+                        print(f"\n[{step}] ラスタ変換を実行しています ({Path(src).name} → {Path(dst).name})...")
+                        run_qgis(
+                            "gdal:translate",
+                            {
+                                "INPUT": src,
+                                "OUTPUT": str(dst)
+                            },
+                            qgis_exec,
+                            worker
+                        )
+
+                if pairs:
+                    with stage("translate", rasters=len(pairs)):
+                        run_file_stage(
+                            stage_cache, "translate", translate, output_dir, [Path(dst).name for _, dst in pairs],
+                            params={"backend": translate_backend}, upstream=["fill", "direction"]
+                        )
+                else:
+                    print("\n[3-4/4] ラスタ変換は不要です (ASC を直接出力済み)")
+                # ★ 生成 ASC の存在チェック
+                _must_exist(output_files['filled_asc'], "ラスタ変換の出力 (filled.asc)")
+                _must_exist(output_files['direction_asc'], "ラスタ変換の出力 (direction.asc)")
+                print("  ✅ ラスタ変換が完了しました")
+
+                # 必要なら一時ファイルを保持
+                if keep_temp_files:
+                    for key, temp_path in temp_files.items():
+                        if Path(temp_path).exists():
+                            dest_path = output_dir / f"{key}.sdat"
+                            shutil.copy2(temp_path, dest_path)
+                            output_files[f"{key}_sdat"] = dest_path
+                            print(f"  ✅ 一時ファイルを保持: {dest_path}")
 
         print("\n=======================================")
         print("✅ すべての処理が正常に完了しました！")
@@ -242,3 +541,6 @@ def process_dem(
             'error': str(e),
             'error_type': type(e).__name__
         }
+    finally:
+        if own_worker is not None:
+            own_worker.close()
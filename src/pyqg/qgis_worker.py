@@ -0,0 +1,255 @@
+# qgis_worker.py
+"""
+QGIS Processing を常駐プロセスで実行する
+
+qgis_process はアルゴリズムごとに QGIS・プロバイダ・SAGA プラグインを初期化し直すため、
+1回ごとに数秒かかる。ここでは QGIS の Python（python-qgis-ltr.bat など）でこのファイルを
+起動し、QgsApplication / Processing を一度だけ初期化して、標準入出力の JSON 行で
+アルゴリズムの実行依頼を受け付ける（tools/run_fill_sins.py と同じ初期化）。
+
+プロトコル（1行に1つの JSON）:
+    worker → client  {"ready": true, "qgis_version": "..."}              初期化の完了
+    client → worker  {"id": 1, "alg": "sagang:...", "params": {...}}     アルゴリズム（または .model3 のパス）の実行
+    worker → client  {"id": 1, "ok": true, "results": {...}}            成功
+    worker → client  {"id": 1, "ok": false, "error": "...", "error_type": "..."}  失敗
+    client → worker  {"id": 2, "cmd": "quit"}                            終了
+
+    - QGIS やアルゴリズムが標準出力に書いた内容は標準エラーへ回し、プロトコルの行と混ざらないようにする
+    - JSON 行は ASCII（ensure_ascii）で送り、読み書きは UTF-8 とする
+      （Windows の QGIS の Python は標準入出力が cp932 のため、日本語のパスが化けないように）
+    - 解釈できない行には {"id": null, "ok": false, ...} を返して続ける
+    - --stub で起動すると QGIS を使わず、受け取った params を results として返す
+      （QGIS の無い環境でプロトコルを確認するための代役。アルゴリズム "stub:error" は失敗を返す）
+
+プロセスプールの各プロセスで worker を1つずつ使い回す場合は、initializer に init_shared_worker を
+指定し、各ジョブで shared_worker() を取得する（run_batch / run_sweep）。
+
+このファイルは QGIS の Python から直接実行するため、標準ライブラリだけを使う。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import traceback
+from multiprocessing import util as mp_util
+
+# worker として起動するスクリプト。PyInstaller の実行ファイルでは src/pyqg/qgis_worker.py を
+# データとして同梱し（deploy.yml の --add-data）、展開先（sys._MEIPASS）のものを起動する
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "qgis_worker.py")
+
+
+# ── worker 側 ────────────────────────────────────────────────
+def _init_qgis():
+    """QgsApplication と Processing を初期化し、(アルゴリズム実行関数, 終了処理, バージョン) を返す"""
+    from qgis.core import QgsApplication, Qgis
+
+    prefix = os.environ.get("QGIS_PREFIX_PATH")
+    if prefix:
+        QgsApplication.setPrefixPath(prefix, True)
+        sys.path.append(os.path.join(prefix, "python", "plugins"))
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    import processing
+    from processing.core.Processing import Processing
+    Processing.initialize()
+
+    def run(alg_id, params):
+        # Processing モデル（.model3）はファイルから読み込んで実行する
+        if alg_id.lower().endswith(".model3"):
+            from qgis.core import QgsProcessingModelAlgorithm
+            model = QgsProcessingModelAlgorithm()
+            if not model.fromFile(alg_id):
+                raise RuntimeError(f"モデルを読み込めません: {alg_id}")
+            return processing.run(model, params)
+        return processing.run(alg_id, params)
+
+    return run, qgs.exitQgis, Qgis.QGIS_VERSION
+
+
+def _init_stub():
+    def run(alg_id, params):
+        if alg_id == "stub:error":
+            raise RuntimeError(params.get("message", "stub error"))
+        return dict(params)
+
+    return run, lambda: None, "stub"
+
+
+def serve(stub=False):
+    """標準入力から依頼を読み、結果を標準出力へ返す（quit または入力の終わりまで）"""
+    # 依頼は UTF-8 で読む（既定のエンコーディングは Windows では cp932）
+    sys.stdin.reconfigure(encoding="utf-8")
+    # プロトコル用に元の標準出力を UTF-8 で確保し、以降の print などは標準エラーへ回す
+    proto = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8", newline="\n")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    def send(message):
+        proto.write(json.dumps(message, ensure_ascii=True, default=str) + "\n")
+        proto.flush()
+
+    try:
+        run, shutdown, version = _init_stub() if stub else _init_qgis()
+    except Exception as e:
+        send({"ready": False, "error": str(e), "error_type": type(e).__name__})
+        return 1
+    send({"ready": True, "qgis_version": version})
+
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                send({"id": None, "ok": False, "error": f"依頼を解釈できません: {e}", "error_type": type(e).__name__})
+                continue
+            if request.get("cmd") == "quit":
+                send({"id": request.get("id"), "ok": True, "results": {}})
+                break
+            try:
+                results = run(request["alg"], request.get("params", {}))
+                send({"id": request.get("id"), "ok": True, "results": results})
+            except Exception as e:
+                traceback.print_exc()
+                send({"id": request.get("id"), "ok": False, "error": str(e), "error_type": type(e).__name__})
+    finally:
+        shutdown()
+    return 0
+
+
+# ── client 側 ────────────────────────────────────────────────
+class QgisWorker:
+    """
+    常駐する worker プロセスへの接続
+
+    with QgisWorker([python_qgis, WORKER_SCRIPT]) as worker:
+        worker.run("sagang:fillsinksxxlwangliu", {...})
+
+    同じ worker を process_dem の各ステップ・複数回の実行で使い回せる（同時に使うのは1スレッドのみ）。
+    """
+
+    def __init__(self, command, env=None):
+        self.command = [str(c) for c in command]
+        self._next_id = 0
+        # worker の標準エラー（QGIS のログ）はそのまま親の標準エラーへ流す
+        self._proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            env=env,
+        )
+        ready = self._receive()
+        if not ready.get("ready"):
+            self.close()
+            raise RuntimeError(f"QGIS worker の初期化に失敗しました: {ready.get('error', '')}")
+        self.qgis_version = ready.get("qgis_version")
+
+    @classmethod
+    def start(cls, qgis_python, stub=False, env=None):
+        """QGIS の Python（stub=True の場合は現在の Python でも可）でこのファイルを起動する"""
+        command = [qgis_python, WORKER_SCRIPT] + (["--stub"] if stub else [])
+        return cls(command, env=env)
+
+    @property
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def _receive(self):
+        line = self._proc.stdout.readline()
+        if not line:
+            rc = self._proc.wait()
+            raise RuntimeError(f"QGIS worker が終了しました (rc={rc}): {' '.join(self.command)}")
+        return json.loads(line)
+
+    def _request(self, message):
+        if not self.alive:
+            raise RuntimeError("QGIS worker は終了しています")
+        self._next_id += 1
+        message = dict(message, id=self._next_id)
+        self._proc.stdin.write(json.dumps(message, ensure_ascii=True) + "\n")
+        self._proc.stdin.flush()
+        response = self._receive()
+        if response.get("id") != message["id"]:
+            raise RuntimeError(f"QGIS worker の応答が依頼と一致しません: {response}")
+        return response
+
+    def run(self, alg_id, params):
+        """
+        アルゴリズムを実行し、結果を qgis_process --json と同じく JSON 文字列で返す。
+        失敗した場合は RuntimeError
+        """
+        print(">>> [worker]", alg_id, " ".join(f"{k}={v}" for k, v in params.items()))
+        response = self._request({"alg": alg_id, "params": params})
+        if not response.get("ok"):
+            raise RuntimeError(
+                f"QGIS worker で {alg_id} が失敗しました ({response.get('error_type')}): {response.get('error')}"
+            )
+        return json.dumps({"algorithm_id": alg_id, "results": response.get("results", {})}, ensure_ascii=False)
+
+    def close(self):
+        """worker を終了する（何度呼んでもよい）"""
+        if self._proc is None:
+            return
+        try:
+            if self.alive:
+                self._request({"cmd": "quit"})
+                self._proc.stdin.close()
+                self._proc.wait(timeout=30)
+        except Exception:
+            self._proc.kill()
+            self._proc.wait()
+        finally:
+            self._proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ── プロセスプールでの共有 ───────────────────────────────────
+_shared_args = None
+_shared = None
+
+
+def init_shared_worker(qgis_python, stub=False, env=None):
+    """
+    プロセスプールの initializer。このプロセスで使い回す worker の起動方法を設定する
+    （QGIS の起動は最初に shared_worker() を呼んだときに行う）
+    """
+    global _shared_args
+    _shared_args = (qgis_python, stub, env)
+
+
+def shared_worker():
+    """
+    init_shared_worker で設定した、このプロセスの worker（未起動なら起動する）。
+    設定されていない場合は None
+    """
+    global _shared
+    if _shared_args is None:
+        return None
+    if _shared is None or not _shared.alive:
+        qgis_python, stub, env = _shared_args
+        _shared = QgisWorker.start(qgis_python, stub=stub, env=env)
+        # プールのプロセスは atexit を実行せずに終わるため、multiprocessing の終了処理で閉じる
+        mp_util.Finalize(_shared, _shared.close, exitpriority=10)
+    return _shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QGIS Processing の常駐 worker（標準入出力で JSON 行を受け付ける）")
+    parser.add_argument("--stub", action="store_true", help="QGIS を使わずに params をそのまま返す（テスト用）")
+    args = parser.parse_args()
+    sys.exit(serve(stub=args.stub))
+
+
+if __name__ == "__main__":
+    main()
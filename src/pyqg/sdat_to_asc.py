@@ -0,0 +1,108 @@
+# sdat_to_asc.py
+"""
+SAGA グリッド (.sdat) を ASC に変換する（gdal:translate の代わり）
+
+rasterio で読み込み、asc_writer.write_asc で書き出すため、ヘッダは shp_to_ascii などと同じ
+dx / dy 形式になる。qgis_process を起動しないので QGIS の起動時間がかからない。
+
+    - 浮動小数のグリッドは priority_flood.FILLED_FMT、整数のグリッドは値の桁数に合わせた '%Wd' で書く
+    - NoData が無いグリッドは -9999 を NoData とする（NaN も -9999 にする）
+    - 座標参照系があれば .prj も書き出す
+    - convert_many は複数の変換をスレッドで同時に行う（読み込みと書き出しの大半は GIL を解放する）
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.pyqg.priority_flood import FILLED_FMT
+from src.shp_to_asc.asc_writer import write_asc
+
+DEFAULT_NODATA = -9999
+
+
+def _int_fmt(data, nodata):
+    """整数の値と NoData がすべて収まる幅の '%Wd'"""
+    texts = [str(int(nodata))]
+    if data.size:
+        texts += [str(int(data.min())), str(int(data.max()))]
+    return f"%{max(len(t) for t in texts)}d"
+
+
+def sdat_to_asc(src_path, asc_path, fmt=None):
+    """
+    ラスタ（.sdat など GDAL で読める形式）を ASC に変換する
+
+    Args:
+        src_path: 入力ラスタのパス
+        asc_path: 出力 ASC のパス
+        fmt: 値の書式。None の場合は型に応じて決める
+
+    Returns:
+        str: asc_path
+    """
+    import rasterio
+
+    with rasterio.open(src_path) as src:
+        data = src.read(1)
+        transform = src.transform
+        nodata = src.nodata
+        crs = src.crs
+
+    if transform.b != 0 or transform.d != 0:
+        raise ValueError(f"回転のあるグリッドは変換できません: {src_path}")
+    dx, dy = transform.a, -transform.e
+    xll = transform.c
+    if dy > 0:
+        yll = transform.f - dy * data.shape[0]
+    else:
+        # 南から北へ並んだグリッドは1行目が北端になるよう並べ替える
+        dy = -dy
+        yll = transform.f
+        data = data[::-1]
+
+    integer = np.issubdtype(data.dtype, np.integer)
+    if nodata is None or (not integer and np.isnan(nodata)):
+        nodata = DEFAULT_NODATA
+        if not integer:
+            data = np.where(np.isnan(data), nodata, data)
+    if integer or float(nodata).is_integer():
+        nodata = int(nodata)
+    if fmt is None:
+        fmt = _int_fmt(data, nodata) if integer else FILLED_FMT
+
+    write_asc(asc_path, data, xll, yll, dx, dy, nodata, crs=crs.to_wkt() if crs else None, fmt=fmt)
+    return str(asc_path)
+
+
+def convert_many(pairs, max_workers=None):
+    """
+    複数の (入力ラスタ, 出力 ASC) を同時に変換する
+
+    Args:
+        pairs: (src_path, asc_path) の並び
+        max_workers: スレッド数（既定は変換の数）
+
+    Returns:
+        list[str]: 出力 ASC のパス（pairs の順）
+    """
+    pairs = list(pairs)
+    if len(pairs) <= 1:
+        return [sdat_to_asc(src, dst) for src, dst in pairs]
+    with ThreadPoolExecutor(max_workers=max_workers or len(pairs)) as executor:
+        futures = [executor.submit(sdat_to_asc, src, dst) for src, dst in pairs]
+        return [f.result() for f in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAGA グリッド (.sdat) を ASC に変換する")
+    parser.add_argument("inputs", nargs="+", help="入力ラスタ (.sdat)。出力は同名の .asc")
+    args = parser.parse_args()
+
+    pairs = [(p, p.rsplit(".", 1)[0] + ".asc") for p in args.inputs]
+    for out in convert_many(pairs):
+        print(f"[INFO] 出力: {out}")
+
+
+if __name__ == "__main__":
+    main()
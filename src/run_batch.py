@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+複数の計算領域・流域をまとめて実行するスクリプト（複数流域対応）
+
+ジョブの一覧（マニフェスト）を読み込み、ジョブごとに run_full_pipeline を実行する。
+    - ジョブは上限付きのプロセスプールで同時に実行する（--jobs）
+    - 出力はジョブごとに <outdir>/<ジョブ名>/ に分け、ログは <outdir>/<ジョブ名>/run.log に書き出す
+    - 失敗したジョブがあっても他のジョブは続け、ジョブごとの結果を <outdir>/batch_results.csv に出力する
+    - QGIS を使うジョブは、プールの各プロセスで1つずつ起動した QGIS worker を使い回す
+      （QGIS の起動はプロセスごとに1回。--no-qgis-worker で従来どおりステップごとの qgis_process）
+
+共有する入力は実行前に1回だけ準備する:
+    - 標準メッシュのインデックスを作成しておき、各ジョブは計算領域にかかるセルだけを読み込む
+    - 点群ファイルは (ファイル, 座標系, 標高値列) ごとに1回だけ解析して点群キャッシュに保存し、
+      同じファイルを使うジョブはキャッシュから読み込む
+
+マニフェスト（JSON）:
+    {
+        "defaults": {"cells_x": 100, "cells_y": 100, "min_slope": 0.1, "threshold": 5},
+        "jobs": [
+            {"name": "basin_a", "domain": "a/計算領域.shp", "basin": "a/流域界.shp", "points": ["dem1.csv", "dem2.csv"]},
+            {"name": "basin_b", "domain": "b/計算領域.shp", "basin": "b/流域界.shp", "points": "dem2.csv", "threshold": 10}
+        ]
+    }
+マニフェスト（CSV）: 1行1ジョブ。列は JSON のキーと同じで、points は ";" 区切り。
+    各ジョブのキーは run_full_pipeline の引数（domain / basin / points / cells は短縮名）。
+    マニフェストに書いた相対パスはマニフェストのあるフォルダから、コマンドライン（--standard-mesh）・
+    read_manifest の defaults で指定した相対パスはカレントディレクトリからのパスとして扱う。
+
+使用方法:
+    python -m src.run_batch jobs.json [--outdir 出力ディレクトリ] [--jobs 同時実行数] [--standard-mesh 標準メッシュ.shp]
+"""
+import argparse
+import contextlib
+import csv
+import inspect
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import geopandas as gpd
+
+from src.run_full_pipeline import run_full_pipeline
+from src.make_shp.add_elevation import iter_point_chunks
+from src.make_shp.mesh_index import load_index
+from src.make_shp.point_cache import PointCache
+from src.pyqg.processor import needs_qgis, shared_worker_pool_args
+from src.pyqg.qgis_worker import shared_worker
+
+RESULTS_CSV = "batch_results.csv"
+RESULT_COLUMNS = ["name", "success", "seconds", "output_dir", "log", "error_type", "error"]
+
+# マニフェストの短縮名 → run_full_pipeline の引数名
+_ALIASES = {
+    "domain": "domain_shp",
+    "basin": "basin_shp",
+    "points": "points_path",
+}
+# ファイルパスとして扱う引数
+_PATH_KEYS = ("domain_shp", "basin_shp", "points_path", "standard_mesh")
+# バッチ側で決める引数
+_RESERVED = ("output_dir", "point_cache_dir", "qgis_worker")
+_NUMERIC = {
+    "cells_x": int, "cells_y": int, "threshold": int, "mesh_level": int, "chunksize": int, "workers": int,
+    "min_slope": float, "nodata": float,
+}
+
+
+def _split_points(value):
+    if isinstance(value, str):
+        return [p for p in value.split(";") if p]
+    return list(value)
+
+
+def _normalize_job(raw, base_dir, index, defaults=None):
+    """
+    マニフェストの1ジョブを run_full_pipeline の引数の辞書にする
+
+    raw（マニフェストの defaults と各ジョブの値）の相対パスは base_dir から、
+    defaults（呼び出し側の既定値）の相対パスはカレントディレクトリからのパスとする。
+    """
+    allowed = set(inspect.signature(run_full_pipeline).parameters) - set(_RESERVED)
+    job = {}
+    bases = {}
+    name = None
+    for source, base in ((defaults or {}, None), (raw, base_dir)):
+        for key, value in source.items():
+            if value is None or value == "":
+                continue
+            if key == "name":
+                name = str(value)
+                continue
+            if key == "cells":
+                job["num_cells_x"] = job["num_cells_y"] = int(value)
+                continue
+            key = {"cells_x": "num_cells_x", "cells_y": "num_cells_y"}.get(key, _ALIASES.get(key, key))
+            if key not in allowed:
+                raise ValueError(f"ジョブ {index + 1}: 未対応の項目です: {key}")
+            job[key] = value
+            bases[key] = base
+
+    for key, cast in _NUMERIC.items():
+        arg = {"cells_x": "num_cells_x", "cells_y": "num_cells_y"}.get(key, key)
+        if arg in job:
+            job[arg] = cast(job[arg])
+    if "points_path" in job:
+        job["points_path"] = _split_points(job["points_path"])
+    for key in ("stats", "percentiles"):
+        if isinstance(job.get(key), str):
+            job[key] = job[key].split()
+
+    # マニフェストに書いた相対パスはマニフェストのフォルダから（呼び出し側の既定値はそのまま）
+    for key in _PATH_KEYS:
+        if key not in job or bases[key] is None:
+            continue
+        if key == "points_path":
+            job[key] = [str(bases[key] / p) for p in job[key]]
+        else:
+            job[key] = str(bases[key] / job[key])
+
+    missing = [k for k in ("domain_shp", "basin_shp", "points_path", "num_cells_x", "num_cells_y") if k not in job]
+    if missing:
+        raise ValueError(f"ジョブ {index + 1}: 必須の項目がありません: {', '.join(missing)}")
+    job.setdefault("standard_mesh", None)
+    return name or Path(job["basin_shp"]).stem, job
+
+
+def read_manifest(path, defaults=None):
+    """
+    マニフェスト（.json / .csv）を読み込む
+
+    Args:
+        path: マニフェストのパス
+        defaults: すべてのジョブに適用する既定値（マニフェストの defaults・各ジョブの値が優先）
+
+    Returns:
+        list[tuple[str, dict]]: (ジョブ名, run_full_pipeline の引数) のリスト
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            raws = list(csv.DictReader(f))
+        manifest_defaults = {}
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"jobs": data}
+        raws = data.get("jobs", [])
+        manifest_defaults = data.get("defaults", {})
+
+    jobs = []
+    for i, raw in enumerate(raws):
+        merged = dict(manifest_defaults)
+        merged.update({k: v for k, v in raw.items() if v not in (None, "")})
+        jobs.append(_normalize_job(merged, path.parent, i, defaults))
+
+    names = [name for name, _ in jobs]
+    duplicated = sorted({n for n in names if names.count(n) > 1})
+    if duplicated:
+        raise ValueError(f"ジョブ名が重複しています（name で区別してください）: {', '.join(duplicated)}")
+    if not jobs:
+        raise ValueError(f"ジョブがありません: {path}")
+    return jobs
+
+
+def _warm_point_cache(cache_dir, path, target_crs, zcol, chunksize):
+    """点群ファイルを1回解析して点群キャッシュに保存する（キャッシュ済みなら何もしない）"""
+    for _ in iter_point_chunks(path, target_crs, zcol, chunksize, PointCache(cache_dir)):
+        pass
+    return path
+
+
+def prepare_shared_inputs(jobs, point_cache_dir, max_workers=None):
+    """
+    ジョブ間で共有する入力を準備する（標準メッシュのインデックスと点群キャッシュ）
+    """
+    for standard_mesh in sorted({job["standard_mesh"] for _, job in jobs if job.get("standard_mesh")}):
+        print(f"[INFO] 標準メッシュのインデックスを準備します: {standard_mesh}")
+        load_index(standard_mesh)
+
+    # 点群は計算領域の座標系に変換して集計するため、(ファイル, 座標系, 標高値列) ごとに解析する
+    crs_by_domain = {}
+    targets = {}
+    for _, job in jobs:
+        domain = job["domain_shp"]
+        if domain not in crs_by_domain:
+            try:
+                crs_by_domain[domain] = gpd.read_file(domain, rows=1).crs
+            except Exception as e:
+                # 読み込めない計算領域はジョブ側でエラーとして報告する
+                print(f"[WARNING] 計算領域を読み込めません: {domain} - {e}")
+                crs_by_domain[domain] = None
+        crs = crs_by_domain[domain]
+        if crs is None:
+            continue
+        for p in job["points_path"]:
+            key = (os.path.abspath(p), crs.to_wkt() if crs else None, job.get("zcol"))
+            targets.setdefault(key, (p, crs, job.get("zcol"), job.get("chunksize")))
+
+    shared = [t for t in targets.values() if sum(t[0] in job["points_path"] for _, job in jobs) > 1]
+    if not shared:
+        return
+    print(f"[INFO] 複数のジョブで使う点群ファイルを先に解析します: {len(shared)} ファイル")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_warm_point_cache, point_cache_dir, *t) for t in shared]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                # 解析できないファイルはジョブ側でエラーとして報告する
+                print(f"[WARNING] 点群キャッシュを作成できませんでした: {e}")
+
+
+def _run_job(name, job, output_dir, point_cache_dir, options):
+    """1ジョブを実行する（出力・ログはジョブのフォルダに分ける）"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_path = output_dir / "run.log"
+    start = time.perf_counter()
+    params = dict(options, **job)
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            # このプロセスの QGIS worker（run_batch が initializer で設定した場合）を使い回す
+            worker = shared_worker() if needs_qgis(
+                params.get("fill_backend", "saga"), params.get("direction_backend", "saga"),
+                use_model=params.get("use_qgis_model", False)
+            ) else None
+            result = run_full_pipeline(
+                output_dir=str(output_dir),
+                point_cache_dir=point_cache_dir,
+                qgis_worker=worker,
+                **params
+            )
+        except Exception as e:
+            traceback.print_exc()
+            result = {'success': False, 'error': str(e), 'error_type': type(e).__name__}
+    if not isinstance(result, dict):
+        result = {'success': bool(result)}
+    result.update(name=name, output_dir=str(output_dir), log=str(log_path),
+                  seconds=round(time.perf_counter() - start, 3))
+    return result
+
+
+def write_results(results, path):
+    """ジョブごとの結果を CSV に書き出す"""
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+    return str(path)
+
+
+def run_batch(jobs, output_dir="outputs_batch", max_jobs=2, share_qgis_worker=True, **options):
+    """
+    ジョブをまとめて実行する
+
+    Args:
+        jobs: read_manifest の戻り値（(ジョブ名, run_full_pipeline の引数) のリスト）
+        output_dir: 出力先。ジョブごとに <output_dir>/<ジョブ名>/ を作る
+        max_jobs: 同時に実行するジョブ数
+        share_qgis_worker: QGIS を使うジョブがある場合に、プールの各プロセスで QGIS worker を
+            1つずつ起動して使い回す（False の場合はステップごとに qgis_process を起動する）
+        options: すべてのジョブに渡す run_full_pipeline の引数（ジョブの値が優先）
+
+    Returns:
+        dict: {'success', 'results': ジョブごとの結果, 'summary': 結果の CSV のパス}
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    point_cache_dir = str(output_dir / ".cache" / "points")
+    # ジョブごとの出力フォルダで段階キャッシュを使い、再実行では変わったジョブ・段階だけを実行する
+    options.setdefault("stage_cache", True)
+
+    prepare_shared_inputs(jobs, point_cache_dir, max_workers=max_jobs)
+
+    pool_args = {}
+    if share_qgis_worker and any(
+        needs_qgis(p.get("fill_backend", "saga"), p.get("direction_backend", "saga"),
+                   use_model=p.get("use_qgis_model", False))
+        for p in (dict(options, **job) for _, job in jobs)
+    ):
+        pool_args = shared_worker_pool_args(
+            options.get("qgis_python_path"), options.get("qgis_version"), options.get("qgis_process_path")
+        )
+
+    print(f"\n{len(jobs)} ジョブを最大 {max_jobs} 並列で実行します")
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_jobs, **pool_args) as executor:
+        futures = {
+            executor.submit(_run_job, name, job, output_dir / name, point_cache_dir, options): name
+            for name, job in jobs
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # ワーカープロセス自体の異常終了など
+                result = {'name': name, 'success': False, 'output_dir': str(output_dir / name),
+                          'error': str(e), 'error_type': type(e).__name__}
+            results[name] = result
+            mark = "✅" if result.get('success') else "❌"
+            print(f"{mark} {name}" + ("" if result.get('success') else f": {result.get('error')}"))
+
+    ordered = [results[name] for name, _ in jobs]
+    summary = write_results(ordered, output_dir / RESULTS_CSV)
+    n_ok = sum(1 for r in ordered if r.get('success'))
+    print("\n" + "=" * 50)
+    print(f"完了: {n_ok} / {len(ordered)} ジョブ")
+    print(f"結果: {summary}")
+    print("=" * 50)
+    return {'success': n_ok == len(ordered), 'results': ordered, 'summary': summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数の計算領域・流域をまとめて実行")
+    parser.add_argument("manifest", help="ジョブの一覧 (.json / .csv)")
+    parser.add_argument("--outdir", default="outputs_batch", help="出力ディレクトリ (デフォルト: outputs_batch)")
+    parser.add_argument("--jobs", type=int, default=2, help="同時に実行するジョブ数 (デフォルト: 2)")
+    parser.add_argument("--standard-mesh", help="標準地域メッシュ (.shp)。ジョブで指定が無い場合に使う")
+    parser.add_argument("--qgis-version", default="3.34.9", help="QGIS-LTRのバージョン (デフォルト: 3.34.9)")
+    parser.add_argument("--qgis-process-path", help="qgis_processの実行ファイルパス")
+    parser.add_argument("--qgis-python-path", help="QGIS の Python (python-qgis-ltr.bat) のパス（QGIS worker 用）")
+    parser.add_argument("--no-qgis-worker", action="store_true", help="QGIS worker を使わず、ステップごとに qgis_process を起動する")
+    args = parser.parse_args()
+
+    defaults = {"standard_mesh": args.standard_mesh} if args.standard_mesh else None
+    jobs = read_manifest(args.manifest, defaults=defaults)
+    result = run_batch(
+        jobs,
+        output_dir=args.outdir,
+        max_jobs=args.jobs,
+        share_qgis_worker=not args.no_qgis_worker,
+        qgis_version=args.qgis_version,
+        qgis_process_path=args.qgis_process_path,
+        qgis_python_path=args.qgis_python_path
+    )
+    raise SystemExit(0 if result['success'] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,19 +9,38 @@
         --cells_x 100 \
         --cells_y 100 \
         --points 標高点群.csv \
-        --standard-mesh 標準メッシュ.shp \
+        [--standard-mesh 標準メッシュ.shp] \
+        [--mesh-level メッシュレベル] \
         [--outdir 出力ディレクトリ] \
         [--zcol 標高列名] \
         [--nodata NODATA値] \
         [--mesh-id メッシュID列名] \
+        [--chunksize 読み込み行数] \
+        [--workers 並列プロセス数] \
+        [--point-cache 点群キャッシュフォルダ] \
+        [--stats min max std] \
+        [--percentiles 50] \
+        [--keep-intermediates] \
         [--min-slope 最小勾配] \
-        [--threshold 閾値]
+        [--threshold 閾値] \
+        [--fill-backend saga|numpy] \
+        [--direction-backend saga|numpy] \
+        [--qgis-worker] \
+        [--qgis-python-path python-qgis-ltr.bat] \
+        [--qgis-model] \
+        [--translate-backend rasterio|gdal] \
+        [--stage-cache] \
+        [--tile-size タイルの一辺のセル数] \
+        [--profile]
 """
 import argparse
 from pathlib import Path
 
 from src.make_shp.pipeline import pipeline
-from src.pyqg.processor import process_dem
+from src.make_shp.cell_stats import STAT_NAMES
+from src.common.profiling import Profiler, stage
+from src.common.stage_cache import StageCache
+from src.pyqg.processor import process_dem, FILL_BACKENDS, DIRECTION_BACKENDS, TRANSLATE_BACKENDS
 
 def run_full_pipeline(
     domain_shp,
@@ -34,10 +53,88 @@ def run_full_pipeline(
     zcol=None,
     nodata=None,
     mesh_id=None,
+    mesh_level=3,
+    chunksize=None,
+    workers=1,
+    point_cache_dir=None,
+    stats=None,
+    percentiles=None,
+    keep_intermediates=False,
     min_slope=0.1,
     threshold=5,
     qgis_version: str | None = None,
-    qgis_process_path: str | None = None
+    qgis_process_path: str | None = None,
+    fill_backend="saga",
+    direction_backend="saga",
+    use_qgis_worker=False,
+    qgis_python_path: str | None = None,
+    qgis_worker=None,
+    use_qgis_model=False,
+    translate_backend="rasterio",
+    stage_cache=False,
+    tile_size=None,
+    profile=False
+):
+    """
+    メッシュ生成 → pyqg 処理を実行する
+
+    profile=True の場合は段階ごとの時間・メモリ・I/O を計測し、<output_dir>/profile に
+    run_report.json と trace.json（chrome://tracing / Perfetto で開ける）を書き出す。
+    結果の 'profile' に各パスと段階ごとの時間の一覧（summary）を入れる。
+    """
+    kwargs = dict(locals())
+    del kwargs["profile"]
+    if not profile:
+        return _run_full_pipeline(**kwargs)
+
+    profiler = Profiler()
+    result = None
+    try:
+        with profiler.activate():
+            result = _run_full_pipeline(**kwargs)
+    finally:
+        report_path, trace_path = profiler.write(Path(output_dir) / "profile")
+        summary = profiler.summary()
+        print("\n=== 段階ごとの計測結果 ===")
+        print(summary)
+        print(f"計測レポート: {report_path}")
+        print(f"トレース: {trace_path}")
+    if isinstance(result, dict):
+        result['profile'] = {'report': report_path, 'trace': trace_path, 'summary': summary}
+    return result
+
+
+def _run_full_pipeline(
+    domain_shp,
+    basin_shp,
+    num_cells_x,
+    num_cells_y,
+    points_path,
+    standard_mesh,
+    output_dir,
+    zcol,
+    nodata,
+    mesh_id,
+    mesh_level,
+    chunksize,
+    workers,
+    point_cache_dir,
+    stats,
+    percentiles,
+    keep_intermediates,
+    min_slope,
+    threshold,
+    qgis_version,
+    qgis_process_path,
+    fill_backend,
+    direction_backend,
+    use_qgis_worker,
+    qgis_python_path,
+    qgis_worker,
+    use_qgis_model,
+    translate_backend,
+    stage_cache,
+    tile_size
 ):
     # パスをPathオブジェクトに変換
     output_dir = Path(output_dir)
@@ -47,6 +144,12 @@ def run_full_pipeline(
     mesh_dir.mkdir(parents=True, exist_ok=True)
     pyqg_dir.mkdir(parents=True, exist_ok=True)
 
+    # 段階キャッシュ: 入力・パラメータが前回と同じ段階は結果を読み込み、変わった段階から下流だけを実行する
+    cache = None
+    if stage_cache:
+        cache = stage_cache if isinstance(stage_cache, StageCache) else StageCache(output_dir / ".cache" / "stages")
+        print(f"段階キャッシュ: {cache.root}")
+
     print("=" * 50)
     print("メッシュ生成パイプラインを開始します")
     print("=" * 50)
@@ -54,18 +157,28 @@ def run_full_pipeline(
     # 1) メッシュ生成＋ASC変換
     print("\n=== メッシュ生成パイプラインを実行中 ===")
     print(f"出力先: {mesh_dir}")
-    pipeline(
-        domain_shp=domain_shp,
-        basin_shp=basin_shp,
-        num_cells_x=num_cells_x,
-        num_cells_y=num_cells_y,
-        points_path=points_path,
-        out_dir=str(mesh_dir),
-        zcol=zcol,
-        nodata=nodata,
-        standard_mesh=standard_mesh,
-        mesh_id=mesh_id
-    )
+    with stage("make_shp"):
+        mesh_files = pipeline(
+            domain_shp=domain_shp,
+            basin_shp=basin_shp,
+            num_cells_x=num_cells_x,
+            num_cells_y=num_cells_y,
+            points_path=points_path,
+            out_dir=str(mesh_dir),
+            zcol=zcol,
+            nodata=nodata,
+            standard_mesh=standard_mesh,
+            mesh_id=mesh_id,
+            mesh_level=mesh_level,
+            chunksize=chunksize,
+            workers=workers,
+            point_cache_dir=point_cache_dir,
+            stats=stats,
+            percentiles=percentiles,
+            keep_intermediates=keep_intermediates,
+            stage_cache=cache,
+            tile_size=tile_size
+        )
 
     # 2) pyqg 処理
     print("\n" + "=" * 50)
@@ -83,14 +196,23 @@ def run_full_pipeline(
     print(f"最小勾配: {min_slope}")
     print(f"閾値: {threshold}")
 
-    pyqg_result = process_dem(
-        input_path=str(input_asc),
-        output_dir=str(pyqg_dir),
-        min_slope=min_slope,
-        threshold=threshold,
-        qgis_version=qgis_version,
-        qgis_process_path=qgis_process_path
-    )
+    with stage("pyqg"):
+        pyqg_result = process_dem(
+            input_path=str(input_asc),
+            output_dir=str(pyqg_dir),
+            min_slope=min_slope,
+            threshold=threshold,
+            qgis_version=qgis_version,
+            qgis_process_path=qgis_process_path,
+            fill_backend=fill_backend,
+            direction_backend=direction_backend,
+            worker=qgis_worker,
+            use_worker=use_qgis_worker,
+            qgis_python_path=qgis_python_path,
+            use_model=use_qgis_model,
+            translate_backend=translate_backend,
+            stage_cache=cache
+        )
 
     # process_dem の結果を正規化して返す
     if not isinstance(pyqg_result, dict):
@@ -115,15 +237,20 @@ def run_full_pipeline(
     print(f"pyqg 出力: {pyqg_dir}")
     print("=" * 50)
 
+    # 標高の統計量の ASC（指定時のみ）
+    mesh_outputs = {'domain_mesh_elev_asc': str(input_asc)}
+    for key, path in (mesh_files or {}).items():
+        if key.endswith('_asc') and key != 'domain_mesh_asc':
+            mesh_outputs[key] = str(path)
+
     # ✅ ここで dict を返す（GUI が期待するフォーマット）
     return {
         'success': True,
         'mesh_dir': str(mesh_dir),
         'pyqg_dir': str(pyqg_dir),
-        'mesh_outputs': {
-            'domain_mesh_elev_asc': str(input_asc)
-        },
-        'pyqg_outputs': pyqg_result.get('output_files', {})
+        'mesh_outputs': mesh_outputs,
+        'pyqg_outputs': pyqg_result.get('output_files', {}),
+        'cached_stages': list(cache.hits) if cache is not None else []
     }
 
 if __name__ == "__main__":
@@ -135,17 +262,33 @@ if __name__ == "__main__":
     parser.add_argument("--cells_x", type=int, required=True, help="X方向セル数")
     parser.add_argument("--cells_y", type=int, required=True, help="Y方向セル数")
     parser.add_argument("--points", required=True, help="点群データ (CSV/SHP)")
-    parser.add_argument("--standard-mesh", required=True, help="標準地域メッシュ (.shp)")
+    parser.add_argument("--standard-mesh", default=None, help="標準地域メッシュ (.shp)。省略時はメッシュコード計算で列挙")
     
     # オプション引数
     parser.add_argument("--outdir", default="outputs", help="出力ディレクトリ (デフォルト: outputs)")
     parser.add_argument("--zcol", help="標高値が格納されている列名 (デフォルト: 自動検出)")
     parser.add_argument("--nodata", type=float, help=f"NODATA値 (デフォルト: -9999)")
     parser.add_argument("--mesh-id", help="標準メッシュのID列名 (デフォルト: 自動検出)")
+    parser.add_argument("--mesh-level", type=int, default=3, choices=(1, 2, 3), help="メッシュコード計算時のメッシュレベル (デフォルト: 3)")
+    parser.add_argument("--chunksize", type=int, help="点群CSVを逐次読み込む行数 (デフォルト: ファイル全体を一度に読み込む)")
+    parser.add_argument("--workers", type=int, default=1, help="点群ファイルを並列に読み込むプロセス数 (デフォルト: 1)")
+    parser.add_argument("--point-cache", help="点群キャッシュの保存先フォルダ (デフォルト: キャッシュしない)")
+    parser.add_argument("--stats", nargs="*", choices=STAT_NAMES, help="平均以外に求める標高の統計量 (min, max, std)")
+    parser.add_argument("--percentiles", nargs="*", type=float, help="求める標高のパーセンタイル (例: 50 で中央値)。すべての点の標高を保持するため、点の数に比例したメモリを使う")
+    parser.add_argument("--keep-intermediates", action="store_true", help="メッシュ生成の中間ファイルも出力する")
     parser.add_argument("--min-slope", type=float, default=0.1, help="最小勾配 (デフォルト: 0.1)")
     parser.add_argument("--threshold", type=int, default=5, help="閾値 (デフォルト: 5)")
     parser.add_argument("--qgis-version", default="3.34.9", help="QGIS-LTRのバージョン (デフォルト: 3.34.9)")
     parser.add_argument("--qgis-process-path", help="qgis_processの実行ファイルパス")
+    parser.add_argument("--fill-backend", choices=FILL_BACKENDS, default="saga", help="窪地処理の実装 (デフォルト: saga)")
+    parser.add_argument("--direction-backend", choices=DIRECTION_BACKENDS, default="saga", help="流向の実装 (デフォルト: saga)")
+    parser.add_argument("--qgis-worker", action="store_true", help="QGIS の処理を常駐 worker で実行する（QGIS の起動を1回にする）")
+    parser.add_argument("--qgis-python-path", help="QGIS の Python (python-qgis-ltr.bat) のパス（--qgis-worker 用）")
+    parser.add_argument("--qgis-model", action="store_true", help="DEM処理を1つの Processing モデルとして1回の qgis_process で実行する")
+    parser.add_argument("--translate-backend", choices=TRANSLATE_BACKENDS, default="rasterio", help="SDAT → ASC 変換の実装 (デフォルト: rasterio)")
+    parser.add_argument("--stage-cache", action="store_true", help="段階ごとの結果を <outdir>/.cache/stages に保存し、変わっていない段階を再利用する")
+    parser.add_argument("--profile", action="store_true", help="段階ごとの時間・メモリ・I/O を計測し、<outdir>/profile に run_report.json と trace.json を書き出す")
+    parser.add_argument("--tile-size", type=int, help="メッシュ生成・標高付与・ASC 変換をこのセル数四方のタイルごとに行う (大規模なグリッド用。メッシュのシェープは出力しない)")
     
     args = parser.parse_args()
     
@@ -160,10 +303,26 @@ if __name__ == "__main__":
         zcol=args.zcol,
         nodata=args.nodata,
         mesh_id=args.mesh_id,
+        mesh_level=args.mesh_level,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        point_cache_dir=args.point_cache,
+        stats=args.stats,
+        percentiles=args.percentiles,
+        keep_intermediates=args.keep_intermediates,
         qgis_version=args.qgis_version,
         qgis_process_path=args.qgis_process_path,
         min_slope=args.min_slope,
-        threshold=args.threshold
+        threshold=args.threshold,
+        fill_backend=args.fill_backend,
+        direction_backend=args.direction_backend,
+        use_qgis_worker=args.qgis_worker,
+        qgis_python_path=args.qgis_python_path,
+        use_qgis_model=args.qgis_model,
+        translate_backend=args.translate_backend,
+        stage_cache=args.stage_cache,
+        tile_size=args.tile_size,
+        profile=args.profile
     )
 
 # 例：実行の仕方
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+セル数・最小勾配・閾値の組み合わせをまとめて実行するスクリプト（RRI のキャリブレーション用）
+
+組み合わせごとに run_full_pipeline を呼ぶ代わりに、共有できる結果は1回だけ作る:
+    - 標準メッシュ抽出は全体で1回、メッシュ生成・標高付与はセル数ごとに1回（段階キャッシュ）
+    - 窪地処理はセル数 × 最小勾配ごとに1回（プロセスプールで並列）
+    - 流向・ラスタ変換は組み合わせごと（プロセスプールで並列）
+    - QGIS を使う場合は、プールの各プロセスで1つずつ起動した QGIS worker を使い回す
+      （--no-qgis-worker で従来どおりステップごとの qgis_process）
+
+出力:
+    <outdir>/shared/cells_<X>x<Y>/mesh/                      メッシュ・標高付与・ASC
+    <outdir>/shared/cells_<X>x<Y>/minslope_<S>/              窪地処理済みの DEM
+    <outdir>/cells_<X>x<Y>_minslope_<S>_threshold_<T>/       組み合わせごとの mesh/ と RRI_dataset/
+    <outdir>/sweep_summary.csv                               組み合わせごとの結果の一覧
+
+使用方法:
+    python -m src.run_sweep \
+        --domain 入力領域.shp \
+        --basin 流域界.shp \
+        --points 標高点群.csv \
+        --cells 50 100 200x150 \
+        --min-slopes 0.01 0.1 \
+        --thresholds 5 10 \
+        [--standard-mesh 標準メッシュ.shp] \
+        [--outdir 出力ディレクトリ] \
+        [--processes 並列プロセス数] \
+        [--fill-backend saga|numpy] \
+        [--direction-backend saga|numpy] \
+        [--no-qgis-worker]
+"""
+import argparse
+import csv
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+
+from src.make_shp.pipeline import pipeline
+from src.make_shp.cell_stats import STAT_NAMES
+from src.common.stage_cache import StageCache
+from src.pyqg.processor import (
+    fill_dem, process_dem, needs_qgis, shared_worker_pool_args,
+    FILL_BACKENDS, DIRECTION_BACKENDS, TRANSLATE_BACKENDS
+)
+from src.pyqg.qgis_worker import shared_worker
+
+SUMMARY_CSV = "sweep_summary.csv"
+SUMMARY_COLUMNS = [
+    "cells_x", "cells_y", "min_slope", "threshold", "success", "seconds",
+    "output_dir", "filled_asc", "direction_asc", "error",
+]
+
+
+def parse_cells(text):
+    """'100' / '200x150' を (cells_x, cells_y) にする"""
+    parts = str(text).lower().split("x")
+    if len(parts) == 1:
+        return int(parts[0]), int(parts[0])
+    if len(parts) == 2:
+        return int(parts[0]), int(parts[1])
+    raise ValueError(f"セル数は 100 または 200x150 の形式で指定してください: {text}")
+
+
+def _fmt(value):
+    """フォルダ名用の数値表記（0.1 → 0.1, 5.0 → 5）"""
+    return f"{value:g}"
+
+
+def combination_name(cells, min_slope, threshold):
+    return f"cells_{cells[0]}x{cells[1]}_minslope_{_fmt(min_slope)}_threshold_{_fmt(threshold)}"
+
+
+def _copy_asc(src, dst_dir):
+    """ASC と .prj を dst_dir に複製する"""
+    src = Path(src)
+    for p in (src, src.with_suffix(".prj")):
+        if p.exists():
+            shutil.copy2(p, dst_dir / p.name)
+
+
+def _fill_job(input_asc, out_dir, min_slope, options):
+    # このプロセスの QGIS worker（run_sweep が initializer で設定した場合）を使い回す
+    worker = shared_worker() if options.get("fill_backend") == "saga" else None
+    return fill_dem(input_asc, out_dir, min_slope, worker=worker, **options)
+
+
+def _dem_job(input_asc, filled, out_dir, min_slope, threshold, options):
+    start = time.perf_counter()
+    worker = shared_worker() if needs_qgis(
+        direction_backend=options.get("direction_backend"), translate_backend=options.get("translate_backend"),
+        filled_dem=filled
+    ) else None
+    result = process_dem(input_asc, out_dir, min_slope, threshold, filled_dem=filled, worker=worker, **options)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def write_summary(rows, path):
+    """組み合わせごとの結果を CSV に書き出す"""
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def _set_error(rows, prefix, message):
+    """キーが prefix で始まる組み合わせ（セル数、またはセル数 × 最小勾配）にエラーを記録する"""
+    for key, row in rows.items():
+        if key[:len(prefix)] == prefix:
+            row["error"] = message
+
+
+def run_sweep(
+    domain_shp,
+    basin_shp,
+    cells,
+    min_slopes,
+    thresholds,
+    points_path,
+    standard_mesh,
+    output_dir="outputs_sweep",
+    zcol=None,
+    nodata=None,
+    mesh_id=None,
+    mesh_level=3,
+    chunksize=None,
+    workers=1,
+    stats=None,
+    percentiles=None,
+    processes=None,
+    qgis_version: str | None = None,
+    qgis_process_path: str | None = None,
+    fill_backend="saga",
+    direction_backend="saga",
+    translate_backend="rasterio",
+    share_qgis_worker=True,
+    qgis_python_path: str | None = None
+):
+    """
+    cells × min_slopes × thresholds のすべての組み合わせを実行する
+
+    Args:
+        cells: (cells_x, cells_y) のリスト
+        min_slopes: 最小勾配のリスト
+        thresholds: 閾値のリスト
+        processes: 窪地処理・流向を並列に実行するプロセス数（None の場合は CPU 数）
+        share_qgis_worker: QGIS を使う場合に、プールの各プロセスで QGIS worker を1つずつ起動して
+            使い回す（False の場合はステップごとに qgis_process を起動する）
+        qgis_python_path: QGIS の Python (python-qgis-ltr.bat) のパス（QGIS worker 用）
+        その他: run_full_pipeline と同じ
+
+    Returns:
+        dict: {'success', 'summary': 一覧 CSV のパス, 'results': 組み合わせごとの結果のリスト}
+    """
+    output_dir = Path(output_dir)
+    shared_dir = output_dir / "shared"
+    shared_dir.mkdir(parents=True, exist_ok=True)
+    cells = [tuple(c) for c in cells]
+    # 点群の解析結果と段階の結果は、セル数の違う実行の間でも共有する
+    cache = StageCache(output_dir / ".cache" / "stages")
+    point_cache_dir = str(output_dir / ".cache" / "points")
+    qgis_options = {"qgis_version": qgis_version, "qgis_process_path": qgis_process_path}
+
+    rows = {}
+    for c, s, t in product(cells, min_slopes, thresholds):
+        rows[(c, s, t)] = {
+            "cells_x": c[0], "cells_y": c[1], "min_slope": s, "threshold": t, "success": False,
+            "output_dir": str(output_dir / combination_name(c, s, t)),
+        }
+    print(f"組み合わせ: {len(rows)} (セル数 {len(cells)} × 最小勾配 {len(min_slopes)} × 閾値 {len(thresholds)})")
+
+    # 1) メッシュ生成・標高付与・ASC（セル数ごと）
+    mesh_ascs = {}
+    for c in cells:
+        print("\n" + "=" * 50)
+        print(f"メッシュ生成: {c[0]} x {c[1]}")
+        print("=" * 50)
+        mesh_dir = shared_dir / f"cells_{c[0]}x{c[1]}" / "mesh"
+        try:
+            mesh_files = pipeline(
+                domain_shp=domain_shp,
+                basin_shp=basin_shp,
+                num_cells_x=c[0],
+                num_cells_y=c[1],
+                points_path=points_path,
+                out_dir=str(mesh_dir),
+                zcol=zcol,
+                nodata=nodata,
+                standard_mesh=standard_mesh,
+                mesh_id=mesh_id,
+                mesh_level=mesh_level,
+                chunksize=chunksize,
+                workers=workers,
+                point_cache_dir=point_cache_dir,
+                stats=stats,
+                percentiles=percentiles,
+                stage_cache=cache
+            )
+        except Exception as e:
+            _set_error(rows, (c,), f"メッシュ生成: {e}")
+            continue
+        input_asc = mesh_dir / "domain_mesh_elev.asc"
+        if not input_asc.exists():
+            _set_error(rows, (c,), f"メッシュファイルが見つかりません: {input_asc}")
+            continue
+        mesh_ascs[c] = [str(input_asc)] + [
+            str(p) for k, p in (mesh_files or {}).items() if k.endswith('_asc') and k != 'domain_mesh_asc'
+        ]
+
+    pool_args = {}
+    if share_qgis_worker and mesh_ascs and "saga" in (fill_backend, direction_backend):
+        pool_args = shared_worker_pool_args(qgis_python_path, qgis_version, qgis_process_path)
+
+    with ProcessPoolExecutor(max_workers=processes, **pool_args) as executor:
+        # 2) 窪地処理（セル数 × 最小勾配ごと）
+        print("\n=== 窪地処理 (セル数 × 最小勾配ごと) ===")
+        fill_futures = {
+            (c, s): executor.submit(
+                _fill_job, mesh_ascs[c][0], shared_dir / f"cells_{c[0]}x{c[1]}" / f"minslope_{_fmt(s)}", s,
+                dict(qgis_options, fill_backend=fill_backend)
+            )
+            for c, s in product(mesh_ascs, min_slopes)
+        }
+        filled = {}
+        for (c, s), future in fill_futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                # ワーカープロセス自体の異常終了など
+                result = {'success': False, 'error': str(e)}
+            if result.get('success'):
+                filled[(c, s)] = result['filled_dem']
+            else:
+                _set_error(rows, (c, s), f"窪地処理: {result.get('error')}")
+
+        # 3) 流向・ラスタ変換（組み合わせごと）
+        print("\n=== 流向・ラスタ変換 (組み合わせごと) ===")
+        dem_futures = {}
+        for (c, s, t), row in rows.items():
+            if (c, s) not in filled:
+                continue
+            combo_dir = Path(row["output_dir"])
+            try:
+                (combo_dir / "mesh").mkdir(parents=True, exist_ok=True)
+                for asc in mesh_ascs[c]:
+                    _copy_asc(asc, combo_dir / "mesh")
+                dem_futures[(c, s, t)] = executor.submit(
+                    _dem_job, mesh_ascs[c][0], filled[(c, s)], combo_dir / "RRI_dataset", s, t,
+                    dict(qgis_options, direction_backend=direction_backend, translate_backend=translate_backend)
+                )
+            except Exception as e:
+                row["error"] = str(e)
+        for key, future in dem_futures.items():
+            row = rows[key]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            row["seconds"] = round(result.get('seconds', 0.0), 3)
+            if result.get('success'):
+                outputs = result.get('output_files', {})
+                row.update(success=True, filled_asc=outputs.get('filled_asc'), direction_asc=outputs.get('direction_asc'))
+            else:
+                row["error"] = result.get('error')
+
+    results = list(rows.values())
+    summary = write_summary(results, output_dir / SUMMARY_CSV)
+    n_ok = sum(1 for r in results if r["success"])
+
+    print("\n" + "=" * 50)
+    print(f"完了: {n_ok} / {len(results)} 組み合わせ")
+    for r in results:
+        mark = "✅" if r["success"] else "❌"
+        print(f"{mark} {Path(r['output_dir']).name}" + ("" if r["success"] else f": {r.get('error')}"))
+    print(f"一覧: {summary}")
+    print("=" * 50)
+
+    return {'success': n_ok == len(results), 'summary': summary, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="セル数・最小勾配・閾値の組み合わせをまとめて実行")
+    parser.add_argument("--domain", required=True, help="計算領域ポリゴン (.shp)")
+    parser.add_argument("--basin", required=True, help="流域界ポリゴン (.shp)")
+    parser.add_argument("--points", required=True, nargs="+", help="点群データ (CSV/SHP)")
+    parser.add_argument("--cells", required=True, nargs="+", help="セル数 (100 または 200x150 の形式、複数指定可)")
+    parser.add_argument("--min-slopes", nargs="+", type=float, default=[0.1], help="最小勾配 (複数指定可、デフォルト: 0.1)")
+    parser.add_argument("--thresholds", nargs="+", type=int, default=[5], help="閾値 (複数指定可、デフォルト: 5)")
+    parser.add_argument("--standard-mesh", default=None, help="標準地域メッシュ (.shp)。省略時はメッシュコード計算で列挙")
+    parser.add_argument("--outdir", default="outputs_sweep", help="出力ディレクトリ (デフォルト: outputs_sweep)")
+    parser.add_argument("--zcol", help="標高値が格納されている列名 (デフォルト: 自動検出)")
+    parser.add_argument("--nodata", type=float, help="NODATA値 (デフォルト: -9999)")
+    parser.add_argument("--mesh-id", help="標準メッシュのID列名 (デフォルト: 自動検出)")
+    parser.add_argument("--mesh-level", type=int, default=3, choices=(1, 2, 3), help="メッシュコード計算時のメッシュレベル (デフォルト: 3)")
+    parser.add_argument("--chunksize", type=int, help="点群CSVを逐次読み込む行数 (デフォルト: ファイル全体を一度に読み込む)")
+    parser.add_argument("--workers", type=int, default=1, help="点群ファイルを並列に読み込むプロセス数 (デフォルト: 1)")
+    parser.add_argument("--stats", nargs="*", choices=STAT_NAMES, help="平均以外に求める標高の統計量 (min, max, std)")
+    parser.add_argument("--percentiles", nargs="*", type=float, help="求める標高のパーセンタイル (例: 50 で中央値)")
+    parser.add_argument("--processes", type=int, help="窪地処理・流向を並列に実行するプロセス数 (デフォルト: CPU 数)")
+    parser.add_argument("--qgis-version", default="3.34.9", help="QGIS-LTRのバージョン (デフォルト: 3.34.9)")
+    parser.add_argument("--qgis-process-path", help="qgis_processの実行ファイルパス")
+    parser.add_argument("--fill-backend", choices=FILL_BACKENDS, default="saga", help="窪地処理の実装 (デフォルト: saga)")
+    parser.add_argument("--direction-backend", choices=DIRECTION_BACKENDS, default="saga", help="流向の実装 (デフォルト: saga)")
+    parser.add_argument("--translate-backend", choices=TRANSLATE_BACKENDS, default="rasterio", help="SDAT → ASC 変換の実装 (デフォルト: rasterio)")
+    parser.add_argument("--qgis-python-path", help="QGIS の Python (python-qgis-ltr.bat) のパス（QGIS worker 用）")
+    parser.add_argument("--no-qgis-worker", action="store_true", help="QGIS worker を使わず、ステップごとに qgis_process を起動する")
+    args = parser.parse_args()
+
+    run_sweep(
+        domain_shp=args.domain,
+        basin_shp=args.basin,
+        cells=[parse_cells(c) for c in args.cells],
+        min_slopes=args.min_slopes,
+        thresholds=args.thresholds,
+        points_path=args.points,
+        standard_mesh=args.standard_mesh,
+        output_dir=args.outdir,
+        zcol=args.zcol,
+        nodata=args.nodata,
+        mesh_id=args.mesh_id,
+        mesh_level=args.mesh_level,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        stats=args.stats,
+        percentiles=args.percentiles,
+        processes=args.processes,
+        qgis_version=args.qgis_version,
+        qgis_process_path=args.qgis_process_path,
+        fill_backend=args.fill_backend,
+        direction_backend=args.direction_backend,
+        translate_backend=args.translate_backend,
+        share_qgis_worker=not args.no_qgis_worker,
+        qgis_python_path=args.qgis_python_path
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# asc_reader.py
+"""
+ESRI ASCII Grid (.asc) の読み込み
+
+本体はファイル全体を一度に読み込み、NumPy でまとめて数値に変換する。
+変換結果は ASC の隣に .npy として保存し（サイドカー）、2回目以降は
+元ファイルのサイズ・更新時刻が変わっていなければ .npy をメモリマップで開く
+（テキストを解析し直さず、配列のコピーも作らない）。
+
+    - ヘッダは cellsize と、shp_to_ascii が書き出す dx / dy の両方に対応
+    - xllcorner / yllcorner と xllcenter / yllcenter の両方に対応（center は隅の座標に直す）
+
+サイドカーの構成:
+    <名前>.asc.npy        値の配列（1行目が北端）
+    <名前>.asc.npy.json   ヘッダと元ファイルのサイズ・更新時刻
+"""
+import argparse
+import json
+import os
+import uuid
+import warnings
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+# ヘッダのキー（小文字）と AscRaster.header での名前
+_HEADER_KEYS = {
+    "ncols": "ncols",
+    "nrows": "nrows",
+    "xllcorner": "xllcorner",
+    "yllcorner": "yllcorner",
+    "xllcenter": "xllcenter",
+    "yllcenter": "yllcenter",
+    "cellsize": "cellsize",
+    "dx": "dx",
+    "dy": "dy",
+    "nodata_value": "nodata",
+}
+
+
+class AscRaster:
+    """
+    読み込んだ ASC
+
+    - header: ncols, nrows, xllcorner, yllcorner, dx, dy, nodata の辞書
+      （cellsize 形式のファイルでは dx = dy = cellsize）
+    - data: (nrows, ncols) の配列。キャッシュから開いた場合は読み取り専用のメモリマップ
+    """
+
+    __slots__ = ("path", "header", "data")
+
+    def __init__(self, path, header, data):
+        self.path = path
+        self.header = header
+        self.data = data
+
+    def __repr__(self):
+        h = self.header
+        return (f"AscRaster({self.path!r}, ncols={h['ncols']}, nrows={h['nrows']}, "
+                f"dx={h['dx']}, dy={h['dy']}, nodata={h['nodata']})")
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nodata(self):
+        return self.header["nodata"]
+
+    @property
+    def bounds(self):
+        """(minx, miny, maxx, maxy)"""
+        h = self.header
+        return (h["xllcorner"], h["yllcorner"],
+                h["xllcorner"] + h["ncols"] * h["dx"], h["yllcorner"] + h["nrows"] * h["dy"])
+
+    def masked(self):
+        """NoData を NaN にした float64 の配列（コピー）"""
+        out = np.array(self.data, dtype=np.float64)
+        if self.nodata is not None:
+            out[out == self.nodata] = np.nan
+        return out
+
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and "." not in text and "e" not in text.lower() else value
+
+
+def parse_header(buf):
+    """
+    ASC 先頭のヘッダを解析する
+
+    Args:
+        buf: ファイル内容（bytes）
+
+    Returns:
+        (header, offset): 正規化したヘッダの辞書と、本体の開始位置
+    """
+    raw = {}
+    offset = 0
+    while offset < len(buf):
+        end = buf.find(b"\n", offset)
+        end = len(buf) if end < 0 else end + 1
+        parts = buf[offset:end].split()
+        if not parts:
+            offset = end
+            continue
+        key = parts[0].decode("ascii", errors="replace").lower()
+        if key not in _HEADER_KEYS:
+            break
+        if len(parts) < 2:
+            raise ValueError(f"ヘッダの値がありません: {key}")
+        raw[_HEADER_KEYS[key]] = _number(parts[1].decode("ascii"))
+        offset = end
+
+    for key in ("ncols", "nrows"):
+        if key not in raw:
+            raise ValueError(f"ヘッダに {key} がありません")
+    if "cellsize" in raw:
+        dx = dy = raw["cellsize"]
+    elif "dx" in raw and "dy" in raw:
+        dx, dy = raw["dx"], raw["dy"]
+    else:
+        raise ValueError("ヘッダに cellsize または dx / dy がありません")
+
+    if "xllcorner" in raw:
+        xll = raw["xllcorner"]
+    elif "xllcenter" in raw:
+        xll = raw["xllcenter"] - dx / 2
+    else:
+        raise ValueError("ヘッダに xllcorner または xllcenter がありません")
+    if "yllcorner" in raw:
+        yll = raw["yllcorner"]
+    elif "yllcenter" in raw:
+        yll = raw["yllcenter"] - dy / 2
+    else:
+        raise ValueError("ヘッダに yllcorner または yllcenter がありません")
+
+    header = {
+        "ncols": int(raw["ncols"]),
+        "nrows": int(raw["nrows"]),
+        "xllcorner": xll,
+        "yllcorner": yll,
+        "dx": dx,
+        "dy": dy,
+        "nodata": raw.get("nodata"),
+    }
+    return header, offset
+
+
+def parse_asc(path, dtype=np.float64):
+    """
+    ASC をテキストとして解析する（キャッシュを使わない）
+
+    Returns:
+        AscRaster: data は通常の ndarray
+    """
+    with open(path, "rb") as f:
+        buf = f.read()
+    header, offset = parse_header(buf)
+    nrows, ncols = header["nrows"], header["ncols"]
+    # 本体全体を1回で数値に変換する（途中で解析できない文字があると要素数が不足する）
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        values = np.fromstring(buf[offset:], dtype=np.float64, sep=" ")
+    if values.size != nrows * ncols:
+        raise ValueError(
+            f"値の数がヘッダと一致しません: {path} ({values.size} != {nrows} x {ncols})"
+        )
+    data = values.reshape(nrows, ncols)
+    if np.dtype(dtype) != data.dtype:
+        data = data.astype(dtype)
+    return AscRaster(str(path), header, data)
+
+
+def _cache_paths(path, cache_dir):
+    if cache_dir is None:
+        npy = f"{path}.npy"
+    else:
+        name = os.path.basename(path)
+        npy = os.path.join(str(cache_dir), f"{name}.npy")
+    return npy, f"{npy}.json"
+
+
+def _source(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _load_cached(path, npy_path, meta_path, dtype):
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("version") != CACHE_VERSION
+                or meta.get("source") != _source(path)
+                or meta.get("dtype") != np.dtype(dtype).str):
+            return None
+        data = np.load(npy_path, mmap_mode="r")
+        header = meta["header"]
+        if data.shape != (header["nrows"], header["ncols"]):
+            return None
+        return AscRaster(str(path), header, data)
+    except Exception as e:
+        print(f"[WARNING] ASC のキャッシュを読み込めません: {npy_path} - {e}")
+        return None
+
+
+def _save_cache(raster, source, npy_path, meta_path):
+    """一時ファイルに書いてから置き換える（書き込み途中のサイドカーを読ませない）"""
+    tag = uuid.uuid4().hex
+    tmp_npy = f"{npy_path}.{tag}.tmp"
+    tmp_meta = f"{meta_path}.{tag}.tmp"
+    try:
+        out_dir = os.path.dirname(npy_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(tmp_npy, "wb") as f:
+            np.save(f, raster.data)
+        meta = {
+            "version": CACHE_VERSION,
+            "source": source,
+            "dtype": raster.data.dtype.str,
+            "header": raster.header,
+        }
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        # .npy を先に置き換え、meta が揃った時点で有効になる
+        os.replace(tmp_npy, npy_path)
+        os.replace(tmp_meta, meta_path)
+        return True
+    except OSError as e:
+        print(f"[WARNING] ASC のキャッシュを書き込めません: {npy_path} - {e}")
+        for p in (tmp_npy, tmp_meta):
+            if os.path.exists(p):
+                os.remove(p)
+        return False
+
+
+def read_asc(path, cache=True, cache_dir=None, dtype=np.float64):
+    """
+    ASC を読み込む
+
+    Args:
+        path: ASC ファイルのパス
+        cache: True の場合は .npy のサイドカーを使う（無い・古い場合は作成する）
+        cache_dir: サイドカーの保存先。None の場合は ASC と同じフォルダ
+        dtype: 値の型
+
+    Returns:
+        AscRaster: キャッシュを使った場合、data は読み取り専用のメモリマップ
+    """
+    path = str(path)
+    if not cache:
+        return parse_asc(path, dtype)
+
+    npy_path, meta_path = _cache_paths(path, cache_dir)
+    raster = _load_cached(path, npy_path, meta_path, dtype)
+    if raster is not None:
+        return raster
+
+    # 解析中に元ファイルが書き換えられた場合に備え、解析前の状態を記録する
+    source = _source(path)
+    raster = parse_asc(path, dtype)
+    if _save_cache(raster, source, npy_path, meta_path):
+        cached = _load_cached(path, npy_path, meta_path, dtype)
+        if cached is not None:
+            return cached
+    return raster
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASC を読み込み、.npy のキャッシュを作成する")
+    parser.add_argument("asc", nargs="+", help="ASC ファイル")
+    parser.add_argument("--cache-dir", default=None, help="キャッシュの保存先（既定: ASC と同じフォルダ）")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わずに読み込む")
+    args = parser.parse_args()
+
+    for path in args.asc:
+        raster = read_asc(path, cache=not args.no_cache, cache_dir=args.cache_dir)
+        data = raster.data
+        valid = data[data != raster.nodata] if raster.nodata is not None else data
+        print(f"[INFO] {raster}")
+        if valid.size:
+            print(f"[INFO]   有効セル数: {valid.size}, 最小: {valid.min()}, 最大: {valid.max()}")
+        else:
+            print("[INFO]   有効セルがありません")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# asc_writer.py
+"""
+ESRI ASCII Grid (.asc) の書き出し
+
+ヘッダと .prj を一度だけ書き、値は行のまとまり（チャンク）ごとに NumPy で
+固定幅の文字列へ一括変換して書き込む。np.savetxt(fmt='%12.3f') と同じ出力になる。
+
+    - 書式は '%W.Pf'（固定小数）と '%Wd'（整数）に対応
+    - 丸めの境界に近い値・非有限値・幅に収まらない値は Python の % 書式で個別に変換する
+      （出力を np.savetxt と完全に一致させるため）
+    - threads > 1 の場合はチャンクの変換を複数スレッドで行い、書き込みは行順に行う。
+      同時に保持するチャンク数を制限するため、メモリ使用量はラスタの大きさに依存しない
+    - AscRowWriter はラスタ全体を配列として持たずに、北から順に行のまとまりを書き足す
+      （タイル処理で使用。出力は write_asc と同じ）
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pyproj import CRS
+
+# 1チャンクあたりの目安のセル数
+CHUNK_CELLS = 1_000_000
+
+_FMT_RE = re.compile(r"^%(\d+)(?:\.(\d+))?([fd])$")
+_SPACE = ord(" ")
+_ZERO = ord("0")
+
+
+def asc_header(ncols, nrows, xllcorner, yllcorner, dx, dy, nodata):
+    """shp_to_ascii と同じ形式（dx / dy を別々に持つ）のヘッダ文字列"""
+    return (
+        f"ncols {ncols}\n"
+        f"nrows {nrows}\n"
+        f"xllcorner {xllcorner}\n"
+        f"yllcorner {yllcorner}\n"
+        f"dx {dx}\n"
+        f"dy {dy}\n"
+        f"NODATA_value {nodata}\n"
+    )
+
+
+def write_prj(asc_path, crs):
+    """ASC と同名の .prj を ESRI WKT で書き出す（crs が None の場合は何もしない）"""
+    if crs is None:
+        return None
+    prj_path = os.path.splitext(str(asc_path))[0] + ".prj"
+    wkt = CRS.from_user_input(crs).to_wkt("WKT1_ESRI")
+    with open(prj_path, "w", encoding="utf-8") as f:
+        f.write(wkt)
+    return prj_path
+
+
+def _parse_fmt(fmt):
+    m = _FMT_RE.match(fmt)
+    if not m:
+        raise ValueError(f"未対応の書式です: {fmt}（'%W.Pf' または '%Wd' で指定してください）")
+    width = int(m.group(1))
+    kind = m.group(3)
+    precision = int(m.group(2) or 0) if kind == "f" else 0
+    return width, precision, kind
+
+
+def format_rows(rows, fmt="%12.3f"):
+    """
+    2次元配列を ASC の本体（行ごとに ' ' 区切り、末尾改行）のバイト列に変換する
+
+    Args:
+        rows: (n, ncols) の数値配列
+        fmt: 値の書式（'%W.Pf' または '%Wd'）
+
+    Returns:
+        bytes
+    """
+    width, precision, kind = _parse_fmt(fmt)
+    rows = np.asarray(rows)
+    n, ncols = rows.shape
+    if n == 0:
+        return b""
+    values = rows.astype(np.float64).ravel()
+
+    # 整数化した値（固定小数は 10^P 倍して丸める。%d は Python と同じく 0 方向に切り捨て）
+    scale = 10 ** precision
+    finite = np.isfinite(values)
+    safe = np.where(finite, values, 0.0)
+    if kind == "f":
+        scaled = safe * scale
+        fixed = np.rint(scaled)
+        # 丸めの境界（x.5）に近い値は浮動小数の誤差で結果が変わりうるため個別に変換する
+        # （10^P 倍した値の誤差が 1e-4 を超えうる非常に大きな値も同様）
+        slow = ~finite | (np.abs(scaled - fixed) > 0.4999) | (np.abs(scaled) >= 1e11)
+    else:
+        fixed = np.trunc(safe)
+        slow = ~finite
+    slow |= np.abs(fixed) >= 2.0 ** 62
+    fixed = np.where(slow, 0.0, fixed)
+    # '%f' は -0.0 や丸めて 0 になる負の値にも '-' を付ける。'%d' は整数化後の符号
+    negative = np.signbit(safe) if kind == "f" else fixed < 0
+    negative &= ~slow
+    int_part, frac_part = np.divmod(np.abs(fixed).astype(np.int64), scale)
+
+    # 文字位置ごと（列ごと）に全セル分をまとめて埋め、最後に転置する。
+    # buf[j] はセルの j 文字目（右詰め、最後の1文字は区切り）
+    buf = np.full((width + 1, values.size), _SPACE, dtype=np.uint8)
+    col = width - 1
+    for _ in range(precision):
+        frac_part, digit = np.divmod(frac_part, 10)
+        buf[col] = _ZERO + digit
+        col -= 1
+    if kind == "f" and precision > 0:
+        buf[col] = ord(".")
+        col -= 1
+    # 整数部は1桁目を必ず書き、以降は上位の桁が残っている間だけ書く。符号はその左
+    sign_pending = negative
+    digits = int_part
+    first = True
+    while col >= 0:
+        active = np.ones(values.size, dtype=bool) if first else digits > 0
+        if not first and not active.any() and not sign_pending.any():
+            break
+        digits, digit = np.divmod(digits, 10)
+        buf[col] = np.where(active, _ZERO + digit, np.where(sign_pending, ord("-"), _SPACE))
+        sign_pending = sign_pending & active
+        first = False
+        col -= 1
+    # 幅に収まらない値（整数部の桁または符号が残った）は個別に変換する
+    slow |= (digits > 0) | sign_pending
+    buf = np.ascontiguousarray(buf.T)
+
+    # 個別に変換する値（幅に収まる場合のみ）。収まらない値を含む行は行ごと Python で変換する
+    wide_rows = set()
+    for i in np.flatnonzero(slow):
+        v = values[i]
+        text = (fmt % (int(v) if kind == "d" and np.isfinite(v) else v)).encode("ascii")
+        if len(text) == width:
+            buf[i, :width] = np.frombuffer(text, dtype=np.uint8)
+        else:
+            wide_rows.add(i // ncols)
+
+    buf = buf.reshape(n, ncols, width + 1)
+    buf[:, -1, width] = ord("\n")
+    if not wide_rows:
+        return buf.tobytes()
+
+    out = []
+    for r in range(n):
+        if r in wide_rows:
+            line = " ".join(fmt % (int(v) if kind == "d" and np.isfinite(v) else v) for v in rows[r].astype(np.float64))
+            out.append((line + "\n").encode("ascii"))
+        else:
+            out.append(buf[r].tobytes())
+    return b"".join(out)
+
+
+def write_asc(path, array, xllcorner, yllcorner, dx, dy, nodata, crs=None, fmt="%12.3f",
+              threads=1, chunk_cells=CHUNK_CELLS):
+    """
+    2次元配列を ESRI ASCII Grid として書き出す
+
+    Args:
+        path: 出力ファイルパス (.asc)
+        array: (nrows, ncols) の配列（1行目が北端）
+        xllcorner, yllcorner: 左下隅の座標
+        dx, dy: セルサイズ
+        nodata: NoData値（ヘッダに書く値）
+        crs: 座標参照系。指定すると .prj を書き出す
+        fmt: 値の書式（'%W.Pf' または '%Wd'）
+        threads: 書式変換に使うスレッド数
+        chunk_cells: 1チャンクあたりの目安のセル数
+    """
+    array = np.asarray(array)
+    if array.ndim != 2:
+        raise ValueError(f"2次元配列を指定してください: shape={array.shape}")
+    nrows, ncols = array.shape
+    _parse_fmt(fmt)
+
+    out_dir = os.path.dirname(str(path))
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    rows_per_chunk = max(1, int(chunk_cells) // max(ncols, 1))
+    starts = range(0, nrows, rows_per_chunk)
+    with open(path, "wb") as f:
+        f.write(asc_header(ncols, nrows, xllcorner, yllcorner, dx, dy, nodata).encode("ascii"))
+        if threads <= 1 or nrows <= rows_per_chunk:
+            for s in starts:
+                f.write(format_rows(array[s:s + rows_per_chunk], fmt))
+        else:
+            # 変換中のチャンクを threads * 2 個までに抑え、行順に書き込む
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                pending = []
+                for s in starts:
+                    pending.append(executor.submit(format_rows, array[s:s + rows_per_chunk], fmt))
+                    if len(pending) >= threads * 2:
+                        f.write(pending.pop(0).result())
+                for future in pending:
+                    f.write(future.result())
+
+    write_prj(path, crs)
+    return path
+
+
+class AscRowWriter:
+    """
+    ESRI ASCII Grid を行のまとまりごとに書き出す（ラスタ全体をメモリに置かない）
+
+    with AscRowWriter(path, ncols, nrows, ...) as writer:
+        writer.write(rows)   # 北から順に (n, ncols) の配列を渡す
+
+    閉じるときに書いた行数が nrows と一致するか確認し、.prj を書き出す。
+    """
+
+    def __init__(self, path, ncols, nrows, xllcorner, yllcorner, dx, dy, nodata, crs=None, fmt="%12.3f"):
+        _parse_fmt(fmt)
+        self.path = path
+        self.ncols = int(ncols)
+        self.nrows = int(nrows)
+        self.crs = crs
+        self.fmt = fmt
+        self.rows_written = 0
+        out_dir = os.path.dirname(str(path))
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        self._f = open(path, "wb")
+        self._f.write(asc_header(ncols, nrows, xllcorner, yllcorner, dx, dy, nodata).encode("ascii"))
+
+    def write(self, rows):
+        """(n, ncols) の配列を続きの行として書き込む"""
+        rows = np.asarray(rows)
+        if rows.ndim != 2 or rows.shape[1] != self.ncols:
+            raise ValueError(f"列数が一致しません: shape={rows.shape}, ncols={self.ncols}")
+        self.write_formatted(format_rows(rows, self.fmt), rows.shape[0])
+
+    def write_formatted(self, data, nrows):
+        """format_rows で整形済みの nrows 行分のバイト列を続きの行として書き込む"""
+        if self.rows_written + nrows > self.nrows:
+            raise ValueError(f"行数が nrows を超えます: {self.rows_written + nrows} > {self.nrows}")
+        self._f.write(data)
+        self.rows_written += nrows
+
+    def close(self):
+        """ファイルを閉じ、.prj を書き出す。書いた行数が足りない場合は ValueError"""
+        if self._f is None:
+            return
+        self._f.close()
+        self._f = None
+        if self.rows_written != self.nrows:
+            raise ValueError(f"書き込んだ行数が nrows と一致しません: {self.rows_written} != {self.nrows}")
+        write_prj(self.path, self.crs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._f is not None:
+            self._f.close()
+            self._f = None
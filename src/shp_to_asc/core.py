@@ -2,10 +2,15 @@
 import os
 import geopandas as gpd
 import numpy as np
-import rasterio
 from rasterio.transform import from_bounds
 from rasterio.features import rasterize
 
+from src.common.gdf_io import read_gdf
+from src.shp_to_asc.asc_writer import write_asc, format_rows, AscRowWriter
+
+# ASC の書式変換に使うスレッド数
+WRITE_THREADS = min(os.cpu_count() or 1, 4)
+
 def analyze_grid_structure(shp_path):
     """
     shapefileのグリッド構造を分析して詳細な情報を返す
@@ -104,13 +109,13 @@ def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
     グリッド数は入力シェープファイルのフィーチャに基づいて自動設定される
 
     Parameters:
-        shp_path: 入力シェープファイルパス
+        shp_path: 入力シェープファイルパス（または GeoDataFrame）
         field: 属性フィールド名
         nodata: NoData値
         output_path: 出力ファイルパス (.asc)
         bounds: (minx, miny, maxx, maxy) を指定すると範囲を上書き
     """
-    gdf = gpd.read_file(shp_path)
+    gdf = read_gdf(shp_path)
     if gdf.empty:
         raise RuntimeError("シェープファイルにフィーチャが含まれていません")
     
@@ -128,24 +133,8 @@ def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
     ncols = max(1, int(round((maxx - minx) / min(maxx - minx, min(maxxs) - min(minxs)))))
     nrows = max(1, int(round((maxy - miny) / min(maxy - miny, min(maxys) - min(minys)))))
     
-    # セルサイズを計算（範囲を正確にカバーするように調整）
-    dx = (maxx - minx) / ncols
-    dy = (maxy - miny) / nrows
-    
-    # グリッドの実際の範囲（シェープの範囲と完全に一致）
-    grid_width = ncols * dx
-    grid_height = nrows * dy
-    
-    # グリッドの中心をシェープの中心に合わせる
-    shape_center_x = (minx + maxx) / 2
-    shape_center_y = (miny + maxy) / 2
-    
-    # グリッドの範囲を再計算
-    grid_minx = shape_center_x - grid_width / 2
-    grid_maxx = shape_center_x + grid_width / 2
-    grid_miny = shape_center_y - grid_height / 2
-    grid_maxy = shape_center_y + grid_height / 2
-    
+    grid_minx, grid_miny, grid_maxx, grid_maxy, dx, dy = _grid_frame(minx, miny, maxx, maxy, ncols, nrows)
+
     print(f"セル数: {ncols} x {nrows}")
     print(f"セルサイズ: dx={dx:.12f}, dy={dy:.12f}")
     print(f"シェープ範囲: minx={minx:.12f}, miny={miny:.12f}, maxx={maxx:.12f}, maxy={maxy:.12f}")
@@ -165,43 +154,116 @@ def shp_to_ascii(shp_path, field, output_path, nodata=None, bounds=None):
         dtype='float32'
     )
 
-    # NoData以外の値を小数点以下4桁に丸める
-    raster[raster != nodata] = np.round(raster[raster != nodata], 3)
-    # 1. rasterioで一度ファイルを出力する（.prjファイルも自動生成される）
-    out_dir = os.path.dirname(output_path)
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
-
-    profile = {
-        'driver': 'AAIGrid',
-        'height': nrows,
-        'width': ncols,
-        'count': 1,
-        'dtype': 'float32',
-        'transform': transform,
-        'nodata': nodata,
-        'crs': gdf.crs
-    }
-    with rasterio.open(output_path, 'w', **profile) as dst:
-        dst.write(raster, 1)
-
-    # 2. 出力した.ascファイルを整形して上書きする
-    header = (
-        f"ncols {ncols}\n"
-        f"nrows {nrows}\n"
-        f"xllcorner {grid_minx}\n"
-        f"yllcorner {grid_miny}\n"
-        f"dx {dx}\n"
-        f"dy {dy}\n"
-        f"NODATA_value {nodata}\n"
-    )
-    with open(output_path, 'w') as f:
-        f.write(header)
-        np.savetxt(f, raster, fmt='%12.3f')
+    _write_ascii(output_path, raster, grid_minx, grid_miny, dx, dy, nodata, gdf.crs)
 
     # 実際のグリッド数を返す
     return ncols, nrows, dx, dy
 
+
+def grid_to_ascii(grid, cell_ids, values, output_path, nodata=None, crs=None):
+    """
+    等間隔グリッド（generate_mesh のメッシュ）の値を、ラスタ化せずに ASC 形式で出力する
+
+    セルIDはラスタ順（row * nx + col、row=0 が北端）なので、値をセルIDの位置に
+    置くだけで ASC の行列になる。ヘッダ・値の丸め・書式は shp_to_ascii と同じ。
+
+    Parameters:
+        grid: RegularGrid
+        cell_ids: 各値のグリッド内セルID
+        values: セルの値（cell_ids と同じ長さ）
+        output_path: 出力ファイルパス (.asc)
+        nodata: NoData値（値の無いセル）
+        crs: 座標参照系（.prj の出力に使用）
+    """
+    ncols, nrows = grid.nx, grid.ny
+    minx, miny, maxx, maxy = grid.bounds
+    grid_minx, grid_miny, grid_maxx, grid_maxy, dx, dy = _grid_frame(minx, miny, maxx, maxy, ncols, nrows)
+    print(f"セル数: {ncols} x {nrows}（グリッド定義から直接出力）")
+    print(f"セルサイズ: dx={dx:.12f}, dy={dy:.12f}")
+
+    raster = np.full(ncols * nrows, nodata, dtype='float32')
+    raster[np.asarray(cell_ids, dtype=np.int64)] = np.asarray(values, dtype='float32')
+    raster = raster.reshape(nrows, ncols)
+
+    _write_ascii(output_path, raster, grid_minx, grid_miny, dx, dy, nodata, crs)
+    return ncols, nrows, dx, dy
+
+
+def _grid_frame(minx, miny, maxx, maxy, ncols, nrows):
+    """範囲とセル数から、出力グリッドの範囲 (minx, miny, maxx, maxy) とセルサイズ (dx, dy) を求める"""
+    # セルサイズを計算（範囲を正確にカバーするように調整）
+    dx = (maxx - minx) / ncols
+    dy = (maxy - miny) / nrows
+    
+    # グリッドの実際の範囲（シェープの範囲と完全に一致）
+    grid_width = ncols * dx
+    grid_height = nrows * dy
+    
+    # グリッドの中心をシェープの中心に合わせる
+    shape_center_x = (minx + maxx) / 2
+    shape_center_y = (miny + maxy) / 2
+    
+    # グリッドの範囲を再計算
+    grid_minx = shape_center_x - grid_width / 2
+    grid_maxx = shape_center_x + grid_width / 2
+    grid_miny = shape_center_y - grid_height / 2
+    grid_maxy = shape_center_y + grid_height / 2
+    return grid_minx, grid_miny, grid_maxx, grid_maxy, dx, dy
+
+
+def _round_values(raster, nodata):
+    """NoData以外の値を小数点以下3桁に丸める（raster を更新する）"""
+    raster[raster != nodata] = np.round(raster[raster != nodata], 3)
+    return raster
+
+
+def _write_ascii(output_path, raster, grid_minx, grid_miny, dx, dy, nodata, crs):
+    """ラスタ配列を ASC 形式（dx/dy ヘッダ、%12.3f）と .prj で書き出す"""
+    _round_values(raster, nodata)
+    write_asc(output_path, raster, grid_minx, grid_miny, dx, dy, nodata, crs=crs,
+              fmt='%12.3f', threads=WRITE_THREADS)
+
+
+class GridAsciiWriter:
+    """
+    等間隔グリッドの値を、北から行のまとまりごとに ASC へ書き出す（タイル処理用）
+
+    ヘッダ・値の型（float32）・丸め・書式は grid_to_ascii と同じで、
+    すべての行を書き終えると grid_to_ascii で一度に書いた場合と同じファイルになる。
+    """
+
+    def __init__(self, grid, output_path, nodata=None, crs=None):
+        grid_minx, grid_miny, _, _, dx, dy = _grid_frame(*grid.bounds, grid.nx, grid.ny)
+        self.nodata = nodata
+        self._writer = AscRowWriter(output_path, grid.nx, grid.ny, grid_minx, grid_miny, dx, dy, nodata,
+                                    crs=crs, fmt='%12.3f')
+
+    def write(self, rows):
+        """(n, nx) の値（NoData を含む）を続きの行として書き込む"""
+        self._writer.write(_round_values(np.asarray(rows, dtype='float32').copy(), self.nodata))
+
+    def format(self, block):
+        """
+        (n, 列数) の値を write と同じ丸め・書式のバイト列にする（各行は ' ' 区切り、末尾改行）
+
+        値は1つずつ同じ幅で書くため、隣り合う列の範囲の行を ' ' でつなぐと、
+        まとめて書いた行と同じになる（タイルの列ごとに整形してから行をつなぐ場合に使う）。
+        """
+        return format_rows(_round_values(np.asarray(block, dtype='float32').copy(), self.nodata), '%12.3f')
+
+    def write_formatted(self, data, nrows):
+        """format で整形済みの nrows 行（列数は nx）を続きの行として書き込む"""
+        self._writer.write_formatted(data, nrows)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._writer.__exit__(*exc)
+
 def main():
     shp_path = r"C:\Users\yuuta.ochiai\Documents\GitHub\geo-mesh-processor\outputs\domain_mesh_elev.shp"
     field = "elevation"
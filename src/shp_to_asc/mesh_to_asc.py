@@ -8,36 +8,89 @@
 import os
 import argparse
 from pathlib import Path
-from .core import shp_to_ascii
+
+import geopandas as gpd
+
+import numpy as np
+
+from src.make_shp.regular_grid import CELL_ID_COLUMN, GridMesh
+from .core import grid_to_ascii, shp_to_ascii
+
+
+def _grid_values(input_mesh, field, mesh):
+    """
+    等間隔グリッドのメッシュであれば (grid, セルID, 値, crs) を返す（ラスタ化を省略できる場合）。
+    グリッド定義が無い・複数グリッド・cell_id 列が無い場合は None。
+    """
+    if mesh is None and isinstance(input_mesh, Path):
+        mesh = GridMesh.read_sidecar(input_mesh)
+    if mesh is None or not mesh.is_single_grid:
+        return None
+
+    if isinstance(input_mesh, Path):
+        # ジオメトリは不要なので属性だけを読み込む
+        try:
+            table = gpd.read_file(input_mesh, columns=[CELL_ID_COLUMN, field], ignore_geometry=True)
+        except Exception:
+            return None
+        crs = mesh.crs
+    else:
+        table = input_mesh
+        crs = input_mesh.crs
+    if CELL_ID_COLUMN not in table.columns or field not in table.columns:
+        return None
+
+    grid = mesh.grid
+    cell_ids = table[CELL_ID_COLUMN].to_numpy(dtype=np.int64)
+    if cell_ids.size == 0 or cell_ids.min() < 0 or cell_ids.max() >= grid.size or not table[CELL_ID_COLUMN].is_unique:
+        return None
+    return grid, cell_ids, table[field].to_numpy(dtype=np.float64), crs
+
 
 def convert_mesh_to_asc(
-    input_mesh: str | Path,
+    input_mesh: str | Path | gpd.GeoDataFrame,
     output_asc: str | Path,
     field: str = "elevation",
-    nodata: float = -9999.0
+    nodata: float = -9999.0,
+    mesh: GridMesh | None = None
 ) -> None:
     """
     メッシュデータをASC形式に変換する
+
+    generate_mesh の等間隔グリッドのメッシュ（cell_id 列があり、mesh の指定または
+    <name>.grid.json のグリッド定義がある）の場合は、ポリゴンをラスタ化せずに
+    セルIDの位置へ値を並べて直接出力する。それ以外は shp_to_ascii でラスタ化する。
     
     Args:
-        input_mesh: 入力メッシュファイルパス (.shp)
+        input_mesh: 入力メッシュファイルパス (.shp)、またはメッシュの GeoDataFrame
         output_asc: 出力ASCファイルパス
         field: 標高値が格納されているフィールド名
         nodata: NoData値
+        mesh: メッシュのグリッド定義 (GridMesh)。省略時はシェープの隣のグリッド定義を探す
     """
-    input_mesh = Path(input_mesh)
+    if not isinstance(input_mesh, gpd.GeoDataFrame):
+        input_mesh = Path(input_mesh)
     output_asc = Path(output_asc)
     
     # 出力ディレクトリが存在しない場合は作成
     output_asc.parent.mkdir(parents=True, exist_ok=True)
     
-    print(f"メッシュをASC形式に変換中: {input_mesh} -> {output_asc}")
+    source = input_mesh if isinstance(input_mesh, Path) else f"(メモリ上のメッシュ {len(input_mesh)} セル)"
+    print(f"メッシュをASC形式に変換中: {source} -> {output_asc}")
     print(f"  標高フィールド: {field}")
     print(f"  NoData値: {nodata}")
     
+    # 等間隔グリッドであれば値を並べて直接出力
+    direct = _grid_values(input_mesh, field, mesh)
+    if direct is not None:
+        grid, cell_ids, values, crs = direct
+        grid_to_ascii(grid, cell_ids, values, str(output_asc), nodata=nodata, crs=crs)
+        print(f"変換が完了しました: {output_asc}")
+        return output_asc
+
     # 変換を実行
     shp_to_ascii(
-        shp_path=str(input_mesh),
+        shp_path=str(input_mesh) if isinstance(input_mesh, Path) else input_mesh,
         field=field,
         output_path=str(output_asc),
         nodata=nodata
@@ -46,6 +99,29 @@ def convert_mesh_to_asc(
     print(f"変換が完了しました: {output_asc}")
     return output_asc
 
+def convert_values_to_asc(
+    mesh: GridMesh,
+    values,
+    output_asc: str | Path,
+    nodata: float = -9999.0
+):
+    """
+    GridMesh の全セル（通しID順）の値を ASC 形式で出力する（add_elevation.mesh_elevation の結果用）
+
+    単一グリッドの場合はポリゴンを作らずに値を並べて出力する。
+    複数グリッドの場合はメッシュの GeoDataFrame を生成して shp_to_ascii でラスタ化する。
+    """
+    output_asc = Path(output_asc)
+    output_asc.parent.mkdir(parents=True, exist_ok=True)
+    print(f"メッシュの値をASC形式に変換中: {mesh} -> {output_asc}")
+    if mesh.is_single_grid:
+        grid = mesh.grid
+        grid_to_ascii(grid, np.arange(grid.size, dtype=np.int64), values, str(output_asc), nodata=nodata, crs=mesh.crs)
+        print(f"変換が完了しました: {output_asc}")
+        return output_asc
+    return convert_mesh_to_asc(mesh.domain_frame({"value": values}), output_asc, field="value", nodata=nodata, mesh=mesh)
+
+
 def main():
     # コマンドライン引数の設定
     parser = argparse.ArgumentParser(description='メッシュデータをASC形式に変換')
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# src パッケージ（from src.... の import）をリポジトリのルートから読み込む
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
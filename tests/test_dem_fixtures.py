@@ -0,0 +1,100 @@
+"""
+窪地処理（priority_flood）と D8 流向（flow_direction）の小さな DEM による確認
+
+tests/data/<ケース>/ の構成:
+    dem.asc                          入力 DEM（dx = dy = 10）
+    filled_minslope_<S>.asc          窪地処理の期待値（手計算）
+    direction_minslope_<S>.asc       filled_minslope_<S> の流向の期待値（手計算）
+    saga/                            SAGA の出力（tools/make_saga_references.py で作成。ある場合のみ比較）
+
+ケース:
+    pit_nodata  内部の窪地は埋まり、NoData に接する窪地は流出口として残る。MINSLOPE = 0 では埋めた窪地が
+                隣と同じ高さの平坦部になり、0.1 では嵩上げ分だけ (3, 2) の流向が変わる
+    corridor    グリッドの端から流れ出る平坦な谷。MINSLOPE > 0 では流出口から勾配が付く
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.pyqg.priority_flood import fill_sinks, fill_sinks_asc, read_raster, valid_mask
+from src.pyqg.flow_direction import NO_DIRECTION, dead_ends, flow_direction_asc
+
+DATA = Path(__file__).resolve().parent / "data"
+CASES = ("pit_nodata", "corridor")
+MIN_SLOPES = ("0", "0.1")
+
+
+def _assert_same_raster(actual_path, expected_path, atol=0.0):
+    actual, actual_nodata = read_raster(actual_path)
+    expected, expected_nodata = read_raster(expected_path)
+    assert actual.shape == expected.shape
+    valid = valid_mask(expected, expected_nodata)
+    np.testing.assert_array_equal(valid_mask(actual, actual_nodata), valid)
+    np.testing.assert_allclose(actual[valid], expected[valid], rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize("min_slope", MIN_SLOPES)
+@pytest.mark.parametrize("case", CASES)
+def test_fill_sinks(tmp_path, case, min_slope):
+    out = fill_sinks_asc(DATA / case / "dem.asc", tmp_path / "filled.asc", min_slope=float(min_slope))
+    # 期待値は小数6桁。MINSLOPE の嵩上げは単精度で積み上げるため、その丸め分を許す
+    _assert_same_raster(out, DATA / case / f"filled_minslope_{min_slope}.asc", atol=2e-6)
+
+
+@pytest.mark.parametrize("min_slope", MIN_SLOPES)
+@pytest.mark.parametrize("case", CASES)
+def test_flow_direction(tmp_path, case, min_slope):
+    filled = fill_sinks_asc(DATA / case / "dem.asc", tmp_path / "filled.asc", min_slope=float(min_slope))
+    out = flow_direction_asc(filled, tmp_path / "direction.asc")
+    _assert_same_raster(out, DATA / case / f"direction_minslope_{min_slope}.asc")
+
+    direction, _ = read_raster(out)
+    dem, nodata = read_raster(filled)
+    assert not dead_ends(direction, valid_mask(dem, nodata)).any()
+
+
+def test_nodata_edge_is_outlet():
+    dem, nodata = read_raster(DATA / "pit_nodata" / "dem.asc")
+    for min_slope in (0.0, 0.1):
+        filled = fill_sinks(dem, 10.0, min_slope=min_slope, nodata=nodata)
+        # NoData はそのまま、NoData に接する窪地は埋めない
+        assert filled[5, 5] == nodata
+        assert filled[4, 4] == 6.0
+        assert filled[2, 2] >= 11.0
+
+
+def test_min_slope_removes_flats():
+    dem, nodata = read_raster(DATA / "corridor" / "dem.asc")
+    flat = fill_sinks(dem, 10.0, min_slope=0.0, nodata=nodata)
+    sloped = fill_sinks(dem, 10.0, min_slope=0.1, nodata=nodata)
+    assert np.all(np.diff(flat[2, :6]) == 0)
+    assert np.all(np.diff(sloped[2, :6]) > 0)
+    # 勾配は dx / dy それぞれのセル間距離で付ける
+    tall = fill_sinks(dem.T, 20.0, 10.0, min_slope=0.1, nodata=nodata)
+    np.testing.assert_allclose(tall[:6, 2], sloped[2, :6], atol=1e-6)
+
+
+SAGA_REFERENCES = [
+    pytest.param(case, min_slope, kind, id=f"{case}-{kind}-{min_slope}")
+    for case in CASES for min_slope in MIN_SLOPES for kind in ("filled", "direction")
+]
+
+
+@pytest.mark.parametrize("case, min_slope, kind", SAGA_REFERENCES)
+def test_saga_reference(tmp_path, case, min_slope, kind):
+    reference = DATA / case / "saga" / f"{kind}_minslope_{min_slope}.asc"
+    if not reference.exists():
+        pytest.skip(f"SAGA の出力がありません（tools/make_saga_references.py で作成）: {reference.name}")
+    filled = fill_sinks_asc(DATA / case / "dem.asc", tmp_path / "filled.asc", min_slope=float(min_slope))
+    if kind == "filled":
+        _assert_same_raster(filled, reference, atol=1e-5)
+        return
+    if min_slope == "0":
+        pytest.skip("MINSLOPE = 0 の平坦部の流向は SAGA と異なる（flow_direction のモジュール説明を参照）")
+    out = flow_direction_asc(filled, tmp_path / "direction.asc")
+    ours, _ = read_raster(out)
+    ref, ref_nodata = read_raster(reference)
+    if ref_nodata is not None:
+        ref = np.where(ref == ref_nodata, NO_DIRECTION, ref)
+    np.testing.assert_array_equal(ours, ref)
@@ -0,0 +1,95 @@
+"""
+QGIS worker のプロトコルのテスト（QGIS を使わない --stub モードで起動する）
+"""
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from src.pyqg.qgis_worker import QgisWorker, init_shared_worker, shared_worker
+
+
+def results(worker, alg_id, params):
+    response = json.loads(worker.run(alg_id, params))
+    assert response["algorithm_id"] == alg_id
+    return response["results"]
+
+
+@pytest.fixture
+def worker():
+    w = QgisWorker.start(sys.executable, stub=True)
+    yield w
+    w.close()
+
+
+def test_run_returns_results(worker):
+    params = {"INPUT": "dem.asc", "MINSLOPE": 0.1, "THRESHOLD": 5}
+    assert results(worker, "sagang:fillsinksxxlwangliu", params) == params
+    # 同じ worker で続けて実行できる
+    assert results(worker, "gdal:translate", {"INPUT": "filled.sdat"}) == {"INPUT": "filled.sdat"}
+    assert worker.alive
+
+
+def test_non_ascii_paths():
+    # Windows の QGIS の Python と同じく、標準入出力の既定のエンコーディングが cp932 の場合
+    env = dict(os.environ, PYTHONIOENCODING="cp932")
+    params = {"ELEV": r"C:\データ\計算領域\domain_mesh_elev.asc", "NAME": "流域界 ①"}
+    with QgisWorker.start(sys.executable, stub=True, env=env) as w:
+        assert results(w, "sagang:fillsinksxxlwangliu", params) == params
+
+
+def test_error_reply(worker):
+    with pytest.raises(RuntimeError, match="壊れた DEM"):
+        worker.run("stub:error", {"message": "壊れた DEM"})
+    # 失敗した依頼の後も worker は動き続ける
+    assert worker.alive
+    assert results(worker, "gdal:translate", {"INPUT": "a"}) == {"INPUT": "a"}
+
+
+def test_malformed_request(worker):
+    worker._proc.stdin.write("{not json\n")
+    worker._proc.stdin.flush()
+    reply = worker._receive()
+    assert reply["id"] is None
+    assert reply["ok"] is False
+    assert reply["error_type"] == "JSONDecodeError"
+    assert results(worker, "gdal:translate", {"INPUT": "a"}) == {"INPUT": "a"}
+
+
+def test_close():
+    w = QgisWorker.start(sys.executable, stub=True)
+    proc = w._proc
+    assert w.alive
+    w.close()
+    assert not w.alive
+    assert proc.returncode == 0
+    with pytest.raises(RuntimeError):
+        w.run("gdal:translate", {"INPUT": "a"})
+    # 2回閉じても良い
+    w.close()
+
+
+def test_context_manager():
+    with QgisWorker.start(sys.executable, stub=True) as w:
+        assert results(w, "gdal:translate", {}) == {}
+    assert not w.alive
+
+
+def _pool_job(i):
+    w = shared_worker()
+    return w._proc.pid, results(w, "gdal:translate", {"INPUT": i})
+
+
+def test_shared_worker_in_pool():
+    # プールの各プロセスで worker を1つだけ起動し、ジョブの間で使い回す
+    with ProcessPoolExecutor(max_workers=1, initializer=init_shared_worker,
+                             initargs=(sys.executable, True)) as executor:
+        replies = list(executor.map(_pool_job, range(4)))
+    assert [r for _, r in replies] == [{"INPUT": i} for i in range(4)]
+    assert len({pid for pid, _ in replies}) == 1
+
+
+def test_shared_worker_not_configured():
+    assert shared_worker() is None
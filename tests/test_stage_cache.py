@@ -0,0 +1,69 @@
+"""
+段階キャッシュ（src/common/stage_cache.py）の保存形式と削除のテスト
+"""
+import os
+
+import numpy as np
+import pytest
+
+from src.common.stage_cache import StageCache
+
+gpd = pytest.importorskip("geopandas")
+shapely_geometry = pytest.importorskip("shapely.geometry")
+
+
+def _frame():
+    box, MultiPolygon = shapely_geometry.box, shapely_geometry.MultiPolygon
+    return gpd.GeoDataFrame(
+        {"value": [1.5, 2.0], "name": ["a", "b"],
+         "geometry": [box(0, 0, 1, 1), MultiPolygon([box(2, 2, 3, 3), box(4, 4, 5, 5)])]},
+        crs="EPSG:6677",
+    )
+
+
+def test_frame_and_arrays_are_stored_without_pickle(tmp_path):
+    frame = _frame()
+    arrays = {"elevation": np.array([1.0, np.nan]), "pnt_count": np.array([3, 0])}
+    for _ in range(2):
+        cache = StageCache(tmp_path)
+        got_frame = cache.run("extraction", lambda: frame, params={"p": 1})
+        got_arrays = cache.run("elevation", lambda: arrays, params={"p": 1})
+    assert cache.hits == ["extraction", "elevation"]
+    assert got_frame.equals(frame) and got_frame.crs == frame.crs
+    assert list(got_frame.geom_type) == ["Polygon", "MultiPolygon"]
+    for name, values in arrays.items():
+        np.testing.assert_array_equal(got_arrays[name], values)
+    files = {
+        stage: sorted(os.listdir(cache.entry_dir(stage, key)))
+        for stage, key in cache.keys.items()
+    }
+    assert files == {"extraction": ["frame.json", "frame.npz"], "elevation": ["arrays.npz"]}
+
+
+def test_prune_by_size_keeps_entries_of_this_run(tmp_path):
+    values = {"v": np.zeros(1000)}
+    cache = StageCache(tmp_path, max_bytes=None)
+    cache.run("a", lambda: values, params={"p": 1})
+    cache.run("b", lambda: values, params={"p": 1})
+    old = dict(cache.keys)
+
+    cache = StageCache(tmp_path, max_bytes=1)
+    cache.run("a", lambda: values, params={"p": 2})
+    stages = cache._manifest["stages"]
+    assert list(stages["a"]) == [cache.keys["a"]]
+    assert stages["b"] == {}
+    assert not os.path.isdir(cache.entry_dir("b", old["b"]))
+
+
+def test_prune_by_age_and_orphans(tmp_path):
+    cache = StageCache(tmp_path)
+    cache.run("a", lambda: {"v": np.zeros(3)}, params={"p": 1})
+    key = cache.keys["a"]
+    orphan = tmp_path / "a" / ("0" * 40)
+    orphan.mkdir()
+
+    cache = StageCache(tmp_path, max_age_days=30)
+    cache._manifest["stages"]["a"][key]["last_used"] = "2000-01-01T00:00:00"
+    assert cache.prune() == 2
+    assert cache._manifest["stages"]["a"] == {}
+    assert not orphan.exists()
@@ -0,0 +1,52 @@
+# tools/make_saga_references.py
+"""
+tests/data/<ケース>/dem.asc を SAGA（qgis_process）で処理し、テストで比較する参照ラスタを作成する
+
+QGIS のある環境で実行し、作成した tests/data/<ケース>/saga/ をリポジトリに追加する:
+    filled_minslope_<S>.asc      sagang:fillsinksxxlwangliu の出力
+    direction_minslope_<S>.asc   sagang:channelnetworkanddrainagebasins の DIRECTION
+
+使い方:
+    python tools/make_saga_references.py [--qgis-process-path qgis_process-qgis-ltr.bat]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# --- プロジェクトルートを sys.path に追加 ---
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from src.pyqg.processor import process_dem  # noqa: E402
+
+DATA = ROOT / "tests" / "data"
+MIN_SLOPES = ("0", "0.1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テスト用の SAGA の参照ラスタを作成する")
+    parser.add_argument("--qgis-process-path", help="qgis_processの実行ファイルパス")
+    parser.add_argument("--qgis-version", help="QGIS-LTRのバージョン")
+    args = parser.parse_args()
+
+    for dem in sorted(DATA.glob("*/dem.asc")):
+        out_dir = dem.parent / "saga"
+        out_dir.mkdir(exist_ok=True)
+        for min_slope in MIN_SLOPES:
+            with tempfile.TemporaryDirectory() as tmp:
+                result = process_dem(
+                    dem, tmp, float(min_slope),
+                    qgis_process_path=args.qgis_process_path, qgis_version=args.qgis_version
+                )
+                if not result.get('success'):
+                    raise SystemExit(f"[ERROR] {dem.parent.name} (MINSLOPE {min_slope}): {result.get('error')}")
+                for kind in ("filled", "direction"):
+                    dst = out_dir / f"{kind}_minslope_{min_slope}.asc"
+                    shutil.copyfile(os.path.join(tmp, f"{kind}.asc"), dst)
+                    print(f"[INFO] {dst.relative_to(ROOT)}")
+
+
+if __name__ == "__main__":
+    main()